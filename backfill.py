@@ -0,0 +1,238 @@
+import logging
+import argparse
+import time
+import ccxt
+from price_database import connect_database
+from candles import update_candles
+from config_cache import ConfigCache
+from log_setup import setup_logging
+from exchange_router import connect_exchange
+
+
+#page sizes of Coinbase Exchange's history endpoints
+page_sizes = {
+    'ohlcv': 300,
+    'trades': 1000,
+}
+
+def create_progress_table(c):
+    #one row per backfill, so an interrupted run carries on from the last committed batch
+    c.execute('''CREATE TABLE IF NOT EXISTS backfill_progress (
+        currency_pair text,
+        source text,
+        timeframe text,
+        start integer,
+        end integer,
+        next_since integer,
+        rows integer,
+        updated integer,
+        PRIMARY KEY (currency_pair, source, timeframe, start)
+        )''')
+
+
+def candle_rows(currency_pair, candles, period, since, end, now):
+    '''
+    Converts ccxt candles into price_data rows, one per candle at its close time with the close as ask, bid and market price.
+    Candles that start before since, close at or after end, or are still open at now are left out.
+
+    Returns:
+        list of (ts, currency_pair, ask_price, bid_price, market_price) rows in time order
+    '''
+    rows = []
+    for candle in candles:
+        ts = candle[0]//1000 + period
+        if candle[0] >= since and ts < end and ts <= now:
+            rows.append((ts, currency_pair, candle[4], candle[4], candle[4]))
+    return rows
+
+
+def trade_rows(currency_pair, trades, period, end, pending):
+    '''
+    Samples ccxt trades into price_data rows, one per period at the bucket's close time with the last traded price.
+    The bucket of the last trade may still receive trades from the next page, so it is kept in pending ([bucket start, price]).
+
+    Returns:
+        (rows, pending)
+    '''
+    rows = []
+    for trade in trades:
+        bucket = trade['timestamp']//1000//period*period
+        if pending is not None and bucket != pending[0]:
+            rows.append((pending[0] + period, currency_pair, pending[1], pending[1], pending[1]))
+            pending = None
+        if bucket + period >= end:
+            break
+        pending = [bucket, trade['price']]
+    return rows, pending
+
+
+class Backfill:
+    '''
+    Loads the history of a currency pair into price_data from an exchange's paginated candles (fetch_ohlcv) or trades (fetch_trades),
+    so a new pair or a fresh database does not wait days for the traders' moving averages to fill. Rows are written with executemany
+    in large transactions together with their candles and the progress of the run, so an interrupted backfill resumes from its last
+    committed batch. Rows whose timestamp is already stored for the pair are skipped. Send requests through a RequestScheduler to
+    stay within the exchange's rate limits.
+
+    Parameters:
+        exchange: ccxt-compatible exchange, e.g. a RequestScheduler around a ccxt client or a SimulatedExchange for testing
+        currency_pair (str): the currency pair to load, e.g. "BTC/USD"
+        start (int): epoch time to load from, ignored when an unfinished backfill of the pair is resumed
+        end (int, optional): epoch time to load up to (exclusive). Defaults to the pair's first stored row, or now if it has none.
+        timeframe (str, optional): spacing of the loaded rows, a ccxt timeframe such as "1m" or "5m". Defaults to "1m".
+        source (str, optional): "ohlcv" to load candle closes, "trades" to sample trades. Defaults to "ohlcv".
+        db_file (str, optional): path to the sqlite price database. Defaults to "pricedata.db".
+        page_size (int, optional): candles or trades requested per call. Defaults to the exchange's page size in page_sizes.
+        batch_size (int, optional): rows written per transaction. Defaults to 50000.
+        resolutions (list, optional): candle lengths to maintain, in minutes. Defaults to [1, 5, 60, 1440].
+        clock (optional): object providing time(). Defaults to the time module.
+    '''
+
+    def __init__(self, exchange, currency_pair, start, end = None, timeframe = "1m", source = "ohlcv", db_file = "pricedata.db", page_size = None, batch_size = 50000, resolutions = [1, 5, 60, 1440], clock = time):
+        if source not in page_sizes:
+            raise ValueError("source must be ohlcv or trades.")
+        self.exchange = exchange
+        self.currency_pair = currency_pair
+        self.timeframe = timeframe
+        self.source = source
+        self.period = ccxt.Exchange.parse_timeframe(timeframe)
+        self.start = int(start)//self.period*self.period #whole periods, so candle pages line up with since
+        self.page_size = page_size if page_size is not None else page_sizes[source]
+        self.batch_size = batch_size
+        self.resolutions = resolutions
+        self.clock = clock
+        self.conn = connect_database(db_file)
+        self.c = self.conn.cursor()
+        create_progress_table(self.c)
+        self.conn.commit()
+
+        #an unfinished backfill of the same pair, source and timeframe is resumed whatever start was asked for
+        progress = self.c.execute(
+            "SELECT start, end, next_since, rows FROM backfill_progress WHERE currency_pair = ? AND source = ? AND timeframe = ? AND next_since < end*1000 ORDER BY updated DESC",
+            (currency_pair, source, timeframe)).fetchone()
+        if progress is not None:
+            self.start, self.end, self.since, self.rows = progress
+            print("Resuming backfill of", currency_pair, "from", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.since/1000)), "UTC,", self.rows, "rows loaded so far")
+            logging.info("Resuming backfill of " + currency_pair + " from " + str(self.since) + ", " + str(self.rows) + " rows loaded so far")
+        else:
+            if end is None:
+                #stop where the scraper's rows begin, so backfilled and scraped rows do not interleave
+                first = self.c.execute("SELECT MIN(ts) FROM price_data WHERE currency_pair = ?", (currency_pair,)).fetchone()[0]
+                end = first if first is not None else clock.time()
+            self.end = int(end)
+            self.since = self.start*1000
+            self.rows = 0
+            with self.conn:
+                self.c.execute("INSERT OR REPLACE INTO backfill_progress VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (currency_pair, source, timeframe, self.start, self.end, self.since, 0, int(time.time())))
+        self.buffer = []
+        self.pending = None #open bucket of trades, see trade_rows()
+
+    def fetch_page(self):
+        #requests the next page and moves since past it
+        now = self.clock.time()
+        if self.source == "ohlcv":
+            candles = self.exchange.fetch_ohlcv(self.currency_pair, self.timeframe, self.since, self.page_size)
+            self.buffer.extend(candle_rows(self.currency_pair, candles, self.period, self.since, self.end, now))
+            if len(candles) == 0:
+                #no candles in this stretch (e.g. before the pair was listed), skip ahead a page
+                self.since = self.since + self.page_size*self.period*1000
+            elif candles[-1][0] < self.since:
+                raise ccxt.ExchangeError("fetch_ohlcv returned candles before since=" + str(self.since) + ", the exchange does not paginate by time")
+            else:
+                self.since = candles[-1][0] + self.period*1000
+        else:
+            trades = [x for x in self.exchange.fetch_trades(self.currency_pair, self.since, self.page_size) if x['timestamp'] >= self.since]
+            rows, self.pending = trade_rows(self.currency_pair, trades, self.period, self.end, self.pending)
+            self.buffer.extend(rows)
+            if len(trades) == 0 or trades[-1]['timestamp']//1000//self.period*self.period + self.period >= self.end:
+                #caught up, the last bucket is kept if it has closed
+                if self.pending is not None and self.pending[0] + self.period <= now:
+                    self.buffer.append((self.pending[0] + self.period, self.currency_pair, self.pending[1], self.pending[1], self.pending[1]))
+                    self.pending = None
+                self.since = self.end*1000
+            else:
+                self.since = trades[-1]['timestamp'] + 1
+
+    def write(self):
+        '''
+        Writes the buffered rows that are not stored yet, their candles and the progress in one transaction.
+        '''
+        rows = self.buffer
+        next_since = self.pending[0]*1000 if self.pending is not None else self.since #an open bucket of trades is fetched again on resume
+        with self.conn:
+            if len(rows) > 0:
+                stored = set(x[0] for x in self.c.execute(
+                    "SELECT ts FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts <= ?", (self.currency_pair, rows[0][0], rows[-1][0])))
+                rows = [x for x in rows if x[0] not in stored]
+                self.c.executemany("INSERT INTO price_data VALUES (?, ?, ?, ?, ?)", rows)
+                update_candles(self.c, rows, self.resolutions)
+            self.rows = self.rows + len(rows)
+            self.c.execute("UPDATE backfill_progress SET next_since = ?, rows = ?, updated = ? WHERE currency_pair = ? AND source = ? AND timeframe = ? AND start = ?",
+                (next_since, self.rows, int(time.time()), self.currency_pair, self.source, self.timeframe, self.start))
+        if len(self.buffer) > 0:
+            print("Loaded", self.rows, "rows, up to", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.buffer[-1][0])), "UTC")
+            logging.debug("Loaded " + str(len(rows)) + " rows up to " + str(self.buffer[-1][0]) + " (" + str(len(self.buffer) - len(rows)) + " already stored)")
+        self.buffer = []
+
+    def repair_candles(self):
+        #the stored candles of the bucket where the backfill meets the scraper's rows were opened by the later rows, rebuild them in order
+        first = self.c.execute("SELECT MIN(ts) FROM price_data WHERE currency_pair = ? AND ts >= ?", (self.currency_pair, self.end)).fetchone()[0]
+        if first is None:
+            return
+        with self.conn:
+            for resolution in self.resolutions:
+                bucket = int(first)//(resolution*60)*resolution*60
+                self.c.execute("DELETE FROM candles WHERE currency_pair = ? AND resolution = ? AND ts = ?", (self.currency_pair, resolution, bucket))
+                rows = self.c.execute(
+                    "SELECT ts, currency_pair, ask_price, bid_price, market_price FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts < ? ORDER BY ts, rowid",
+                    (self.currency_pair, bucket, bucket + resolution*60)).fetchall()
+                update_candles(self.c, rows, [resolution])
+
+    def run(self):
+        '''
+        Pages through the history up to end. Buffered rows are written before an error is raised, so a rerun loses nothing.
+
+        Returns:
+            total number of rows loaded by this backfill, including earlier interrupted runs
+        '''
+        started = time.perf_counter()
+        print("Backfilling", self.currency_pair, "from", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.since/1000)), "to", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.end)), "UTC")
+        logging.info("Backfilling " + self.currency_pair + " " + self.source + " " + self.timeframe + " from " + str(self.since) + " to " + str(self.end))
+        try:
+            while self.since < self.end*1000:
+                self.fetch_page()
+                if len(self.buffer) >= self.batch_size:
+                    self.write()
+        finally:
+            self.write()
+        self.repair_candles()
+        print("Backfill complete:", self.rows, "rows in", round(time.perf_counter() - started, 1), "seconds")
+        logging.info("Backfill of " + self.currency_pair + " complete: " + str(self.rows) + " rows")
+        return self.rows
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    #python3 backfill.py BTC/USD --days 30
+    #python3 backfill.py ETH/USD --days 365 --timeframe 1m
+    config = ConfigCache("config.txt")
+    setup_logging("backfill", config)
+    parser = argparse.ArgumentParser(description="Load historical prices into price_data so the traders can start without a warm-up")
+    parser.add_argument("currency_pairs", nargs="+")
+    parser.add_argument("--days", type=float, default=7, help="how far back to load, ignored when resuming")
+    parser.add_argument("--timeframe", help="spacing of the loaded rows, defaults to scraper_frequency (e.g. 5m)")
+    parser.add_argument("--source", choices=list(page_sizes.keys()), default="ohlcv")
+    parser.add_argument("--db", default="pricedata.db")
+    parser.add_argument("--exchange", default="coinbasepro", help="ccxt id of the exchange to load from")
+    arguments = parser.parse_args()
+
+    timeframe = arguments.timeframe or str(int(config.get("Scraper Section", "scraper_frequency"))) + "m"
+    exchange = connect_exchange(arguments.exchange, credentials = False) #public endpoints, no API keys needed
+    for currency_pair in arguments.currency_pairs:
+        backfill = Backfill(exchange, currency_pair, time.time() - arguments.days*86400, timeframe = timeframe, source = arguments.source,
+            db_file = arguments.db, resolutions = config.get("Scraper Section", "candle_resolutions"))
+        backfill.run()
+        backfill.close()
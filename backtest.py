@@ -0,0 +1,342 @@
+import sqlite3
+import math
+import sys
+import numpy as np
+from retention import read_archive
+import indicators
+
+
+def load_price_history(currency_pair = "BTC/USD", db_file = "pricedata.db", start = None, end = None, archive_dir = "archive"):
+    '''
+    Loads the price history of a currency pair from the price_data table, and from the segments archived by retention.py, into numpy arrays.
+
+    Parameters:
+        currency_pair (str, optional): the currency pair to load. Defaults to "BTC/USD".
+        db_file (str, optional): path to the sqlite database. Defaults to "pricedata.db".
+        start (int, optional): first epoch timestamp to load (inclusive). Defaults to the start of the history.
+        end (int, optional): last epoch timestamp to load (exclusive). Defaults to the end of the history.
+        archive_dir (str, optional): directory of archived segments, None to only read the database. Defaults to "archive".
+    Returns:
+        dict with "ts", "ask", "bid" and "market" arrays, ordered by timestamp
+    '''
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute(
+        "SELECT ts, ask_price, bid_price, market_price FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts < ? ORDER BY ts",
+        (currency_pair, start if start is not None else 0, end if end is not None else 2**62)).fetchall()
+    conn.close()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    prices = {"ts": data[:, 0], "ask": data[:, 1], "bid": data[:, 2], "market": data[:, 3]}
+
+    if archive_dir is not None:
+        archived = read_archive(archive_dir, currency_pair, start, end)
+        if len(archived["ts"]) > 0:
+            prices = {x: np.concatenate((archived[x], prices[x])) for x in prices}
+            order = np.argsort(prices["ts"], kind="stable")
+            prices = {x: prices[x][order] for x in prices}
+    return prices
+
+
+def rolling_mean(ts, values, rolling_window):
+    '''
+    Computes the mean of values over a trailing time window for every row, the same window live_trader uses (ts >= now - rolling_window).
+
+    Parameters:
+        ts (np.ndarray): epoch timestamps in seconds, sorted ascending
+        values (np.ndarray): values to average
+        rolling_window (int): the length of the window, in minutes
+    Returns:
+        (mean, count) arrays, count is the number of rows inside each window
+    '''
+    return indicators.sma(ts, values, rolling_window)
+
+
+def cached_rolling_mean(prices, rolling_window, cache = None, cache_size = 16):
+    '''
+    rolling_mean() over prices["market"], reusing earlier results from cache (a dict) when several backtests share a window.
+    '''
+    if cache is None:
+        return rolling_mean(prices["ts"], prices["market"], rolling_window)
+    if rolling_window not in cache:
+        if len(cache) >= cache_size:
+            del cache[next(iter(cache))] #drop the oldest entry
+        cache[rolling_window] = rolling_mean(prices["ts"], prices["market"], rolling_window)
+    return cache[rolling_window]
+
+
+def sufficient_data_mask(count, rolling_window, scraper_frequency):
+    '''
+    Mirrors live_trader's data checks: enough rows collected, and more than 65% of the expected points inside the window.
+    live_trader works the check out again every cycle and does not trade (buy or sell) in cycles where it fails, e.g. while the
+    window is thin after a gap in the data.
+
+    Returns:
+        boolean array, True for the rows live_trader would trade on
+    '''
+    rows_seen = np.arange(1, len(count) + 1)
+    return (rows_seen >= rolling_window/scraper_frequency - 1) & (count > rolling_window/scraper_frequency*0.65)
+
+
+def first_index(condition, start, n, chunk = 4096):
+    '''
+    Finds the first row i >= start where condition(lo, hi)[i - lo] is True, scanning in growing chunks so an early hit stays cheap.
+
+    Returns:
+        the row index, or -1 if the condition never holds
+    '''
+    lo = start
+    while lo < n:
+        hi = min(n, lo + chunk)
+        hits = np.flatnonzero(condition(lo, hi))
+        if len(hits) > 0:
+            return lo + hits[0]
+        lo = hi
+        chunk = chunk*2
+    return -1
+
+
+def next_index(candidates, start):
+    #first candidate row >= start
+    position = np.searchsorted(candidates, start, side="left")
+    if position < len(candidates):
+        return candidates[position]
+    return -1
+
+
+def buy_quantity(fiat, buy_size, best_ask):
+    #same sizing and 0.5% haircut as live_trader
+    buy_volume = math.trunc(((fiat*buy_size)/best_ask)*10000)/10000
+    return round(buy_volume*(1-0.005), 8)
+
+
+def sell_quantity(position_size):
+    return round(position_size*(1-0.005), 8)
+
+
+def summarize(prices, trades, fills, starting_capital):
+    '''
+    Builds the equity curve and summary statistics from a list of fills.
+
+    Parameters:
+        prices (dict): price arrays from load_price_history()
+        trades (list): completed round trips
+        fills (list): (row, fiat change, position change) tuples
+        starting_capital (float): fiat balance at the start
+    Returns:
+        dict with "trades", "equity" and "stats"
+    '''
+    n = len(prices["ts"])
+    fiat_change = np.zeros(n)
+    position_change = np.zeros(n)
+    for row, fiat_delta, position_delta in fills:
+        fiat_change[row] = fiat_change[row] + fiat_delta
+        position_change[row] = position_change[row] + position_delta
+    equity = starting_capital + np.cumsum(fiat_change) + np.cumsum(position_change)*prices["market"]
+
+    gains = len([x for x in trades if x["type"] == "WIN"])
+    losses = len([x for x in trades if x["type"] == "LOSS"])
+    if n > 0:
+        drawdown = 1 - equity/np.maximum.accumulate(equity)
+        final_equity = float(equity[-1])
+        max_drawdown = float(np.max(drawdown))
+    else:
+        final_equity = float(starting_capital)
+        max_drawdown = 0.0
+    stats = {
+        "trades": len(trades),
+        "gains": gains,
+        "losses": losses,
+        "hit_rate": gains/(gains + losses) if gains + losses > 0 else None,
+        "final_equity": final_equity,
+        "total_return": final_equity/starting_capital - 1,
+        "max_drawdown": max_drawdown,
+    }
+    return {"trades": trades, "equity": equity, "stats": stats}
+
+
+def backtest_mean_reversion(
+        prices,
+        rolling_window,
+        buy_threshold,
+        sell_threshold,
+        stop_loss,
+        buy_size,
+        scraper_frequency = 5,
+        starting_capital = 10000,
+        cache = None,
+        mode = "mean",
+        band_width = 2
+):
+    '''
+    Replays mean_reversion_trader.live_trader over recorded prices, treating every row as one trading cycle and assuming limit orders
+    fill on the row they are placed.
+
+    Parameters:
+        prices (dict): price arrays from load_price_history()
+        rolling_window (int): the length of the moving average window, in minutes
+        buy_threshold (float): buy when best_ask <= moving average*buy_threshold
+        sell_threshold (float): take profit when best_bid >= purchase price*sell_threshold
+        stop_loss (float): stop out when best_bid <= purchase price*stop_loss
+        buy_size (float): the amount of available capital to use per trade, a value between 0 and 1
+        scraper_frequency (int, optional): how often the scraper collected data, in minutes. Defaults to 5.
+        starting_capital (float, optional): fiat balance at the start. Defaults to 10000.
+        cache (dict, optional): moving averages shared between backtests on the same prices. Defaults to None.
+        mode (str, optional): "mean" or "bollinger" entries, see MeanReversionStrategy. Defaults to "mean".
+        band_width (float, optional): distance of the lower Bollinger band from the average, in standard deviations. Defaults to 2.
+    Returns:
+        dict with "trades", "equity" and "stats"
+    '''
+    ts, ask, bid = prices["ts"], prices["ask"], prices["bid"]
+    n = len(ts)
+    average, count = cached_rolling_mean(prices, rolling_window, cache)
+    valid = sufficient_data_mask(count, rolling_window, scraper_frequency)
+    if mode == "bollinger":
+        std = indicators.rolling_std(ts, prices["market"], rolling_window)
+        buy_candidates = np.flatnonzero(valid & (std > 0) & (ask <= average - band_width*std))
+    else:
+        buy_candidates = np.flatnonzero(valid & (ask <= average*buy_threshold))
+
+    trades = []
+    fills = []
+    fiat = float(starting_capital)
+    position_size = 0.0
+    row = 0
+    while row < n:
+        if position_size < 0.002:
+            row = next_index(buy_candidates, row)
+            if row == -1:
+                break
+            volume = buy_quantity(fiat, buy_size, ask[row])
+            if volume <= 0:
+                break
+            purchase_price = ask[row]
+            target_sell = purchase_price*sell_threshold
+            fiat = fiat - volume*purchase_price
+            position_size = position_size + volume
+            fills.append((row, -volume*purchase_price, volume))
+            entry = {"entry_index": int(row), "entry_ts": float(ts[row]), "entry_price": float(purchase_price), "volume": volume}
+        elif position_size > 0.002:
+            row = first_index(lambda lo, hi: valid[lo:hi] & ((bid[lo:hi] >= target_sell) | (bid[lo:hi] <= purchase_price*stop_loss)), row, n)
+            if row == -1:
+                break
+            volume = sell_quantity(position_size)
+            fiat = fiat + volume*bid[row]
+            position_size = position_size - volume
+            fills.append((row, volume*bid[row], -volume))
+            entry["exit_index"] = int(row)
+            entry["exit_ts"] = float(ts[row])
+            entry["exit_price"] = float(bid[row])
+            entry["type"] = "WIN" if bid[row] >= target_sell else "LOSS"
+            entry["return"] = float(bid[row]/purchase_price - 1)
+            trades.append(entry)
+        else:
+            #exactly 0.002 matches neither branch in live_trader, so it never trades again
+            break
+        row = row + 1 #orders are checked for fills on the next cycle
+
+    return summarize(prices, trades, fills, starting_capital)
+
+
+def backtest_sma_crossover(
+        prices,
+        rolling_window_1,
+        rolling_window_2,
+        buy_size,
+        scraper_frequency = 5,
+        starting_capital = 10000,
+        cache = None,
+        mode = "sma"
+):
+    '''
+    Replays sma_crossover_trader.live_trader over recorded prices, treating every row as one trading cycle and assuming limit orders
+    fill on the row they are placed.
+
+    Parameters:
+        prices (dict): price arrays from load_price_history()
+        rolling_window_1 (int): how long the long moving average should be (in minutes)
+        rolling_window_2 (int): how long the short moving average should be (in minutes)
+        buy_size (float): how much available capital to use per trade (between 0 and 1)
+        scraper_frequency (int, optional): how often the scraper collected data, in minutes. Defaults to 5.
+        starting_capital (float, optional): fiat balance at the start. Defaults to 10000.
+        cache (dict, optional): moving averages shared between backtests on the same prices. Defaults to None.
+        mode (str, optional): "sma" or "ema" averages, see SMACrossoverStrategy. Defaults to "sma".
+    Returns:
+        dict with "trades", "equity" and "stats"
+    '''
+    ts, ask, bid = prices["ts"], prices["ask"], prices["bid"]
+    n = len(ts)
+    average_1, count_1 = cached_rolling_mean(prices, rolling_window_1, cache)
+    valid = sufficient_data_mask(count_1, rolling_window_1, scraper_frequency)
+    if mode == "ema":
+        #the EMAs run over the whole history, the long window's row count still gates trading like in the live trader
+        average_1 = indicators.ema(ts, prices["market"], rolling_window_1)
+        average_2 = indicators.ema(ts, prices["market"], rolling_window_2)
+    else:
+        average_2, count_2 = cached_rolling_mean(prices, rolling_window_2, cache)
+        valid = valid & (count_2 > 0)
+
+    #1 when MA1 is higher, -1 when MA2 is higher, 0 when equal ("None"), same as current_average_higher. live_trader only updates
+    #last_average_higher in the cycles it trades, so a crossover is the change from the previous valid row
+    valid_rows = np.flatnonzero(valid)
+    average_higher = np.sign(average_1[valid_rows] - average_2[valid_rows])
+    last_average_higher = np.concatenate(([0], average_higher[:-1]))
+    buy_candidates = valid_rows[(average_higher == 1) & (last_average_higher == -1)]
+    sell_candidates = valid_rows[(average_higher == -1) & (last_average_higher == 1)]
+
+    trades = []
+    fills = []
+    fiat = float(starting_capital)
+    position_size = 0.0
+    row = 0
+    while row < n:
+        if position_size < 0.002:
+            row = next_index(buy_candidates, row)
+            if row == -1:
+                break
+            volume = buy_quantity(fiat, buy_size, ask[row])
+            if volume <= 0:
+                break
+            purchase_price = ask[row]
+            fiat = fiat - volume*purchase_price
+            position_size = position_size + volume
+            fills.append((row, -volume*purchase_price, volume))
+            entry = {"entry_index": int(row), "entry_ts": float(ts[row]), "entry_price": float(purchase_price), "volume": volume}
+        elif position_size > 0.002:
+            row = next_index(sell_candidates, row)
+            if row == -1:
+                break
+            volume = sell_quantity(position_size)
+            fiat = fiat + volume*bid[row]
+            position_size = position_size - volume
+            fills.append((row, volume*bid[row], -volume))
+            entry["exit_index"] = int(row)
+            entry["exit_ts"] = float(ts[row])
+            entry["exit_price"] = float(bid[row])
+            entry["type"] = "WIN" if bid[row] > purchase_price else "LOSS"
+            entry["return"] = float(bid[row]/purchase_price - 1)
+            trades.append(entry)
+        else:
+            break
+        row = row + 1
+
+    return summarize(prices, trades, fills, starting_capital)
+
+
+if __name__ == "__main__":
+    #python3 backtest.py mean_reversion BTC 6000 0.97 1.03 0.9 1 [bollinger 2]
+    #python3 backtest.py sma_crossover BTC 480 2490 0.9 [ema]
+    strategy = sys.argv[1]
+    prices = load_price_history("{coin}/USD".format(coin = sys.argv[2]))
+    if strategy == "mean_reversion":
+        options = {}
+        if len(sys.argv) > 8:
+            options['mode'] = sys.argv[8]
+        if len(sys.argv) > 9:
+            options['band_width'] = float(sys.argv[9])
+        result = backtest_mean_reversion(prices, *[float(x) for x in sys.argv[3:8]], **options)
+    elif strategy == "sma_crossover":
+        options = {'mode': sys.argv[6]} if len(sys.argv) > 6 else {}
+        result = backtest_sma_crossover(prices, *[float(x) for x in sys.argv[3:6]], **options)
+    else:
+        sys.exit("ERROR: strategy must be mean_reversion or sma_crossover")
+    for key, value in result["stats"].items():
+        print(key + ":", value)
@@ -0,0 +1,331 @@
+import os
+import sys
+import sqlite3
+import json
+import time
+import bisect
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+import numpy as np
+from price_database import connect_database
+from price_database import PriceWriter
+from rolling_window import PriceFeed
+from cached_exchange import CachedExchange
+from order_manager import OrderManager
+from simulated_exchange import VirtualClock
+from mean_reversion_trader import MeanReversionStrategy
+from sma_crossover_trader import SMACrossoverStrategy
+
+
+default_pairs = ["BTC/USD", "ETH/USD", "SOL/USD"]
+start_prices = {"BTC/USD": 30000.0, "ETH/USD": 2000.0, "SOL/USD": 25.0}
+end_ts = 1700000000 #every generated database ends at the same time, so runs are comparable
+
+def generate_database(db_file, rows, pairs = default_pairs, interval = 60, seed = 0, chunk_size = 1000000):
+    '''
+    Writes a synthetic price database of about rows rows, split evenly across the pairs: a geometric random walk sampled every
+    interval seconds, with about 1% of samples dropped and outages of a few minutes to a few hours, like a real scraper's history.
+
+    Parameters:
+        db_file (str): path of the database to create
+        rows (int): number of rows to aim for (gaps remove a few percent)
+        pairs (list, optional): currency pairs to generate. Defaults to default_pairs.
+        interval (int, optional): seconds between samples. Defaults to 60.
+        seed (int, optional): random seed. Defaults to 0.
+        chunk_size (int, optional): rows generated and inserted per transaction. Defaults to 1000000.
+    Returns:
+        number of rows written
+    '''
+    conn = connect_database(db_file)
+    rng = np.random.default_rng(seed)
+    samples = rows//len(pairs)
+    start = end_ts - samples*interval
+    written = 0
+    for pair in pairs:
+        #drop single samples and whole outages (mean length 60 samples, about one every 5000 samples)
+        keep = rng.random(samples) > 0.01
+        for gap_start, gap_length in zip(rng.integers(0, samples, samples//5000 + 1), rng.geometric(1/60, samples//5000 + 1)):
+            keep[gap_start:gap_start + gap_length] = False
+        price = start_prices.get(pair, 100.0)
+        for offset in range(0, samples, chunk_size):
+            n = min(chunk_size, samples - offset)
+            market = price*np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+            price = market[-1]
+            spread = market*rng.uniform(0.00005, 0.0003, n)
+            ts = start + (np.arange(offset, offset + n) + 1)*interval
+            mask = keep[offset:offset + n]
+            with conn:
+                conn.executemany("INSERT INTO price_data VALUES (?, ?, ?, ?, ?)", zip(
+                    ts[mask].tolist(), [pair]*int(mask.sum()), (market + spread)[mask].tolist(), (market - spread)[mask].tolist(), market[mask].tolist()))
+            written = written + int(mask.sum())
+    conn.close()
+    return written
+
+
+def benchmark_database(data_dir, rows, interval):
+    #generated databases are kept and reused, the larger ones take minutes to build
+    os.makedirs(data_dir, exist_ok = True)
+    db_file = os.path.join(data_dir, "pricedata_" + str(rows) + ".db")
+    if not os.path.exists(db_file):
+        print("Generating", db_file)
+        generate_database(db_file, rows, interval = interval)
+    return db_file
+
+
+def timings(function, repeats):
+    #runs function repeats times, returns the seconds of each run
+    results = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        function()
+        results.append(time.perf_counter() - started)
+    return results
+
+
+def result(name, rows, seconds, **extra):
+    entry = {
+        'name': name,
+        'rows': rows,
+        'median': statistics.median(seconds),
+        'min': min(seconds),
+        'max': max(seconds),
+        'repeats': len(seconds),
+    }
+    entry.update(extra)
+    return entry
+
+
+def benchmark_strategies(thresholds = (0.97, 1.03, 0.9)):
+    #the windows run in production: mean reversion over 6000 minutes, SMA crossover over 2490 and 480 minutes
+    buy_threshold, sell_threshold, stop_loss = thresholds
+    return [
+        ("mean_reversion", lambda: MeanReversionStrategy(6000, buy_threshold, sell_threshold, stop_loss, 1)),
+        ("sma_crossover", lambda: SMACrossoverStrategy(2490, 480, 0.9)),
+    ]
+
+
+def benchmark_window_query(db_file, rows, repeats, scraper_frequency):
+    '''
+    Times what a trader does on start-up and on every cycle before trading: the PriceFeed query that fills the windows, and the
+    data check that computes the moving averages. "cold" builds the windows from scratch, "cycle" ingests one new sample.
+    '''
+    results = []
+    conn = connect_database(db_file)
+    for name, build in benchmark_strategies():
+        def cold():
+            strategy = build()
+            price_feed = PriceFeed(conn.cursor(), strategy.currency_pair, strategy.windows)
+            price_feed.update(end_ts - scraper_frequency*60)
+            strategy.check_data(price_feed.rows_seen, scraper_frequency)
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            results.append(result("window_query/" + name + "/cold", rows, timings(cold, repeats)))
+
+            strategy = build()
+            price_feed = PriceFeed(conn.cursor(), strategy.currency_pair, strategy.windows)
+            price_feed.update(end_ts - repeats*scraper_frequency*60)
+            now = [end_ts - repeats*scraper_frequency*60]
+            def cycle():
+                now[0] = now[0] + scraper_frequency*60
+                price_feed.update(now[0])
+                strategy.check_data(price_feed.rows_seen, scraper_frequency)
+            results.append(result("window_query/" + name + "/cycle", rows, timings(cycle, repeats)))
+    conn.close()
+    return results
+
+
+class BenchmarkExchange:
+    '''
+    Minimal ccxt-style exchange for timing trader cycles: tickers come from the recorded prices at the clock's time, and orders fill
+    on the next fetch_order, so every cycle runs the strategy's full order path without network calls.
+    '''
+
+    def __init__(self, clock, db_file, symbol, since):
+        self.clock = clock
+        self.symbol = symbol
+        self.coin = symbol.split("/")[0]
+        conn = connect_database(db_file)
+        rows = conn.execute("SELECT ts, ask_price, bid_price FROM price_data WHERE currency_pair = ? AND ts >= ? ORDER BY ts", (symbol, since)).fetchall()
+        conn.close()
+        self.times = [x[0] for x in rows]
+        self.prices = [(x[1], x[2]) for x in rows]
+        self.balances = {"USD": 10000.0, self.coin: 0.0}
+        self.orders = {}
+        self.has = {'fetchTickers': False}
+
+    def fetch_ticker(self, symbol):
+        ask, bid = self.prices[max(bisect.bisect_right(self.times, self.clock.time()) - 1, 0)]
+        return {'symbol': symbol, 'ask': ask, 'bid': bid}
+
+    def fetch_balance(self):
+        return {
+            'free': dict(self.balances),
+            'used': {currency: 0.0 for currency in self.balances},
+            'total': dict(self.balances),
+        }
+
+    def create_order(self, side, symbol, amount, price):
+        order_id = str(len(self.orders) + 1)
+        self.orders[order_id] = {'id': order_id, 'symbol': symbol, 'side': side, 'amount': amount, 'price': price, 'status': 'open', 'filled': 0.0}
+        return self.orders[order_id]
+
+    def create_limit_buy_order(self, symbol, amount, price):
+        return self.create_order('buy', symbol, amount, price)
+
+    def create_limit_sell_order(self, symbol, amount, price):
+        return self.create_order('sell', symbol, amount, price)
+
+    def fetch_order(self, order_id, symbol = None):
+        order = self.orders[order_id]
+        if order['status'] == 'open':
+            sign = 1 if order['side'] == 'buy' else -1
+            self.balances["USD"] = self.balances["USD"] - sign*order['amount']*order['price']
+            self.balances[self.coin] = max(self.balances[self.coin] + sign*order['amount'], 0.0)
+            order.update({'status': 'closed', 'filled': order['amount']})
+        return order
+
+    def cancel_order(self, order_id, symbol = None):
+        self.orders[order_id]['status'] = 'canceled'
+        return self.orders[order_id]
+
+
+def benchmark_trader_cycle(db_file, rows, repeats, scraper_frequency):
+    '''
+    Times full trader cycles (price feed, data check and trade with balance, ticker and order calls) against a BenchmarkExchange.
+    A database holding less history than a strategy's window only runs the data check, as a live trader would.
+    '''
+    results = []
+    conn = connect_database(db_file)
+    for name, build in benchmark_strategies((1.05, 1.0001, 0.999)): #buy on every signal check and sell on small moves, so most cycles place or settle an order
+        strategy = build()
+        start = end_ts - repeats*scraper_frequency*60
+        clock = VirtualClock(start)
+        exchange = CachedExchange(BenchmarkExchange(clock, db_file, strategy.currency_pair, start - 3600), ttl = 0, clock = clock)
+        orders = OrderManager(exchange, clock = clock)
+        price_feed = PriceFeed(conn.cursor(), strategy.currency_pair, strategy.windows)
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            price_feed.update(start) #fill the windows up front, the cold query is timed by benchmark_window_query
+            def cycle():
+                clock.sleep(scraper_frequency*60)
+                strategy.step(exchange, orders, price_feed, clock.time(), scraper_frequency, 10000)
+            seconds = timings(cycle, repeats)
+        results.append(result("trader_cycle/" + name, rows, seconds, trades = strategy.buys + strategy.gains + strategy.losses))
+    conn.close()
+    return results
+
+
+def benchmark_scraper_insert(db_file, rows, cycles, pairs = default_pairs, batch_size = 500):
+    '''
+    Times the scraper's writes: cycles of one row per pair queued with a PriceWriter (which also updates the candles) on top of the
+    existing history, reported as seconds per cycle and rows per second. The rows are deleted again afterwards so the database can be reused.
+    '''
+    writer = PriceWriter(db_file, batch_size = batch_size, flush_interval = 3600)
+    prices = [start_prices.get(pair, 100.0) for pair in pairs]
+    started = time.perf_counter()
+    for i in range(cycles):
+        ts = end_ts + (i + 1)*60
+        writer.add([(ts, pair, price*1.0001, price*0.9999, price) for pair, price in zip(pairs, prices)])
+    writer.close()
+    seconds = time.perf_counter() - started
+
+    conn = connect_database(db_file)
+    with conn:
+        conn.execute("DELETE FROM price_data WHERE ts > ?", (end_ts,))
+        conn.execute("DELETE FROM candles WHERE ts > ?", (end_ts - 86400,))
+    conn.close()
+    inserted = cycles*len(pairs)
+    return [result("scraper_insert", rows, [seconds/cycles], cycles = cycles, rows_per_second = inserted/seconds)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "--short", "HEAD"], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, data_dir = "bench_data", repeats = 20, cycles = 2000, scraper_frequency = 1):
+    '''
+    Runs every benchmark against a generated database of each size.
+
+    Parameters:
+        sizes (list): database sizes in rows, e.g. [10000, 1000000]
+        data_dir (str, optional): where the generated databases are kept. Defaults to "bench_data".
+        repeats (int, optional): runs per timed benchmark. Defaults to 20.
+        cycles (int, optional): scraper cycles written by the insert benchmark. Defaults to 2000.
+        scraper_frequency (float, optional): minutes between generated samples. Defaults to 1.
+    Returns:
+        dict with the commit, environment and a list of results (seconds unless stated otherwise)
+    '''
+    results = []
+    for rows in sizes:
+        db_file = benchmark_database(data_dir, rows, int(scraper_frequency*60))
+        print("Benchmarking", db_file)
+        results.extend(benchmark_window_query(db_file, rows, repeats, scraper_frequency))
+        results.extend(benchmark_trader_cycle(db_file, rows, repeats, scraper_frequency))
+        results.extend(benchmark_scraper_insert(db_file, rows, cycles))
+    return {
+        'commit': git_commit(),
+        'time': int(time.time()),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance = 0.2, floor = 0.0001):
+    '''
+    Prints the median time of every benchmark in current against baseline.
+
+    Parameters:
+        baseline (dict): earlier output of run_benchmarks()
+        current (dict): output of run_benchmarks()
+        tolerance (float, optional): slowdown ratio reported as a regression. Defaults to 0.2 (20% slower).
+        floor (float, optional): slowdowns of less than this many seconds are timer noise and not reported. Defaults to 0.0001.
+    Returns:
+        list of the names (with row counts) of the benchmarks that regressed
+    '''
+    before = {(x['name'], x['rows']): x for x in baseline['results']}
+    regressions = []
+    print("Comparing", baseline.get('commit'), "->", current.get('commit'))
+    for entry in current['results']:
+        key = (entry['name'], entry['rows'])
+        if key not in before:
+            continue
+        ratio = entry['median']/before[key]['median'] if before[key]['median'] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance and entry['median'] - before[key]['median'] > floor:
+            flag = "REGRESSION"
+            regressions.append(entry['name'] + " " + str(entry['rows']))
+        print("{name:<40} {rows:>10} {before:>12.6f} {after:>12.6f} {ratio:>7.2f}x {flag}".format(
+            name = entry['name'], rows = entry['rows'], before = before[key]['median'], after = entry['median'], ratio = ratio, flag = flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    #python3 benchmark.py --sizes 10000,100000,1000000 --output bench.json
+    #python3 benchmark.py --sizes 10000,100000,1000000 --compare bench.json
+    parser = argparse.ArgumentParser(description="Benchmarks of the trader and scraper hot paths against synthetic price databases")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated database sizes in rows, up to 50000000")
+    parser.add_argument("--data_dir", default="bench_data")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=2000, help="scraper cycles written by the insert benchmark")
+    parser.add_argument("--output", help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_benchmarks([int(x) for x in args.sizes.split(",")], args.data_dir, args.repeats, args.cycles)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.tolerance)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -0,0 +1,101 @@
+import threading
+import logging
+import time
+from concurrent.futures import Future
+
+
+class CachedExchange:
+    '''
+    Wraps a ccxt exchange so balance and ticker reads are served from a short lived cache. Callers that ask for the same resource
+    while a request for it is already in flight wait for that request instead of sending their own. Placing or cancelling an
+    order clears the cache, so the next read always reflects it. Every other attribute is passed through to the wrapped exchange.
+
+    Parameters:
+        exchange: ccxt-compatible exchange, e.g. ccxt.coinbasepro or a SimulatedExchange
+        ttl (float, optional): seconds a cached response stays valid. Defaults to 5.
+        clock (optional): object providing monotonic(), e.g. a VirtualClock for paper trading. Defaults to the time module.
+    '''
+
+    def __init__(self, exchange, ttl = 5, clock = time):
+        self.exchange = exchange
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.cache = {} #(method, arguments) -> (expiry, response)
+        self.in_flight = {} #(method, arguments) -> Future shared by the waiting callers
+        self.generation = 0 #bumped on every invalidation so responses requested before an order are not cached after it
+        self.requests = 0 #calls that reached the exchange
+        self.hits = 0 #calls served from the cache or an in-flight request
+
+    def __getattr__(self, name):
+        return getattr(self.exchange, name)
+
+    def cached_call(self, method, *arguments):
+        key = (method,) + arguments
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > self.clock.monotonic():
+                self.hits = self.hits + 1
+                return entry[1]
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+                generation = self.generation
+                self.requests = self.requests + 1
+            else:
+                self.hits = self.hits + 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            response = getattr(self.exchange, method)(*arguments)
+        except Exception as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+            if generation == self.generation:
+                self.cache[key] = (self.clock.monotonic() + self.ttl, response)
+        future.set_result(response)
+        return response
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+            self.generation = self.generation + 1
+        logging.debug("Cleared exchange cache")
+
+    def fetch_balance(self):
+        return self.cached_call('fetch_balance')
+
+    def fetch_ticker(self, symbol):
+        return self.cached_call('fetch_ticker', symbol)
+
+    def create_order(self, symbol, side, amount, price):
+        try:
+            return self.exchange.create_order(symbol, side, amount, price)
+        finally:
+            self.invalidate()
+
+    def create_limit_buy_order(self, symbol, amount, price):
+        try:
+            return self.exchange.create_limit_buy_order(symbol, amount, price)
+        finally:
+            self.invalidate()
+
+    def create_limit_sell_order(self, symbol, amount, price):
+        try:
+            return self.exchange.create_limit_sell_order(symbol, amount, price)
+        finally:
+            self.invalidate()
+
+    def cancel_order(self, id, symbol = None):
+        try:
+            return self.exchange.cancel_order(id, symbol)
+        finally:
+            self.invalidate()
@@ -0,0 +1,99 @@
+import sqlite3
+import sys
+
+
+#upsert that merges a partial candle into the stored one, rows must be written in time order for open/close to be right
+upsert_candle = '''INSERT INTO candles (currency_pair, resolution, ts, open, high, low, close, tick_count, price_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (currency_pair, resolution, ts) DO UPDATE SET
+        high = max(high, excluded.high),
+        low = min(low, excluded.low),
+        close = excluded.close,
+        tick_count = tick_count + excluded.tick_count,
+        price_sum = price_sum + excluded.price_sum'''
+
+def create_candle_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS candles (
+        currency_pair text,
+        resolution integer,
+        ts integer,
+        open numeric,
+        high numeric,
+        low numeric,
+        close numeric,
+        tick_count integer,
+        price_sum numeric,
+        PRIMARY KEY (currency_pair, resolution, ts)
+        )''')
+
+
+def aggregate_candles(entries, resolutions):
+    '''
+    Aggregates price_data rows into partial candles of market_price for each resolution.
+
+    Parameters:
+        entries (list): (ts, currency_pair, ask_price, bid_price, market_price) rows in time order
+        resolutions (list): candle lengths, in minutes
+    Returns:
+        list of (currency_pair, resolution, ts, open, high, low, close, tick_count, price_sum) rows, ts is the bucket start
+    '''
+    candles = {}
+    for ts, currency_pair, best_ask, best_bid, market_price in entries:
+        for resolution in resolutions:
+            key = (currency_pair, resolution, int(ts)//(resolution*60)*resolution*60)
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = [market_price, market_price, market_price, market_price, 1, market_price]
+            else:
+                candle[1] = max(candle[1], market_price)
+                candle[2] = min(candle[2], market_price)
+                candle[3] = market_price
+                candle[4] = candle[4] + 1
+                candle[5] = candle[5] + market_price
+    return [key + tuple(candle) for key, candle in candles.items()]
+
+
+def update_candles(c, entries, resolutions):
+    '''
+    Folds newly inserted price_data rows into the candle tables. Call inside the transaction that inserts the rows.
+
+    Parameters:
+        c: sqlite cursor
+        entries (list): (ts, currency_pair, ask_price, bid_price, market_price) rows in time order
+        resolutions (list): candle lengths, in minutes
+    Returns:
+        None
+    '''
+    if len(resolutions) > 0 and len(entries) > 0:
+        c.executemany(upsert_candle, aggregate_candles(entries, resolutions))
+
+
+def rebuild_candles(conn, resolutions = [1, 5, 60, 1440], batch_size = 100000):
+    '''
+    Rebuilds the candle tables from every row in price_data, e.g. after migrating or backfilling a database.
+
+    Parameters:
+        conn: sqlite3.Connection
+        resolutions (list, optional): candle lengths, in minutes. Defaults to [1, 5, 60, 1440].
+        batch_size (int, optional): rows aggregated per transaction. Defaults to 100000.
+    Returns:
+        None
+    '''
+    create_candle_table(conn)
+    with conn:
+        conn.execute("DELETE FROM candles")
+    reader = conn.execute("SELECT ts, currency_pair, ask_price, bid_price, market_price FROM price_data ORDER BY currency_pair, ts")
+    writer = conn.cursor()
+    while True:
+        rows = reader.fetchmany(batch_size)
+        if len(rows) == 0:
+            break
+        with conn:
+            update_candles(writer, rows, resolutions)
+
+
+if __name__ == "__main__":
+    #python3 candles.py pricedata.db
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "pricedata.db")
+    rebuild_candles(conn)
+    conn.close()
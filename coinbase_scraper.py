@@ -1,107 +1,242 @@
-import sqlite3
-from datetime import datetime
 import logging
 import time
-import configparser
 import ccxt
 import sys
-import ast
-
+from concurrent.futures import ThreadPoolExecutor
+from price_database import PriceWriter
+from price_ring import RingPublisher
+from config_cache import ConfigCache
+from config_cache import install_signal_handlers
+from scheduler import CycleScheduler
+from request_scheduler import RequestScheduler
+from exchange_router import ExchangeRouter
+from exchange_router import connect_exchange
+import metrics
+from log_setup import setup_logging
+import asyncio
+try:
+    import ticker_stream
+except ImportError:
+    ticker_stream = None #websockets is optional, streaming mode falls back to polling without it
 
-#set up logging
-log_format = (
-    '[%(asctime)s] %(levelname)-8s %(name)-12s %(message)s')
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format=log_format,
-    filename=('scraper.log'),
-)
+#public ticker requests go through the rate limiter, with retries on network errors
+coinbase = RequestScheduler(ccxt.coinbasepro({}))
 
-#connect to database
-conn = sqlite3.connect('pricedata.db')
-c = conn.cursor()
+fetch_seconds = metrics.Histogram("scraper_fetch_seconds", "Time to download the ticker data of every pair in a cycle")
+fetched_pairs = metrics.Gauge("scraper_fetched_pairs", "Pairs downloaded in the last cycle")
 
-#try to create a new table if it doesnt exist
-try:
-    c.execute('''CREATE TABLE price_data (
-        date_time text, 
-        currency_pair text,
-        ask_price numeric, 
-        bid_price numeric, 
-        market_price numeric
-        )''')
-except:
-    pass
-
-coinbase = ccxt.coinbasepro({})
-
-def price_scraper(currency_pair = "BTC/USD"):
+def parse_currency_pairs(values):
     '''
-    Collects currency pair price data from coinbase and stores it in an sqlite database. 
-    
+    Turns a list of coins or currency pairs (e.g. ["BTC", "ETH/USD"] or ["BTC/USD, ETH/USD"]) into a list of currency pairs.
+
     Parameters:
-        currency_pair: what currency pair data to collect (default = "BTC/USD")
+        values (list): coins or currency pairs, optionally comma separated
     Returns:
-        None
+        list of currency pairs
     '''
-    logging.debug("Initializing price scraper (Coinbase)")
-    format = "%d/%m/%Y %H:%M:%S"
-    logging.debug("Set environmental parameters")
-    conn = sqlite3.connect("pricedata.db")
-    c = conn.cursor()
-    logging.debug("Established connection with local database")
-
-    config = configparser.ConfigParser()
-    config.read_file(open("config.txt"))
-    seconds_to_sleep = ast.literal_eval(config.get('Scraper Section', 'scraper_frequency'))*60 #convert the minutes into seconds
+    currency_pairs = []
+    for value in values:
+        for pair in value.split(","):
+            pair = pair.strip()
+            if pair == "":
+                continue
+            if "/" not in pair:
+                pair = "{coin}/USD".format(coin = pair)
+            if pair not in currency_pairs:
+                currency_pairs.append(pair)
+    return currency_pairs
+
+
+def fetch_ticker_data(currency_pairs, exchange = coinbase):
+    '''
+    Downloads ticker data for several currency pairs at once. Uses the batched fetch_tickers endpoint when the exchange supports it and
+    falls back to concurrent fetch_ticker calls, so a failure for one pair does not stop the others from being collected.
 
-    #start loop
+    Parameters:
+        currency_pairs (list): currency pairs to download
+        exchange (optional): ccxt-compatible exchange to download from. Defaults to Coinbase.
+    Returns:
+        dict of currency pair -> ticker data, only for the pairs that were downloaded successfully
+    '''
+    ticker_data = {}
+    if exchange.has.get('fetchTickers'):
+        try:
+            tickers = exchange.fetch_tickers(currency_pairs)
+            ticker_data = {pair: tickers[pair] for pair in currency_pairs if pair in tickers}
+        except Exception as e:
+            logging.error("Failed to download batched ticker data: " + str(e))
+
+    missing_pairs = [pair for pair in currency_pairs if pair not in ticker_data]
+    if len(missing_pairs) > 0:
+        with ThreadPoolExecutor(max_workers=len(missing_pairs)) as executor:
+            futures = {pair: executor.submit(exchange.fetch_ticker, pair) for pair in missing_pairs}
+            for pair, future in futures.items():
+                try:
+                    ticker_data[pair] = future.result()
+                except Exception as e:
+                    logging.error("Failed to download ticker data for " + pair + ": " + str(e))
+    return ticker_data
+
+
+def poll_prices(currency_pairs, writer, config, router):
+    '''
+    Polls the REST ticker endpoint of every exchange in the router every scraper_frequency minutes and queues the rows with the writer,
+    until the config stops the script. Each pair's row holds the best ask and bid across the exchanges, and with more than one exchange
+    every exchange's quote is also queued for the venue_prices table.
+    '''
+    scheduler = CycleScheduler(config.get('Scraper Section', 'scraper_frequency')*60, name = "scraper") #samples land on clock boundaries, e.g. :00, :05, :10
     script_status = "run"
     while script_status == "run":
 
         #Get Master Parameters
-        config = configparser.ConfigParser()
-        config.read_file(open("config.txt"))
+        config.reload_if_changed() #only re-parses config.txt if it changed since the last cycle
+        scheduler.interval = config.get('Scraper Section', 'scraper_frequency')*60 #convert the minutes into seconds
         scrape_status = config.get('Scraper Section', 'scrape') #controls whether to scrape this cycle
         script_status = config.get('Scraper Section', 'scraper_script') #controls whether to shut the script down
-        download_status = ""
 
         if scrape_status == "run":
-            try:
-                ticker_data = coinbase.fetch_ticker(currency_pair)
-                logging.debug("Downloaded ticker data from Coinbase API")
-                best_ask = ticker_data['ask']
-                best_bid = ticker_data['bid']
-                market_price = (best_ask + best_bid)/2
-                logging.debug("Market Price:" + str(market_price))
-                print("Market Price:", market_price)
-                download_status = "success"
+            with fetch_seconds.time():
+                #every exchange is downloaded at once, so the cycle takes as long as the slowest one
+                exchange_data = router.fan_out('fetch_tickers', lambda exchange: fetch_ticker_data(currency_pairs, exchange))
+            ticker_data = {pair: {name: tickers[pair] for name, tickers in exchange_data.items() if pair in tickers} for pair in currency_pairs}
+            ticker_data = {pair: quotes for pair, quotes in ticker_data.items() if len(quotes) > 0}
+            fetched_pairs.set(len(ticker_data))
+            logging.debug("Downloaded ticker data from " + ", ".join(router.venues) + " for " + str(len(ticker_data)) + " of " + str(len(currency_pairs)) + " pairs")
+
+            entries = []
+            quotes = []
+            ts = int(time.time())
+            for currency_pair in currency_pairs:
+                if currency_pair not in ticker_data:
+                    continue
+                try:
+                    best = router.record(currency_pair, ticker_data[currency_pair]) #consolidated best bid and ask
+                    best_ask = best['ask']
+                    best_bid = best['bid']
+                    market_price = (best_ask + best_bid)/2
+                except Exception as e:
+                    logging.error("Failed to read ticker data for " + currency_pair + ": " + str(e))
+                    continue
+                logging.debug(currency_pair + " Market Price:" + str(market_price))
+                print(currency_pair, "Market Price:", market_price)
+                entries.append((ts, currency_pair, best_ask, best_bid, market_price))
+                if len(router.venues) > 1:
+                    logging.debug(currency_pair + " Best Ask: " + str(best_ask) + " (" + best['askExchange'] + ") Best Bid: " + str(best_bid) + " (" + best['bidExchange'] + ")")
+                    for name, ticker in ticker_data[currency_pair].items():
+                        if ticker.get('ask') is not None and ticker.get('bid') is not None:
+                            quotes.append((ts, currency_pair, name, ticker['ask'], ticker['bid'], (ticker['ask'] + ticker['bid'])/2))
+
+            #queue the cycle's data, the writer commits it in batches
+            writer.add(entries, quotes)
+
+
+        elif scrape_status == "pause":
+            print("Paused Scraping")
+            logging.debug("Paused Scraping")
+
+        if script_status != "run":
+            print("Termination Signal Recieved: Stopping Script...")
+            logging.debug("Termination Signal Recieved: Stopping Script")
     
-            except Exception as e:
-                download_status = "failure"
-                logging.error("Failed to download ticker data:" + str(e))
+        # sleep until the next tick (returns early if a signal changes the run state)
+        scheduler.sleep(config.sleep)
 
-            #add data to the database if succesfully downloaded
-            if download_status == "success":
-                entry = (datetime.now().strftime(format), currency_pair, best_ask, best_bid, market_price)
-                c.execute("INSERT INTO price_data VALUES (?, ?, ?, ?, ?)", entry)
-                conn.commit()
-                logging.debug("Succesfully updated database")
 
+async def stream_prices(currency_pairs, writer, config):
+    '''
+    Streams tickers over one websocket connection and queues the sampled rows with the writer. The config file is checked every
+    stream_config_check seconds so the scrape and scraper_script switches still pause and stop the scraper.
+    '''
+    stream = ticker_stream.TickerStream(
+        currency_pairs,
+        writer.add,
+        url = config.get('Scraper Section', 'stream_url'),
+        sample_interval = config.get('Scraper Section', 'stream_sample_interval')
+    )
+    stream_task = asyncio.ensure_future(stream.run())
 
-        elif scrape_status == "pause":
+    script_status = "run"
+    while script_status == "run" and not stream_task.done():
+        await asyncio.sleep(config.get('Scraper Section', 'stream_config_check'))
+
+        #Get Master Parameters
+        config.reload_if_changed() #only re-parses config.txt if it changed since the last check
+        scrape_status = config.get('Scraper Section', 'scrape') #controls whether to scrape this cycle
+        script_status = config.get('Scraper Section', 'scraper_script') #controls whether to shut the script down
+
+        if scrape_status == "pause" and not stream.paused:
             print("Paused Scraping")
             logging.debug("Paused Scraping")
+        stream.paused = scrape_status != "run"
 
         if script_status != "run":
             print("Termination Signal Recieved: Stopping Script...")
             logging.debug("Termination Signal Recieved: Stopping Script")
-        
-        # sleep 
-        time.sleep(seconds_to_sleep)
 
+    stream.stop()
+    stream_task.cancel()
+    try:
+        await stream_task
+    except asyncio.CancelledError:
+        pass
 
-if __name__ == "__main__":
-    price_scraper(currency_pair=sys.argv[1]) 
 
+def price_scraper(currency_pairs = ["BTC/USD"]):
+    '''
+    Collects currency pair price data from the exchanges listed in config.txt (coinbase by default) and stores it in an sqlite database. 
+    
+    Parameters:
+        currency_pairs: what currency pairs to collect data for (default = ["BTC/USD"])
+    Returns:
+        None
+    '''
+    #load settings once, they are re-read only when config.txt changes or a signal arrives
+    config = ConfigCache("config.txt")
+    setup_logging("scraper", config) #records are written by a background thread, see the Logging Section of config.txt
+    logging.debug("Initializing price scraper (Coinbase)")
+    logging.debug("Set environmental parameters")
+    install_signal_handlers(config, 'Scraper Section', 'scraper_script', 'scrape')
+    metrics.start_http_server(config.get('Metrics Section', 'scraper_port'))
+
+    #single buffered writer for the database (creates the price_data table and index if they dont exist)
+    writer = PriceWriter(
+        "pricedata.db",
+        batch_size = config.get('Scraper Section', 'write_batch_size'),
+        flush_interval = config.get('Scraper Section', 'write_flush_interval'),
+        resolutions = config.get('Scraper Section', 'candle_resolutions'),
+        rings = RingPublisher(config.get('Scraper Section', 'price_ring_capacity')) if config.get('Scraper Section', 'price_ring') == "on" else None #latest rows in shared memory for the traders
+    )
+    logging.debug("Established connection with local database")
+    scrape_mode = config.get('Scraper Section', 'scrape_mode') #"poll" the REST ticker or "stream" from the websocket feed
+    exchanges = config.get('Scraper Section', 'exchanges')
+    logging.debug("Scraping currency pairs (" + scrape_mode + ") from " + ", ".join(exchanges) + ": " + ", ".join(currency_pairs))
+    #public endpoints only, every exchange has its own rate limiter
+    router = ExchangeRouter({x: coinbase if x == "coinbasepro" else connect_exchange(x, credentials = False) for x in exchanges})
+
+    #start loop
+    try:
+        if scrape_mode == "stream" and ticker_stream is not None and exchanges == ["coinbasepro"]:
+            asyncio.run(stream_prices(currency_pairs, writer, config))
+        else:
+            if scrape_mode == "stream" and ticker_stream is None:
+                print("websockets is not installed, falling back to polling")
+                logging.error("websockets is not installed, falling back to polling")
+            elif scrape_mode == "stream":
+                print("Streaming only supports Coinbase, falling back to polling")
+                logging.error("Streaming only supports Coinbase, falling back to polling " + ", ".join(exchanges))
+            poll_prices(currency_pairs, writer, config, router)
+    finally:
+        #write whatever is still buffered before exiting
+        writer.close()
+        router.close()
+        logging.debug("Flushed database writer")
+
+
+if __name__ == "__main__":
+    #pairs can be passed on the command line or listed in the currency_pairs setting of the scraper section
+    if len(sys.argv) > 1:
+        currency_pairs = parse_currency_pairs(sys.argv[1:])
+    else:
+        currency_pairs = parse_currency_pairs([ConfigCache("config.txt").get('Scraper Section', 'currency_pairs')])
+    price_scraper(currency_pairs=currency_pairs)
@@ -0,0 +1,201 @@
+import os
+import configparser
+import logging
+import signal
+import threading
+import time
+
+
+def parse_list(value):
+    #"1, 5, 60" -> [1, 5, 60]
+    return [int(x) for x in value.split(",") if x.strip() != ""]
+
+
+def parse_names(value):
+    #"coinbasepro, kraken" -> ["coinbasepro", "kraken"]
+    return [x.strip() for x in value.split(",") if x.strip() != ""]
+
+
+#every setting the scripts read: section -> key -> (type, default). None as default means the setting is required.
+config_schema = {
+    'Scraper Section': {
+        'scraper_script': (str, None),
+        'scrape': (str, None),
+        'scraper_frequency': (float, None),
+        'currency_pairs': (str, "BTC/USD"),
+        'scrape_mode': (str, "poll"),
+        'stream_sample_interval': (float, 10.0),
+        'stream_config_check': (float, 10.0),
+        'stream_url': (str, "wss://ws-feed.exchange.coinbase.com"),
+        'write_batch_size': (int, 500),
+        'write_flush_interval': (float, 60.0),
+        'candle_resolutions': (parse_list, "1, 5, 60, 1440"),
+        'price_ring': (str, "off"),
+        'price_ring_capacity': (int, 65536),
+        'exchanges': (parse_names, "coinbasepro"),
+    },
+    'Retention Section': {
+        'archive_age': (float, 30.0),
+        'archive_dir': (str, "archive"),
+        'downsample_age': (float, 365.0),
+        'downsample_interval': (int, 60),
+        'vacuum_pages': (int, 0),
+    },
+    'Mean Reversion Trader Section': {
+        'total_invested': (float, None),
+        'trader_script': (str, None),
+        'trade': (str, None),
+        'exchanges': (parse_names, "coinbasepro"),
+    },
+    'SMA Crossover Trader Section': {
+        'total_invested': (float, None),
+        'trader_script': (str, None),
+        'trade': (str, None),
+        'exchanges': (parse_names, "coinbasepro"),
+    },
+    'Logging Section': {
+        'level': (str, "DEBUG"),
+        'levels': (str, ""),
+        'log_dir': (str, "."),
+        'rotate': (str, "size"),
+        'max_bytes': (int, 10485760),
+        'rotate_when': (str, "midnight"),
+        'backup_count': (int, 5),
+        'echo': (str, "off"),
+    },
+    'Metrics Section': {
+        'scraper_port': (int, 0),
+        'mean_reversion_port': (int, 0),
+        'sma_crossover_port': (int, 0),
+        'runtime_port': (int, 0),
+    },
+}
+
+class ConfigCache:
+    '''
+    Parses config.txt once and re-parses it only when the file's modification time, inode or size changes.
+    Every setting in config_schema is converted to its type when the file is loaded, so a bad value is reported once, up front.
+    If an edited file fails to parse or validate, the last good settings stay in use.
+
+    Parameters:
+        path (str, optional): path to the config file. Defaults to "config.txt".
+        schema (dict, optional): section -> key -> (type, default). Defaults to config_schema.
+    '''
+
+    def __init__(self, path = "config.txt", schema = config_schema):
+        self.path = path
+        self.schema = schema
+        self.signature = None
+        self.values = {}
+        self.overrides = {} #settings changed by signals, cleared when the file changes
+        self.wake = threading.Event()
+        self.load()
+
+    def file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def load(self):
+        signature = self.file_signature()
+        parser = configparser.ConfigParser()
+        with open(self.path) as config_file:
+            parser.read_file(config_file)
+
+        values = {}
+        for section, settings in self.schema.items():
+            for key, (value_type, default) in settings.items():
+                if parser.has_option(section, key):
+                    raw_value = parser.get(section, key)
+                elif default is not None:
+                    raw_value = default
+                elif parser.has_section(section):
+                    raise ValueError("{path}: [{section}] is missing {key}".format(path = self.path, section = section, key = key))
+                else:
+                    continue #sections that are not in the file are only needed by the scripts that use them
+                try:
+                    values[(section, key)] = value_type(raw_value) if isinstance(raw_value, str) else raw_value
+                except ValueError:
+                    raise ValueError("{path}: [{section}] {key} = {value} is not a valid {type}".format(
+                        path = self.path, section = section, key = key, value = raw_value, type = value_type.__name__))
+        self.values = values
+        self.signature = signature
+        self.overrides = {}
+        logging.debug("Loaded " + self.path)
+
+    def reload_if_changed(self):
+        '''
+        Re-parses the config file if it changed on disk since it was last loaded.
+
+        Returns:
+            True if the settings were reloaded
+        '''
+        try:
+            if self.file_signature() == self.signature:
+                return False
+            self.load()
+            return True
+        except (OSError, ValueError, configparser.Error) as e:
+            print("Could not reload config, keeping previous settings:", str(e))
+            logging.error("Could not reload config, keeping previous settings: " + str(e))
+            return False
+
+    def get(self, section, key):
+        if (section, key) in self.overrides:
+            return self.overrides[(section, key)]
+        return self.values[(section, key)]
+
+    def set_override(self, section, key, value):
+        self.overrides[(section, key)] = value
+        self.wake.set() #cut the current sleep short so the change is picked up straight away
+
+    def sleep(self, seconds, clock = time):
+        '''
+        Sleeps for seconds, returning early if a signal changes a setting. Clocks other than the time module (e.g. a VirtualClock)
+        are slept on directly.
+        '''
+        if clock is not time:
+            clock.sleep(seconds)
+            return
+        self.wake.wait(max(0, seconds))
+        self.wake.clear()
+
+
+def install_signal_handlers(config, section, script_key, run_key):
+    '''
+    Makes the script's run/pause/stop switches reachable through signals:
+    SIGUSR1 pauses (run_key = "pause"), SIGUSR2 resumes (run_key = "run"), SIGTERM and SIGINT stop the script (script_key = "stop").
+    The signal takes effect immediately and lasts until config.txt is next edited.
+
+    Parameters:
+        config (ConfigCache): the script's config
+        section (str or list): config section of the script, e.g. "Scraper Section", or a list of sections when one process hosts several strategies
+        script_key (str): setting that stops the script, e.g. "scraper_script"
+        run_key (str): setting that pauses the script, e.g. "scrape"
+    Returns:
+        None
+    '''
+    sections = [section] if isinstance(section, str) else list(section)
+
+    def pause(signum, frame):
+        logging.info("Received pause signal")
+        for x in sections:
+            config.set_override(x, run_key, "pause")
+
+    def resume(signum, frame):
+        logging.info("Received resume signal")
+        for x in sections:
+            config.set_override(x, run_key, "run")
+
+    def stop(signum, frame):
+        logging.info("Received stop signal")
+        for x in sections:
+            config.set_override(x, script_key, "stop")
+
+    try:
+        signal.signal(signal.SIGUSR1, pause)
+        signal.signal(signal.SIGUSR2, resume)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+    except ValueError:
+        #signal handlers can only be installed from the main thread
+        logging.debug("Not in the main thread, signal handlers not installed")
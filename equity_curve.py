@@ -0,0 +1,197 @@
+import os
+import json
+import math
+import time
+import struct
+import logging
+from collections import deque
+
+
+#one record per cycle: ts, portfolio value (USD), position size (coin), market price
+record = struct.Struct("<dddd")
+seconds_per_year = 365*86400 #crypto trades every day
+
+class EquityCurve:
+    '''
+    Records the portfolio value and position of a strategy once per cycle and keeps its risk metrics up to date in O(1) per cycle:
+    drawdown, max drawdown, rolling volatility, Sharpe and Sortino ratios, exposure time and turnover. The series is appended
+    to a binary file of fixed size records, and the running totals are saved next to it, so memory stays flat however long the
+    trader runs and a restarted trader carries on without reading back its history (only the last window records are reloaded).
+
+    Parameters:
+        path (str, optional): file the series is appended to, with the running totals in path + ".json". Defaults to None (memory only, e.g. for paper trading).
+        window (int, optional): number of cycles in the rolling volatility. Defaults to 288 (one day of 5 minute cycles).
+        clock (optional): object providing time(). Defaults to the time module.
+    '''
+
+    def __init__(self, path = None, window = 288, clock = time):
+        self.path = path
+        self.window = window
+        self.clock = clock
+        self.returns = deque(maxlen = window) #returns in the rolling window
+        self.window_sum = 0.0
+        self.window_squares = 0.0
+        self.totals = {
+            'cycles': 0,
+            'first_ts': None,
+            'last_ts': None,
+            'last_equity': None,
+            'last_position': None,
+            'peak': 0.0,
+            'max_drawdown': 0.0,
+            'return_sum': 0.0, #sum of cycle returns
+            'return_squares': 0.0, #sum of squared cycle returns
+            'downside_squares': 0.0, #sum of squared negative cycle returns
+            'exposed_seconds': 0.0, #time spent holding a position
+            'traded_value': 0.0, #USD value of every change in position
+            'equity_sum': 0.0,
+        }
+        if path is not None:
+            self.load()
+
+    def load(self):
+        #running totals from the last save, and the tail of the series for the rolling window
+        if os.path.exists(self.path + ".json"):
+            with open(self.path + ".json") as totals_file:
+                self.totals.update(json.load(totals_file))
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as series_file:
+                series_file.seek(0, os.SEEK_END)
+                count = min(series_file.tell()//record.size, self.window + 1)
+                series_file.seek(-count*record.size, os.SEEK_END)
+                previous = None
+                for ts, equity, position, price in record.iter_unpack(series_file.read(count*record.size)):
+                    if previous is not None and previous > 0:
+                        self.push_return(equity/previous - 1)
+                    previous = equity
+
+    def push_return(self, value):
+        if len(self.returns) == self.returns.maxlen:
+            oldest = self.returns[0]
+            self.window_sum = self.window_sum - oldest
+            self.window_squares = self.window_squares - oldest*oldest
+        self.returns.append(value)
+        self.window_sum = self.window_sum + value
+        self.window_squares = self.window_squares + value*value
+
+    def add(self, equity, position, price):
+        '''
+        Records one cycle and updates the metrics.
+
+        Parameters:
+            equity (float): portfolio value in USD (fiat plus position at the market price)
+            position (float): position size in the coin
+            price (float): market price of the coin
+        Returns:
+            dict of the current metrics, see stats()
+        '''
+        now = self.clock.time()
+        totals = self.totals
+        if totals['last_ts'] is not None:
+            if totals['last_position'] > 0:
+                totals['exposed_seconds'] = totals['exposed_seconds'] + (now - totals['last_ts'])
+            totals['traded_value'] = totals['traded_value'] + abs(position - totals['last_position'])*price
+            if totals['last_equity'] > 0:
+                value = equity/totals['last_equity'] - 1
+                totals['return_sum'] = totals['return_sum'] + value
+                totals['return_squares'] = totals['return_squares'] + value*value
+                totals['downside_squares'] = totals['downside_squares'] + min(value, 0)**2
+                self.push_return(value)
+        else:
+            totals['first_ts'] = now
+        totals['cycles'] = totals['cycles'] + 1
+        totals['last_ts'] = now
+        totals['last_equity'] = equity
+        totals['last_position'] = position
+        totals['equity_sum'] = totals['equity_sum'] + equity
+        totals['peak'] = max(totals['peak'], equity)
+        totals['max_drawdown'] = max(totals['max_drawdown'], self.drawdown())
+
+        if self.path is not None:
+            self.save(now, equity, position, price)
+        return self.stats()
+
+    def save(self, ts, equity, position, price):
+        try:
+            with open(self.path, "ab") as series_file:
+                series_file.write(record.pack(ts, equity, position, price))
+            #write the totals to a temporary file and rename it, so a crash cannot leave them half written
+            with open(self.path + ".json.tmp", "w") as totals_file:
+                json.dump(self.totals, totals_file)
+            os.replace(self.path + ".json.tmp", self.path + ".json")
+        except OSError as e:
+            logging.error("Could not save equity curve " + self.path + ": " + str(e))
+
+    def drawdown(self):
+        if self.totals['peak'] <= 0:
+            return 0.0
+        return 1 - self.totals['last_equity']/self.totals['peak']
+
+    def stats(self):
+        '''
+        Returns:
+            dict of drawdown, max_drawdown, volatility (rolling, annualised), sharpe, sortino (annualised, zero risk free rate),
+            exposure (fraction of time holding a position), turnover (traded value over average equity) and cycles.
+            Metrics that need more cycles are None.
+        '''
+        totals = self.totals
+        returns = totals['cycles'] - 1
+        stats = {
+            'cycles': totals['cycles'],
+            'drawdown': self.drawdown() if totals['cycles'] > 0 else 0.0,
+            'max_drawdown': totals['max_drawdown'],
+            'volatility': None,
+            'sharpe': None,
+            'sortino': None,
+            'exposure': None,
+            'turnover': totals['traded_value']/(totals['equity_sum']/totals['cycles']) if totals['cycles'] > 0 and totals['equity_sum'] > 0 else 0.0,
+        }
+        if returns < 2 or totals['last_ts'] <= totals['first_ts']:
+            return stats
+
+        #annualise with the average time between cycles, so a changed scraper_frequency is taken into account
+        periods_per_year = seconds_per_year/((totals['last_ts'] - totals['first_ts'])/returns)
+        mean = totals['return_sum']/returns
+        variance = max(totals['return_squares']/returns - mean*mean, 0)
+        n = len(self.returns)
+        if n >= 2:
+            window_mean = self.window_sum/n
+            stats['volatility'] = math.sqrt(max(self.window_squares/n - window_mean*window_mean, 0)*periods_per_year)
+        if variance > 0:
+            stats['sharpe'] = mean/math.sqrt(variance)*math.sqrt(periods_per_year)
+        if totals['downside_squares'] > 0:
+            stats['sortino'] = mean/math.sqrt(totals['downside_squares']/returns)*math.sqrt(periods_per_year)
+        stats['exposure'] = totals['exposed_seconds']/(totals['last_ts'] - totals['first_ts'])
+        return stats
+
+    def summary_lines(self):
+        #the metrics formatted for the trader's per-cycle summary
+        stats = self.stats()
+        def percent(value):
+            return "N/A" if value is None else str(round(value*100, 2)) + "%"
+        def ratio(value):
+            return "N/A" if value is None else str(round(value, 2))
+        return [
+            "Drawdown: " + percent(stats['drawdown']) + " (max " + percent(stats['max_drawdown']) + ")",
+            "Volatility (annualised, last " + str(len(self.returns)) + " cycles): " + percent(stats['volatility']),
+            "Sharpe: " + ratio(stats['sharpe']) + " Sortino: " + ratio(stats['sortino']),
+            "Exposure: " + percent(stats['exposure']) + " Turnover: " + ratio(stats['turnover']) + "x",
+        ]
+
+
+def open_equity_curve(equity_dir, key, window = 288, clock = time):
+    '''
+    Opens the equity curve of one strategy instance, e.g. equity/mean_reversion_BTC-USD_6000.0_0.97_1.03_0.9_1.0.bin.
+
+    Parameters:
+        equity_dir (str): directory holding the curves, None for a curve kept in memory only
+        key (str): the strategy's checkpoint key
+        window (int, optional): number of cycles in the rolling volatility. Defaults to 288.
+        clock (optional): object providing time(). Defaults to the time module.
+    Returns:
+        EquityCurve
+    '''
+    if equity_dir is None:
+        return EquityCurve(None, window, clock)
+    os.makedirs(equity_dir, exist_ok = True)
+    return EquityCurve(os.path.join(equity_dir, key.replace("/", "-").replace(" ", "_") + ".bin"), window, clock)
@@ -0,0 +1,285 @@
+import os
+import math
+import logging
+import sys
+import ccxt
+from concurrent.futures import ThreadPoolExecutor
+from request_scheduler import RequestScheduler
+from request_scheduler import coinbase_limits
+import metrics
+
+
+routed_orders = metrics.Counter("routed_orders_total", "Orders placed through the exchange router", ["exchange", "side"])
+venue_errors = metrics.Counter("venue_errors_total", "Exchange calls of the router that failed on one venue", ["exchange", "method"])
+
+def credential_files(exchange_id):
+    #(api key, secret, password) files written by encode_coinbase_api_keys.py, cb_file*.bin for Coinbase and <exchange>_file*.bin for the others
+    prefix = "cb" if exchange_id == "coinbasepro" else exchange_id
+    return [prefix + "_file" + str(i) + ".bin" for i in (1, 2, 3)]
+
+
+def load_credentials(exchange_id):
+    '''
+    Reads the stored API keys of an exchange. The key and secret files are required, the password file only exists for exchanges
+    that use one (e.g. Coinbase).
+
+    Parameters:
+        exchange_id (str): ccxt exchange id, e.g. "coinbasepro" or "kraken"
+    Returns:
+        dict of ccxt credentials (apiKey, secret and password)
+    '''
+    key_file, secret_file, password_file = credential_files(exchange_id)
+    credentials = {}
+    with open(key_file, encoding="utf-8") as binary_file:
+        credentials['apiKey'] = binary_file.read()
+    with open(secret_file, encoding="utf-8") as binary_file:
+        credentials['secret'] = binary_file.read()
+    if os.path.exists(password_file):
+        with open(password_file, encoding="utf-8") as binary_file:
+            credentials['password'] = binary_file.read()
+    return credentials
+
+
+def exchange_limits(client):
+    #Coinbase's documented limits, other exchanges get one request per ccxt rateLimit (milliseconds) on each endpoint
+    if client.id == "coinbasepro":
+        return coinbase_limits
+    rate = 1000/client.rateLimit
+    return {'public': (rate, max(1, int(rate))), 'private': (rate, max(1, int(rate)))}
+
+
+def connect_exchange(exchange_id, credentials = True):
+    '''
+    Creates a ccxt client behind a RequestScheduler using the exchange's rate limits.
+
+    Parameters:
+        exchange_id (str): ccxt exchange id, e.g. "coinbasepro" or "kraken"
+        credentials (bool, optional): load the stored API keys, False for public endpoints only. Defaults to True.
+    Returns:
+        RequestScheduler
+    '''
+    if exchange_id not in ccxt.exchanges:
+        raise ValueError("Unknown exchange: " + exchange_id)
+    client = getattr(ccxt, exchange_id)(load_credentials(exchange_id) if credentials else {})
+    return RequestScheduler(client, limits = exchange_limits(client))
+
+
+def connect_exchanges(exchange_ids, credentials = True):
+    '''
+    Connects to the configured exchanges. A single exchange is returned as is, several are combined in an ExchangeRouter.
+
+    Parameters:
+        exchange_ids (list): ccxt exchange ids, e.g. ["coinbasepro", "kraken"]
+        credentials (bool, optional): load the stored API keys, False for public endpoints only. Defaults to True.
+    Returns:
+        ccxt-compatible exchange
+    '''
+    venues = {exchange_id: connect_exchange(exchange_id, credentials) for exchange_id in exchange_ids}
+    if len(venues) == 1:
+        return venues[exchange_ids[0]]
+    return ExchangeRouter(venues)
+
+
+def consolidate(symbol, quotes):
+    '''
+    Combines the tickers of several exchanges into the best bid and ask across them.
+
+    Parameters:
+        symbol (str): currency pair, e.g. "BTC/USD"
+        quotes (dict): exchange -> ccxt ticker
+    Returns:
+        ccxt ticker with the lowest ask and highest bid, the exchanges quoting them in askExchange and bidExchange and every
+        exchange's ticker in info
+    '''
+    asks = [(ticker['ask'], name) for name, ticker in quotes.items() if ticker.get('ask') is not None]
+    bids = [(ticker['bid'], name) for name, ticker in quotes.items() if ticker.get('bid') is not None]
+    if len(asks) == 0 or len(bids) == 0:
+        raise ccxt.ExchangeError("No exchange quoted both sides of " + symbol)
+    best_ask, ask_exchange = min(asks, key = lambda x: x[0]) #ties go to the first exchange listed
+    best_bid, bid_exchange = max(bids, key = lambda x: x[0])
+    timestamps = [ticker['timestamp'] for ticker in quotes.values() if ticker.get('timestamp') is not None]
+    return {
+        'symbol': symbol,
+        'timestamp': max(timestamps) if len(timestamps) > 0 else None,
+        'ask': best_ask,
+        'bid': best_bid,
+        'last': (best_ask + best_bid)/2,
+        'askExchange': ask_exchange,
+        'bidExchange': bid_exchange,
+        'info': quotes,
+    }
+
+
+def combine_balances(balances):
+    #exchange -> ccxt balance into one balance with the free, used and total amounts summed per currency
+    combined = {'free': {}, 'used': {}, 'total': {}}
+    for balance in balances.values():
+        for key in combined:
+            for currency, amount in balance.get(key, {}).items():
+                if amount is not None:
+                    combined[key][currency] = combined[key].get(currency, 0.0) + amount
+    return combined
+
+
+class ExchangeRouter:
+    '''
+    Presents several exchanges as one ccxt-compatible exchange. Tickers are the best bid and ask across the exchanges and balances
+    are summed over them. Reads are sent to every exchange at once, so adding an exchange does not lengthen a cycle, and an
+    exchange that fails is left out as long as another one answers. Limit orders go to the exchange with the best price in the
+    last ticker (lowest ask for buys, highest bid for sells) among those whose free balance covers the order. As balances are
+    summed, an order can be larger than any one exchange can fund, it is then cut down to the free balance of the exchange
+    with the most and the rest is left to the strategy's next signal. Order ids are prefixed with the exchange
+    ("kraken:OABC..."). Ids without a known prefix are looked up on the first exchange, so orders checkpointed before routing
+    was enabled can still be followed.
+
+    Parameters:
+        venues (dict): exchange name -> ccxt-compatible exchange, e.g. RequestSchedulers from connect_exchange() or SimulatedExchanges
+        max_workers (int, optional): threads for the concurrent calls. Defaults to 4 per exchange, so strategies sharing the router do not queue.
+    '''
+
+    def __init__(self, venues, max_workers = None):
+        if len(venues) == 0:
+            raise ValueError("ExchangeRouter needs at least one exchange")
+        self.venues = dict(venues)
+        self.executor = ThreadPoolExecutor(max_workers = max_workers or 4*len(self.venues), thread_name_prefix = "exchange")
+        self.quotes = {} #symbol -> exchange -> ticker, from the last fetch_ticker
+        self.best = {} #symbol -> consolidated ticker, from the last fetch_ticker
+        self.balances = {} #exchange -> balance, from the last fetch_balance
+        self.has = {
+            'fetchTickers': False,
+            'fetchOpenOrders': all(exchange.has.get('fetchOpenOrders', False) for exchange in self.venues.values()),
+        }
+
+    def fan_out(self, method, call):
+        '''
+        Runs call(exchange) for every exchange at once.
+
+        Parameters:
+            method (str): name of the call, for logging
+            call (function): takes an exchange and returns its response
+        Returns:
+            dict of exchange name -> response for the exchanges that answered. Raises the first error if none did.
+        '''
+        futures = {name: self.executor.submit(call, exchange) for name, exchange in self.venues.items()}
+        responses = {}
+        errors = []
+        for name, future in futures.items():
+            try:
+                responses[name] = future.result()
+            except Exception as e:
+                venue_errors.inc(exchange = name, method = method)
+                logging.error(method + " failed on " + name + ": " + str(e))
+                errors.append(e)
+        if len(responses) == 0:
+            raise errors[0]
+        return responses
+
+    def record(self, symbol, quotes):
+        #keeps the exchanges' tickers for routing and returns the consolidated one
+        best = consolidate(symbol, quotes)
+        self.quotes[symbol] = quotes
+        self.best[symbol] = best
+        return best
+
+    def fetch_ticker(self, symbol):
+        return self.record(symbol, self.fan_out('fetch_ticker', lambda exchange: exchange.fetch_ticker(symbol)))
+
+    def fetch_balance(self):
+        self.balances = self.fan_out('fetch_balance', lambda exchange: exchange.fetch_balance())
+        return combine_balances(self.balances)
+
+    def capacity(self, name, side, symbol, price):
+        #largest amount the exchange's last known free balance covers, None if its balance has not been fetched
+        balance = self.balances.get(name)
+        if balance is None:
+            return None
+        base, quote = symbol.split("/")
+        if side == 'buy':
+            return math.floor((balance['free'].get(quote) or 0)/price*1e8)/1e8
+        return balance['free'].get(base) or 0
+
+    def route(self, side, symbol, amount, price):
+        '''
+        Picks the exchange for an order from the tickers of the last fetch_ticker and the balances of the last fetch_balance.
+
+        Returns:
+            (exchange name, amount): the best priced exchange that can fund the whole order. If none can, the order is cut down
+            to what the exchange with the most free balance can fund. Raises InsufficientFunds if no exchange has any.
+        '''
+        quotes = self.quotes.get(symbol, {})
+        field = 'ask' if side == 'buy' else 'bid'
+        candidates = [(ticker[field], name) for name, ticker in quotes.items() if ticker.get(field) is not None]
+        candidates.sort(key = lambda x: x[0] if side == 'buy' else -x[0])
+        names = [name for venue_price, name in candidates] if len(candidates) > 0 else list(self.venues)
+        capacities = {name: self.capacity(name, side, symbol, price) for name in names}
+        for name in names:
+            if capacities[name] is None or capacities[name] >= amount:
+                return name, amount
+        name = max(names, key = lambda x: capacities[x]) #the best priced of the exchanges with the most funds
+        if capacities[name] <= 0:
+            currency = symbol.split("/")[1] if side == 'buy' else symbol.split("/")[0]
+            raise ccxt.InsufficientFunds("No exchange has free " + currency + " for a " + side + " of " + symbol)
+        logging.warning("No exchange can fund a " + side + " of " + str(amount) + " " + symbol + ", placing " + str(capacities[name]) + " on " + name)
+        return name, capacities[name]
+
+    def tag(self, name, response):
+        #order response with the exchange prefixed to its id
+        return dict(response, id = name + ":" + str(response['id']), exchange = name)
+
+    def split(self, id):
+        #(exchange name, exchange's order id) of a routed order id
+        name, separator, venue_id = str(id).partition(":")
+        if separator != "" and name in self.venues:
+            return name, venue_id
+        return next(iter(self.venues)), id
+
+    def create_order(self, symbol, side, amount, price):
+        name, amount = self.route(side, symbol, amount, price)
+        quote = self.quotes.get(symbol, {}).get(name, {})
+        logging.info("Routing " + side + " order for " + str(amount) + " " + symbol + " @ " + str(price) + " to " + name +
+            " (ask " + str(quote.get('ask')) + ", bid " + str(quote.get('bid')) + ")")
+        if side == 'buy':
+            response = self.venues[name].create_limit_buy_order(symbol, amount, price)
+        else:
+            response = self.venues[name].create_limit_sell_order(symbol, amount, price)
+        routed_orders.inc(exchange = name, side = side)
+        #reserve the funds until the next fetch_balance, so a second order before it is not routed to the same money
+        balance = self.balances.get(name)
+        if balance is not None:
+            base, quote = symbol.split("/")
+            if side == 'buy':
+                balance['free'][quote] = (balance['free'].get(quote) or 0) - amount*price
+            else:
+                balance['free'][base] = (balance['free'].get(base) or 0) - amount
+        return self.tag(name, response)
+
+    def create_limit_buy_order(self, symbol, amount, price):
+        return self.create_order(symbol, 'buy', amount, price)
+
+    def create_limit_sell_order(self, symbol, amount, price):
+        return self.create_order(symbol, 'sell', amount, price)
+
+    def fetch_order(self, id, symbol = None):
+        name, venue_id = self.split(id)
+        return self.tag(name, self.venues[name].fetch_order(venue_id, symbol))
+
+    def cancel_order(self, id, symbol = None):
+        name, venue_id = self.split(id)
+        return self.tag(name, self.venues[name].cancel_order(venue_id, symbol))
+
+    def fetch_open_orders(self, symbol = None):
+        responses = self.fan_out('fetch_open_orders', lambda exchange: exchange.fetch_open_orders(symbol))
+        return [self.tag(name, order) for name, orders in responses.items() for order in orders]
+
+    def close(self):
+        self.executor.shutdown(wait = False)
+
+
+if __name__ == "__main__":
+    #python3 exchange_router.py BTC/USD coinbasepro kraken bitstamp
+    router = ExchangeRouter({exchange_id: connect_exchange(exchange_id, credentials = False) for exchange_id in sys.argv[2:]})
+    best = router.fetch_ticker(sys.argv[1])
+    for name, ticker in best['info'].items():
+        print(name, "Ask:", ticker['ask'], "Bid:", ticker['bid'])
+    print("Best Ask:", best['ask'], "(" + best['askExchange'] + ")", "Best Bid:", best['bid'], "(" + best['bidExchange'] + ")")
+    router.close()
@@ -0,0 +1,260 @@
+import math
+import numpy as np
+from rolling_window import RollingWindow
+
+
+#Streaming indicators: each one is fed by a PriceFeed like a RollingWindow (add() for every new row, evict() once per cycle) and
+#updates in O(1) per row. Windows are in minutes and time based, a row stays in a window while ts >= now - window.
+#EMA based indicators keep their whole history in a decaying average, their timediff only tells the PriceFeed how much history
+#to load on start-up (5 time constants, older rows weigh less than 1%).
+
+class SMA(RollingWindow):
+    '''
+    Simple moving average over a time window, the average both traders have always used.
+
+    Parameters:
+        rolling_window (int): the length of the window, in minutes
+    '''
+
+    def value(self):
+        return self.average()
+
+
+class RollingStd(SMA):
+    '''
+    Moving average and population standard deviation over a time window. The variance is recomputed from the rows in the window
+    (mean first, then squared deviations from it) each time it is read: running sums of squares are added to and taken from for
+    every row and drift away from the window's true spread.
+
+    Parameters:
+        rolling_window (int): the length of the window, in minutes
+    '''
+
+    def std(self):
+        mean = self.average()
+        return math.sqrt(sum((market_price - mean)**2 for ts, market_price in self.points)/self.count)
+
+
+class Bollinger(RollingStd):
+    '''
+    Bollinger bands: the moving average plus and minus width standard deviations.
+
+    Parameters:
+        rolling_window (int): the length of the window, in minutes
+        width (float, optional): distance of the bands from the average, in standard deviations. Defaults to 2.
+    '''
+
+    def __init__(self, rolling_window, width = 2):
+        RollingStd.__init__(self, rolling_window)
+        self.width = width
+
+    def bands(self):
+        #(lower, middle, upper)
+        middle = self.average()
+        std = self.std()
+        return (middle - self.width*std, middle, middle + self.width*std)
+
+    def zscore(self, price):
+        #how many standard deviations price is from the average, 0 while the window has no spread
+        std = self.std()
+        return (price - self.average())/std if std > 0 else 0.0
+
+
+class WMA(RollingWindow):
+    '''
+    Linearly weighted moving average over a time window: the oldest row in the window has weight 1, the newest weight count.
+
+    Parameters:
+        rolling_window (int): the length of the window, in minutes
+    '''
+
+    def __init__(self, rolling_window):
+        RollingWindow.__init__(self, rolling_window)
+        self.weighted = 0.0 #sum of weight*price
+
+    def add(self, ts, market_price):
+        RollingWindow.add(self, ts, market_price)
+        self.weighted = self.weighted + self.count*market_price
+
+    def evict(self, now):
+        #dropping the oldest row lowers every remaining weight by one
+        timethreshold = now - self.timediff
+        while self.points and self.points[0][0] < timethreshold:
+            ts, market_price = self.points.popleft()
+            self.weighted = self.weighted - self.total
+            self.total = self.total - market_price
+            self.count = self.count - 1
+        if self.count == 0:
+            self.total = 0.0
+            self.weighted = 0.0
+
+    def average(self):
+        return self.weighted/(self.count*(self.count + 1)/2)
+
+    def value(self):
+        return self.average()
+
+
+class EMA:
+    '''
+    Exponential moving average with a time constant of span minutes. Rows are weighted by the time between them, so gaps in the
+    data decay the average as much as the missing rows would have.
+
+    Parameters:
+        span (int): time constant, in minutes
+    '''
+
+    def __init__(self, span):
+        self.tau = span*60
+        self.timediff = 5*self.tau
+        self.ema = None
+        self.last_ts = None
+        self.count = 0 #rows seen
+
+    def add(self, ts, market_price):
+        if self.ema is None:
+            self.ema = market_price
+        elif ts > self.last_ts:
+            self.ema = self.ema + (1 - math.exp(-(ts - self.last_ts)/self.tau))*(market_price - self.ema)
+        self.last_ts = ts
+        self.count = self.count + 1
+
+    def evict(self, now):
+        pass
+
+    def average(self):
+        return self.ema
+
+    def value(self):
+        return self.ema
+
+
+class RSI:
+    '''
+    Relative strength index (0-100) from exponentially weighted average gains and losses with a time constant of period minutes.
+
+    Parameters:
+        period (int): time constant, in minutes
+    '''
+
+    def __init__(self, period):
+        self.gains = EMA(period)
+        self.losses = EMA(period)
+        self.timediff = self.gains.timediff
+        self.last_price = None
+
+    def add(self, ts, market_price):
+        if self.last_price is not None:
+            change = market_price - self.last_price
+            self.gains.add(ts, max(change, 0))
+            self.losses.add(ts, max(-change, 0))
+        self.last_price = market_price
+
+    def evict(self, now):
+        pass
+
+    def value(self):
+        #None until there has been a price change
+        if self.gains.ema is None:
+            return None
+        if self.losses.ema == 0:
+            return 100.0 if self.gains.ema > 0 else 50.0
+        return 100 - 100/(1 + self.gains.ema/self.losses.ema)
+
+
+#Batch versions for backtests: the value of the streaming indicator after each row (windows evicted at that row's ts).
+
+def sma(ts, values, rolling_window):
+    '''
+    Returns:
+        (mean, count) arrays, count is the number of rows inside each window
+    '''
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    right = np.arange(1, len(ts) + 1)
+    left = np.searchsorted(ts, ts - rolling_window*60, side="left")
+    count = right - left
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (cumulative[right] - cumulative[left])/count
+    return mean, count
+
+
+def rolling_std(ts, values, rolling_window, chunk = 1000000):
+    #population standard deviation over each window, summing squared deviations from the window's mean like RollingStd.std()
+    #(differences of prefix sums of squares lose precision to cancellation). The rows of each window are gathered into a
+    #(rows, widest window) block, chunk cells at a time.
+    mean, count = sma(ts, values, rolling_window)
+    n = len(values)
+    result = np.empty(n)
+    if n == 0:
+        return result
+    left = np.arange(1, n + 1) - count
+    offsets = np.arange(int(count.max()))
+    rows = max(chunk//len(offsets), 1)
+    for start in range(0, n, rows):
+        end = min(start + rows, n)
+        index = left[start:end, None] + offsets
+        deviation = values[np.minimum(index, n - 1)] - mean[start:end, None]
+        deviation[offsets >= count[start:end, None]] = 0.0
+        result[start:end] = np.sqrt(np.einsum("ij,ij->i", deviation, deviation)/count[start:end])
+    return result
+
+
+def bollinger(ts, values, rolling_window, width = 2):
+    #(lower, middle, upper) arrays
+    middle, count = sma(ts, values, rolling_window)
+    std = rolling_std(ts, values, rolling_window)
+    return middle - width*std, middle, middle + width*std
+
+
+def wma(ts, values, rolling_window):
+    #sum of (j - left + 1)*x_j over each window, from prefix sums of x and j*x (relative to the first value to keep them small)
+    shift = values[0] if len(values) > 0 else 0
+    shifted = values - shift
+    index = np.arange(len(values))
+    totals = np.concatenate(([0.0], np.cumsum(shifted)))
+    weighted = np.concatenate(([0.0], np.cumsum(index*shifted)))
+    right = np.arange(1, len(ts) + 1)
+    left = np.searchsorted(ts, ts - rolling_window*60, side="left")
+    count = right - left
+    window_weighted = (weighted[right] - weighted[left]) - (left - 1)*(totals[right] - totals[left])
+    return window_weighted/(count*(count + 1)/2) + shift
+
+
+def ema(ts, values, span, chunk = 50):
+    '''
+    Vectorised EMA: within a chunk of chunk time constants the recursion has the closed form
+    ema_i = exp(-(t_i - t_c)/tau)*(ema_c + sum_j a_j*x_j*exp((t_j - t_c)/tau)), with a_j = 1 - exp(-(t_j - t_(j-1))/tau).
+    '''
+    tau = span*60.0
+    n = len(values)
+    result = np.empty(n)
+    if n == 0:
+        return result
+    alpha = np.concatenate(([0.0], -np.expm1(-np.diff(ts)/tau)))
+    result[0] = values[0]
+    start = 0
+    while start < n - 1:
+        end = int(np.searchsorted(ts, ts[start] + chunk*tau, side="right"))
+        if end <= start + 1:
+            #the next row is more than chunk time constants later, step over the gap with the recursion
+            result[start + 1] = result[start] + alpha[start + 1]*(values[start + 1] - result[start])
+            start = start + 1
+            continue
+        end = min(end, n)
+        growth = np.exp((ts[start + 1:end] - ts[start])/tau)
+        result[start + 1:end] = (result[start] + np.cumsum(alpha[start + 1:end]*values[start + 1:end]*growth))/growth
+        start = end - 1
+    return result
+
+
+def rsi(ts, values, period):
+    #nan for the first row, as the streaming RSI has no value before the first price change
+    result = np.full(len(values), np.nan)
+    if len(values) < 2:
+        return result
+    change = np.diff(values)
+    gains = ema(ts[1:], np.maximum(change, 0), period)
+    losses = ema(ts[1:], np.maximum(-change, 0), period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result[1:] = np.where(losses == 0, np.where(gains > 0, 100.0, 50.0), 100 - 100/(1 + gains/losses))
+    return result
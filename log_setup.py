@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+
+listener = None #the running QueueListener, one per process
+
+def parse_levels(value):
+    #"scraper=DEBUG, ccxt=WARNING" -> {"scraper": "DEBUG", "ccxt": "WARNING"}
+    levels = {}
+    for pair in value.split(","):
+        if pair.strip() == "":
+            continue
+        name, level = pair.split("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats each record as one JSON object per line, with the component (script) that wrote it.
+    '''
+
+    def __init__(self, component):
+        logging.Formatter.__init__(self)
+        self.component = component
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + "." + "%03d" % record.msecs,
+            'level': record.levelname,
+            'component': self.component,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        return json.dumps(entry)
+
+
+class EchoFormatter(logging.Formatter):
+    #the old text format, for the optional stdout echo
+    def __init__(self):
+        logging.Formatter.__init__(self, '[%(asctime)s] %(levelname)-8s %(name)-12s %(message)s')
+
+
+def setup_logging(component, config):
+    '''
+    Sends every log record of the process to a queue, so logging in the trading loop never waits on the disk. A background thread
+    writes the records to <log_dir>/<component>.log as JSON lines, rotating the file by size or time, and optionally echoes them to stdout.
+    Calling it again in the same process (e.g. paper trading several times) keeps the running setup.
+
+    Parameters:
+        component (str): name of the script, e.g. "scraper" or "mean_reversion". Used for the file name and the levels setting.
+        config (ConfigCache): config with a Logging Section
+    Returns:
+        the QueueListener writing the records
+    '''
+    global listener
+    if listener is not None:
+        return listener
+
+    #root level for this component, other names set the level of that logger (e.g. ccxt or websockets), other components' levels are unused
+    levels = parse_levels(config.get('Logging Section', 'levels'))
+    root = logging.getLogger()
+    root.setLevel(levels.pop(component, config.get('Logging Section', 'level').upper()))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    log_dir = config.get('Logging Section', 'log_dir')
+    os.makedirs(log_dir, exist_ok = True)
+    filename = os.path.join(log_dir, component + ".log")
+    backup_count = config.get('Logging Section', 'backup_count')
+    if config.get('Logging Section', 'rotate') == "time":
+        file_handler = logging.handlers.TimedRotatingFileHandler(filename, when = config.get('Logging Section', 'rotate_when'), backupCount = backup_count)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes = config.get('Logging Section', 'max_bytes'), backupCount = backup_count)
+    file_handler.setFormatter(JsonFormatter(component))
+    handlers = [file_handler]
+    if config.get('Logging Section', 'echo') == "on":
+        echo_handler = logging.StreamHandler(sys.stdout)
+        echo_handler.setFormatter(EchoFormatter())
+        handlers.append(echo_handler)
+
+    #the loop only formats the message (tracebacks included) and puts the record on the queue, the listener thread does the writing
+    records = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level = True)
+    listener.start()
+    atexit.register(listener.stop) #write out whatever is still queued on exit
+    return listener
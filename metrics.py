@@ -0,0 +1,186 @@
+import threading
+import logging
+import bisect
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+#latency buckets in seconds, from 1ms to 30s
+default_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+class Registry:
+    '''
+    Holds every metric of the process and renders them in the Prometheus text format.
+    '''
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {name} {help}".format(name = metric.name, help = metric.help))
+            lines.append("# TYPE {name} {type}".format(name = metric.name, type = metric.type))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+def format_labels(names, values, extra = ()):
+    pairs = list(zip(names, values)) + list(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labels = (), registry = registry):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {} #label values -> value
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def key(self, labels):
+        return tuple(labels.get(x, "") for x in self.labels)
+
+
+class Counter(Metric):
+    '''
+    A count that only goes up, e.g. requests sent or rows written.
+    '''
+    type = "counter"
+
+    def inc(self, amount = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [self.name + format_labels(self.labels, key) + " " + repr(float(value)) for key, value in values.items()]
+
+
+class Gauge(Counter):
+    '''
+    A value that can go up and down, e.g. portfolio value or the age of the oldest open order.
+    '''
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    '''
+    Counts observations (e.g. latencies in seconds) into cumulative buckets, with their sum and count.
+    '''
+    type = "histogram"
+
+    def __init__(self, name, help, labels = (), buckets = default_buckets, registry = registry):
+        self.buckets = sorted(buckets)
+        Metric.__init__(self, name, help, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0]*(len(self.buckets) + 1), 0.0, 0]
+            series[0][i] = series[0][i] + 1
+            series[1] = series[1] + value
+            series[2] = series[2] + 1
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self.lock:
+            values = {key: ([x for x in series[0]], series[1], series[2]) for key, series in self.values.items()}
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+                cumulative = cumulative + bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(self.name + "_bucket" + format_labels(self.labels, key, [("le", le)]) + " " + str(cumulative))
+            lines.append(self.name + "_sum" + format_labels(self.labels, key) + " " + repr(total))
+            lines.append(self.name + "_count" + format_labels(self.labels, key) + " " + str(count))
+        return lines
+
+
+class Timer:
+    #context manager that observes the seconds spent inside it
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass #scrapes would otherwise be written to stderr
+
+
+def start_http_server(port, host = "127.0.0.1"):
+    '''
+    Serves the metrics at http://host:port/metrics from a background thread. A port of 0 (or less) disables the endpoint.
+
+    Parameters:
+        port (int): port to listen on
+        host (str, optional): address to listen on. Defaults to "127.0.0.1" (local scrapes only).
+    Returns:
+        the server, or None if it is disabled or could not be started
+    '''
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logging.error("Could not start metrics endpoint on port " + str(port) + ": " + str(e))
+        return None
+    server.daemon_threads = True
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    logging.info("Serving metrics on http://" + host + ":" + str(port) + "/metrics")
+    return server
+
+
+#metrics of the trading loop, shared by both strategies and the strategy runtime
+phase_seconds = Histogram("trader_phase_seconds", "Time spent in each phase of a trading cycle", ["strategy", "currency_pair", "phase"])
+portfolio_value = Gauge("trader_portfolio_value_usd", "Fiat plus position value from the last cycle summary", ["strategy", "currency_pair"])
+trade_count = Gauge("trader_trades", "Completed buys, gains and losses", ["strategy", "currency_pair"])
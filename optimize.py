@@ -0,0 +1,216 @@
+import sqlite3
+import json
+import random
+import argparse
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from backtest import load_price_history
+from backtest import backtest_mean_reversion
+from backtest import backtest_sma_crossover
+
+
+parameter_names = {
+    "mean_reversion": ["rolling_window", "buy_threshold", "sell_threshold", "stop_loss", "buy_size"],
+    "sma_crossover": ["rolling_window_1", "rolling_window_2", "buy_size"],
+}
+
+#worker process state, set once per process by init_worker()
+worker_prices = None
+worker_cache = None
+worker_memory = None
+
+
+def parse_range(value):
+    '''
+    Parses a parameter range given on the command line: either a comma separated list ("0.95,0.97") or start:stop:step ("1000:6000:500", stop inclusive).
+
+    Returns:
+        list of values
+    '''
+    if ":" in value:
+        start, stop, step = [float(x) for x in value.split(":")]
+        values = list(np.arange(start, stop + step/2, step))
+    else:
+        values = [float(x) for x in value.split(",")]
+    return [int(x) if float(x).is_integer() else round(float(x), 10) for x in values]
+
+
+def build_grid(ranges, samples = None, seed = 0):
+    '''
+    Builds the list of parameter combinations to test.
+
+    Parameters:
+        ranges (dict): parameter name -> list of values
+        samples (int, optional): if given, test this many random combinations instead of the full grid. Defaults to None.
+        seed (int, optional): random seed for sampling. Defaults to 0.
+    Returns:
+        list of parameter dicts, sorted so combinations that share moving average windows run next to each other
+    '''
+    names = list(ranges.keys())
+    if samples is None:
+        grid = [dict(zip(names, values)) for values in itertools.product(*[ranges[x] for x in names])]
+    else:
+        rng = random.Random(seed)
+        grid = []
+        seen = set()
+        total = 1
+        for name in names:
+            total = total*len(ranges[name])
+        while len(grid) < min(samples, total):
+            values = tuple(rng.choice(ranges[x]) for x in names)
+            if values not in seen:
+                seen.add(values)
+                grid.append(dict(zip(names, values)))
+    grid.sort(key=lambda x: [x[name] for name in names])
+    return grid
+
+
+def share_prices(prices):
+    #copy the price arrays into one shared memory block that worker processes attach to instead of receiving a pickled copy
+    n = len(prices["ts"])
+    memory = shared_memory.SharedMemory(create=True, size=max(1, 4*n*8))
+    block = np.ndarray((4, n), dtype=np.float64, buffer=memory.buf)
+    for i, key in enumerate(["ts", "ask", "bid", "market"]):
+        block[i] = prices[key]
+    return memory
+
+
+def init_worker(memory_name, n):
+    global worker_prices, worker_cache, worker_memory
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    block = np.ndarray((4, n), dtype=np.float64, buffer=worker_memory.buf)
+    worker_prices = {"ts": block[0], "ask": block[1], "bid": block[2], "market": block[3]}
+    worker_cache = {}
+
+
+def run_shard(task):
+    '''
+    Backtests one shard of the grid inside a worker process.
+
+    Parameters:
+        task (tuple): (strategy, scraper_frequency, starting_capital, list of parameter dicts)
+    Returns:
+        list of (parameter dict, stats dict)
+    '''
+    strategy, scraper_frequency, starting_capital, shard = task
+    results = []
+    for parameters in shard:
+        if strategy == "mean_reversion":
+            result = backtest_mean_reversion(worker_prices, scraper_frequency=scraper_frequency, starting_capital=starting_capital, cache=worker_cache, **parameters)
+        else:
+            result = backtest_sma_crossover(worker_prices, scraper_frequency=scraper_frequency, starting_capital=starting_capital, cache=worker_cache, **parameters)
+        results.append((parameters, result["stats"]))
+    return results
+
+
+def open_results(results_file):
+    conn = sqlite3.connect(results_file)
+    conn.execute('''CREATE TABLE IF NOT EXISTS sweep_results (
+        strategy text,
+        currency_pair text,
+        parameters text,
+        trades integer,
+        hit_rate numeric,
+        total_return numeric,
+        max_drawdown numeric,
+        final_equity numeric,
+        PRIMARY KEY (strategy, currency_pair, parameters)
+        )''')
+    conn.commit()
+    return conn
+
+
+def parameter_sweep(
+        strategy,
+        currency_pair,
+        ranges,
+        samples = None,
+        processes = None,
+        shard_size = 64,
+        scraper_frequency = 5,
+        starting_capital = 10000,
+        db_file = "pricedata.db",
+        results_file = "sweep.db"
+):
+    '''
+    Backtests every parameter combination (or a random sample of them) across a process pool and streams the results into a
+    sqlite results table. Combinations already in the results table are skipped, so an interrupted sweep resumes where it stopped.
+
+    Parameters:
+        strategy (str): "mean_reversion" or "sma_crossover"
+        currency_pair (str): the currency pair to backtest, e.g. "BTC/USD"
+        ranges (dict): parameter name -> list of values
+        samples (int, optional): number of random combinations to test instead of the full grid. Defaults to None.
+        processes (int, optional): number of worker processes. Defaults to the number of CPU cores.
+        shard_size (int, optional): combinations per task sent to a worker. Defaults to 64.
+        scraper_frequency (int, optional): how often the scraper collected data, in minutes. Defaults to 5.
+        starting_capital (float, optional): fiat balance at the start of each backtest. Defaults to 10000.
+        db_file (str, optional): path to the price database. Defaults to "pricedata.db".
+        results_file (str, optional): path to the results database. Defaults to "sweep.db".
+    Returns:
+        list of the best 20 results as (parameters, total_return, hit_rate, trades, max_drawdown)
+    '''
+    conn = open_results(results_file)
+    done = set(x[0] for x in conn.execute("SELECT parameters FROM sweep_results WHERE strategy = ? AND currency_pair = ?", (strategy, currency_pair)))
+    grid = [x for x in build_grid(ranges, samples) if json.dumps(x, sort_keys=True) not in done]
+    print("Testing", len(grid), "parameter combinations (" + str(len(done)) + " already done)")
+
+    if len(grid) > 0:
+        prices = load_price_history(currency_pair, db_file)
+        memory = share_prices(prices)
+        shards = [(strategy, scraper_frequency, starting_capital, grid[i:i + shard_size]) for i in range(0, len(grid), shard_size)]
+        try:
+            with multiprocessing.Pool(processes, initializer=init_worker, initargs=(memory.name, len(prices["ts"]))) as pool:
+                completed = 0
+                for results in pool.imap_unordered(run_shard, shards):
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO sweep_results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(strategy, currency_pair, json.dumps(parameters, sort_keys=True), stats["trades"], stats["hit_rate"],
+                          stats["total_return"], stats["max_drawdown"], stats["final_equity"]) for parameters, stats in results])
+                    conn.commit()
+                    completed = completed + len(results)
+                    print("Completed", completed, "of", len(grid))
+        finally:
+            memory.close()
+            memory.unlink()
+
+    ranking = conn.execute(
+        "SELECT parameters, total_return, hit_rate, trades, max_drawdown FROM sweep_results WHERE strategy = ? AND currency_pair = ? "
+        "ORDER BY total_return DESC LIMIT 20", (strategy, currency_pair)).fetchall()
+    conn.close()
+    return ranking
+
+
+if __name__ == "__main__":
+    #python3 optimize.py mean_reversion BTC --rolling_window 1000:10000:1000 --buy_threshold 0.95:0.99:0.01 --sell_threshold 1.01:1.05:0.01 --stop_loss 0.85,0.9 --buy_size 1
+    #python3 optimize.py sma_crossover BTC --rolling_window_1 600:6000:300 --rolling_window_2 60:3000:60 --buy_size 0.9 --samples 2000
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep for the trading strategies")
+    parser.add_argument("strategy", choices=list(parameter_names.keys()))
+    parser.add_argument("coin")
+    for name in sorted(set(itertools.chain(*parameter_names.values()))):
+        parser.add_argument("--" + name, type=parse_range)
+    parser.add_argument("--samples", type=int, help="test this many random combinations instead of the full grid")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--scraper_frequency", type=float, default=5)
+    parser.add_argument("--results", default="sweep.db")
+    args = parser.parse_args()
+
+    ranges = {}
+    for name in parameter_names[args.strategy]:
+        if getattr(args, name) is None:
+            parser.error("--" + name + " is required for " + args.strategy)
+        ranges[name] = getattr(args, name)
+
+    ranking = parameter_sweep(
+        args.strategy,
+        "{coin}/USD".format(coin = args.coin),
+        ranges,
+        samples = args.samples,
+        processes = args.processes,
+        scraper_frequency = args.scraper_frequency,
+        results_file = args.results
+    )
+    for parameters, total_return, hit_rate, trades, max_drawdown in ranking:
+        print(parameters, "return:", round(total_return*100, 2), "% hit rate:", hit_rate, "trades:", trades, "max drawdown:", round(max_drawdown*100, 2), "%")
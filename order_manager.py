@@ -0,0 +1,204 @@
+import threading
+import logging
+import time
+import ccxt
+import metrics
+
+
+#ccxt order status -> lifecycle state, open orders with a partial fill are "partially_filled"
+order_states = {
+    'open': "placed",
+    'closed': "filled",
+    'canceled': "cancelled",
+    'expired': "expired",
+    'rejected': "expired",
+}
+
+open_orders_count = metrics.Gauge("open_orders", "Orders placed and not yet filled, cancelled or expired", ["symbol"])
+oldest_order_age = metrics.Gauge("oldest_open_order_age_seconds", "Seconds since the oldest open order was placed", ["symbol"])
+order_events = metrics.Counter("order_state_changes_total", "Order state changes seen by the order manager", ["state"])
+
+class OrderManager:
+    '''
+    Tracks the orders placed by one or more strategies through placed, partially_filled, filled, cancelled and expired, using the
+    exchange's order status rather than balances. Orders still open after timeout seconds are cancelled and marked expired.
+    Every state change is passed to the owning strategy's order_update() method.
+
+    Parameters:
+        exchange: ccxt-compatible exchange the orders are placed on
+        timeout (float, optional): seconds an order may stay open before it is cancelled. Defaults to 1800 (30 minutes).
+        clock (optional): object providing time(), e.g. a VirtualClock for paper trading. Defaults to the time module.
+    '''
+
+    def __init__(self, exchange, timeout = 1800, clock = time):
+        self.exchange = exchange
+        self.timeout = timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.orders = {} #order id -> tracked order
+        self.symbols = set() #symbols with reported open order metrics, so they drop back to 0 once their orders close
+
+    def place(self, owner, side, symbol, amount, price):
+        '''
+        Places a limit order and starts tracking it.
+
+        Parameters:
+            owner: strategy whose order_update() receives the order's state changes
+            side (str): "buy" or "sell"
+            symbol (str): currency pair, e.g. "BTC/USD"
+            amount (float): amount of the base currency
+            price (float): limit price
+        Returns:
+            the exchange's order response
+        '''
+        if side == 'buy':
+            response = self.exchange.create_limit_buy_order(symbol, amount, price)
+        else:
+            response = self.exchange.create_limit_sell_order(symbol, amount, price)
+        order = {
+            'id': response['id'],
+            'owner': owner,
+            'symbol': symbol,
+            'side': side,
+            'amount': response.get('amount') or amount, #the exchange (or an ExchangeRouter) may have placed less than asked
+            'price': price,
+            'filled': 0.0,
+            'state': "placed",
+            'placed_at': self.clock.time(),
+        }
+        with self.lock:
+            self.orders[order['id']] = order
+        logging.debug("Tracking " + side + " order " + str(order['id']) + " for " + symbol)
+        return response
+
+    def track(self, owner, order):
+        '''
+        Resumes tracking an order placed before a restart, e.g. from a checkpoint written by tracked().
+
+        Parameters:
+            owner: strategy whose order_update() receives the order's state changes
+            order (dict): the order as returned by tracked()
+        Returns:
+            None
+        '''
+        order = dict(order, owner = owner)
+        with self.lock:
+            self.orders[order['id']] = order
+        logging.debug("Resumed tracking " + order['side'] + " order " + str(order['id']) + " for " + order['symbol'])
+
+    def tracked(self, order_id):
+        #copy of a tracked order without its owner, so it can be checkpointed
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            return {key: value for key, value in order.items() if key != 'owner'}
+
+    def untracked(self, symbol):
+        '''
+        Lists the open orders on the exchange for symbol that are not being tracked.
+
+        Parameters:
+            symbol (str): currency pair, e.g. "BTC/USD"
+        Returns:
+            list of the exchange's order responses, empty if the exchange cannot list open orders or the request fails
+        '''
+        if not self.exchange.has.get('fetchOpenOrders'):
+            return []
+        try:
+            open_orders = self.exchange.fetch_open_orders(symbol)
+        except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+            logging.error("fetch_open_orders failed for " + symbol + ": " + str(e))
+            return []
+        with self.lock:
+            return [x for x in open_orders if x['id'] not in self.orders]
+
+    def open_orders(self, owner = None):
+        with self.lock:
+            return [x for x in self.orders.values() if x['state'] in ("placed", "partially_filled") and (owner is None or x['owner'] is owner)]
+
+    def fetch_states(self, orders):
+        #batch by symbol with fetch_open_orders where the exchange supports it, orders missing from that list are looked up one by one
+        responses = {}
+        if self.exchange.has.get('fetchOpenOrders'):
+            for symbol in set(x['symbol'] for x in orders):
+                try:
+                    responses.update({x['id']: x for x in self.exchange.fetch_open_orders(symbol)})
+                except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+                    logging.error("fetch_open_orders failed for " + symbol + ": " + str(e))
+                    return responses
+        for order in orders:
+            if order['id'] not in responses:
+                try:
+                    responses[order['id']] = self.exchange.fetch_order(order['id'], order['symbol'])
+                except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+                    logging.error("fetch_order failed for order " + str(order['id']) + ": " + str(e))
+        return responses
+
+    def update(self, order, response, state = None):
+        if state is None:
+            state = order_states.get(response.get('status'), order['state'])
+            if state == "placed" and (response.get('filled') or 0) > 0:
+                state = "partially_filled"
+        filled = response.get('filled')
+        changed = state != order['state'] or (filled is not None and filled != order['filled'])
+        if filled is not None:
+            order['filled'] = filled
+        order['state'] = state
+        if changed:
+            order_events.inc(state = state)
+            logging.info("Order " + str(order['id']) + " " + order['side'] + " " + order['symbol'] + ": " + state + ", filled " + str(order['filled']) + " of " + str(order['amount']))
+            if hasattr(self.exchange, 'invalidate'):
+                self.exchange.invalidate() #balances changed with the fill
+            order['owner'].order_update(order)
+        if state in ("filled", "cancelled", "expired"):
+            with self.lock:
+                self.orders.pop(order['id'], None)
+
+    def poll(self, owner = None):
+        '''
+        Refreshes the state of the open orders (of one owner, or all of them) and cancels the ones that have timed out.
+        Network and exchange errors are logged and the orders are checked again on the next poll.
+
+        Parameters:
+            owner (optional): only poll this strategy's orders. Defaults to None (all orders).
+        Returns:
+            None
+        '''
+        orders = self.open_orders(owner)
+        if len(orders) == 0:
+            self.report()
+            return
+        responses = self.fetch_states(orders)
+        for order in orders:
+            if order['id'] in responses:
+                self.update(order, responses[order['id']])
+
+        #cancel orders that have been open for longer than the timeout so the strategy can adjust the price
+        now = self.clock.time()
+        for order in self.open_orders(owner):
+            if now - order['placed_at'] < self.timeout:
+                continue
+            try:
+                response = self.exchange.cancel_order(order['id'], order['symbol'])
+                self.update(order, response, "expired")
+            except ccxt.OrderNotFound:
+                #filled or cancelled since the last check, pick up its final state
+                response = self.fetch_states([order]).get(order['id'])
+                if response is not None:
+                    self.update(order, response)
+            except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+                logging.error("cancel_order failed for order " + str(order['id']) + ": " + str(e))
+        self.report()
+
+    def report(self):
+        #publish the number and age of the open orders of every strategy, per symbol
+        now = self.clock.time()
+        with self.lock:
+            self.symbols.update(x['symbol'] for x in self.orders.values())
+            symbols = list(self.symbols)
+            orders = [x for x in self.orders.values() if x['state'] in ("placed", "partially_filled")]
+        for symbol in symbols:
+            ages = [now - x['placed_at'] for x in orders if x['symbol'] == symbol]
+            open_orders_count.set(len(ages), symbol = symbol)
+            oldest_order_age.set(max(ages) if len(ages) > 0 else 0, symbol = symbol)
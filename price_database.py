@@ -0,0 +1,240 @@
+import sqlite3
+import logging
+import sys
+import time
+from candles import create_candle_table
+from candles import update_candles
+from candles import rebuild_candles
+import metrics
+
+
+flush_seconds = metrics.Histogram("price_writer_flush_seconds", "Time to write one batch of rows and their candles")
+rows_written = metrics.Counter("price_writer_rows_total", "Rows written to price_data", ["currency_pair"])
+rows_per_second = metrics.Gauge("price_writer_rows_per_second", "Rows written per second since the previous flush")
+
+
+#sql expression that converts the old "%d/%m/%Y %H:%M:%S" local time strings into epoch seconds
+date_time_to_ts = (
+    "CAST(strftime('%s', substr(date_time, 7, 4) || '-' || substr(date_time, 4, 2) || '-' || substr(date_time, 1, 2)"
+    " || ' ' || substr(date_time, 12, 8), 'utc') AS integer)")
+
+def create_tables(c, table = "price_data"):
+    '''
+    Creates the price table (v2 schema: integer epoch timestamps), its (currency_pair, ts) index, the candle table and the per exchange
+    venue_prices table if they do not exist.
+
+    Parameters:
+        c: sqlite cursor
+        table (str, optional): name of the table to create. Defaults to "price_data".
+    Returns:
+        None
+    '''
+    c.execute('''CREATE TABLE IF NOT EXISTS {table} (
+        ts integer,
+        currency_pair text,
+        ask_price numeric,
+        bid_price numeric,
+        market_price numeric
+        )'''.format(table = table))
+    if table == "price_data":
+        c.execute("CREATE INDEX IF NOT EXISTS price_data_pair_ts ON price_data (currency_pair, ts)")
+        create_candle_table(c)
+        #quotes of each exchange behind the consolidated price_data rows, only written when the scraper polls several exchanges
+        c.execute('''CREATE TABLE IF NOT EXISTS venue_prices (
+            ts integer,
+            currency_pair text,
+            exchange text,
+            ask_price numeric,
+            bid_price numeric,
+            market_price numeric
+            )''')
+        c.execute("CREATE INDEX IF NOT EXISTS venue_prices_pair_ts ON venue_prices (currency_pair, ts)")
+
+
+def get_columns(c, table = "price_data"):
+    return [x[1] for x in c.execute("PRAGMA table_info({table})".format(table = table))]
+
+
+def configure_connection(conn, cache_size = 20000):
+    '''
+    Puts the database in WAL mode so the scraper's writes and the traders' reads do not block each other,
+    and tunes the pragmas for a single frequent writer.
+
+    Parameters:
+        conn: sqlite3.Connection
+        cache_size (int, optional): page cache size in KiB. Defaults to 20000.
+    Returns:
+        None
+    '''
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL") #only takes effect on a new database, retention.py converts older ones
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL") #in WAL mode this only syncs on checkpoints, a crash can lose the last commits but not corrupt the db
+    conn.execute("PRAGMA cache_size = -{cache_size}".format(cache_size = cache_size))
+
+
+def connect_database(db_file = "pricedata.db"):
+    '''
+    Opens the price database and makes sure it uses the v2 schema.
+
+    Parameters:
+        db_file (str, optional): path to the sqlite database. Defaults to "pricedata.db".
+    Returns:
+        sqlite3.Connection
+    '''
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    if "date_time" in get_columns(c):
+        conn.close()
+        raise RuntimeError("{db_file} uses the old date_time schema, run: python3 price_database.py {db_file}".format(db_file = db_file))
+    configure_connection(conn)
+    create_tables(c)
+    conn.commit()
+    return conn
+
+
+class PriceWriter:
+    '''
+    Buffers price_data rows and writes them with executemany in one transaction once the buffer reaches batch_size rows
+    or flush_interval seconds have passed since the last write. The candle tables are updated in the same transaction.
+
+    Parameters:
+        db_file (str, optional): path to the sqlite database. Defaults to "pricedata.db".
+        batch_size (int, optional): number of buffered rows that triggers a write. Defaults to 500.
+        flush_interval (float, optional): seconds after which buffered rows are written regardless of count. Defaults to 60.
+        resolutions (list, optional): candle lengths to maintain, in minutes. Defaults to [1, 5, 60, 1440].
+        rings (RingPublisher, optional): also publishes every row to shared memory as soon as it is added, for traders on the same host. Defaults to None.
+    '''
+
+    def __init__(self, db_file = "pricedata.db", batch_size = 500, flush_interval = 60, resolutions = [1, 5, 60, 1440], rings = None):
+        self.conn = connect_database(db_file)
+        self.rings = rings
+        self.c = self.conn.cursor()
+        self.resolutions = resolutions
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.quotes = [] #venue_prices rows, written with the buffer
+        self.last_flush = time.monotonic()
+
+    def add(self, entries, quotes = []):
+        '''
+        Queues (ts, currency_pair, ask_price, bid_price, market_price) rows and writes them if a threshold has been reached.
+
+        Parameters:
+            entries (list): rows to insert
+            quotes (list, optional): (ts, currency_pair, exchange, ask_price, bid_price, market_price) rows of the exchanges the entries were consolidated from. Defaults to [].
+        Returns:
+            None
+        '''
+        if self.rings is not None:
+            self.rings.publish(entries)
+        self.buffer.extend(entries)
+        self.quotes.extend(quotes)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            with flush_seconds.time():
+                with self.conn:
+                    self.c.executemany("INSERT INTO price_data VALUES (?, ?, ?, ?, ?)", self.buffer)
+                    self.c.executemany("INSERT INTO venue_prices VALUES (?, ?, ?, ?, ?, ?)", self.quotes)
+                    update_candles(self.c, self.buffer, self.resolutions)
+            for entry in self.buffer:
+                rows_written.inc(currency_pair = entry[1])
+            rows_per_second.set(len(self.buffer)/max(time.monotonic() - self.last_flush, 0.001))
+            logging.debug("Wrote " + str(len(self.buffer)) + " rows to the database")
+            self.buffer = []
+            self.quotes = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        if self.rings is not None:
+            self.rings.close()
+
+
+def get_tables(c):
+    return [x[0] for x in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+
+def swap_tables(conn):
+    #replace price_data with the migrated rows in one transaction (sqlite3 does not open one for DDL), then build the index and candles
+    c = conn.cursor()
+    c.execute("BEGIN")
+    try:
+        if "price_data" in get_tables(c):
+            c.execute("DROP TABLE price_data")
+        c.execute("ALTER TABLE price_data_v2 RENAME TO price_data")
+        create_tables(c)
+    except:
+        conn.rollback()
+        raise
+    conn.commit()
+    print("Building candles")
+    rebuild_candles(conn)
+
+
+def migrate_database(db_file = "pricedata.db", batch_size = 500000):
+    '''
+    Converts an existing price database from the old date_time text schema to the v2 schema in place.
+    Rows are copied in rowid batches with one transaction per batch and the tables are swapped in one transaction, so an
+    interrupted migration can be resumed by running it again.
+
+    Parameters:
+        db_file (str, optional): path to the sqlite database. Defaults to "pricedata.db".
+        batch_size (int, optional): number of rowids to copy per transaction. Defaults to 500000.
+    Returns:
+        None
+    '''
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.execute("PRAGMA synchronous = NORMAL")
+
+    if "price_data" not in get_tables(c) and "price_data_v2" in get_tables(c):
+        #every row was copied but the swap did not finish (databases migrated before the swap was one transaction)
+        print("Finishing the migration of", db_file)
+        logging.info("Finishing the migration of " + db_file)
+        swap_tables(conn)
+        conn.close()
+        print("Migration complete")
+        logging.info("Migration complete")
+        return
+
+    if "date_time" not in get_columns(c):
+        print("Database already uses the v2 schema")
+        logging.info("Database already uses the v2 schema")
+        create_tables(c)
+        conn.commit()
+        conn.close()
+        return
+
+    create_tables(c, "price_data_v2")
+    conn.commit()
+
+    #resume from wherever the last run stopped
+    last_rowid = c.execute("SELECT COALESCE(MAX(rowid), 0) FROM price_data_v2").fetchone()[0]
+    max_rowid = c.execute("SELECT COALESCE(MAX(rowid), 0) FROM price_data").fetchone()[0]
+    print("Migrating", db_file, "from rowid", last_rowid, "to", max_rowid)
+    logging.info("Migrating " + db_file + " from rowid " + str(last_rowid) + " to " + str(max_rowid))
+
+    while last_rowid < max_rowid:
+        c.execute(
+            "INSERT INTO price_data_v2 (rowid, ts, currency_pair, ask_price, bid_price, market_price) "
+            "SELECT rowid, " + date_time_to_ts + ", currency_pair, ask_price, bid_price, market_price "
+            "FROM price_data WHERE rowid > ? AND rowid <= ?", (last_rowid, last_rowid + batch_size))
+        conn.commit()
+        last_rowid = last_rowid + batch_size
+        print("Migrated up to rowid", min(last_rowid, max_rowid))
+        logging.debug("Migrated up to rowid " + str(min(last_rowid, max_rowid)))
+
+    #swap the tables and build the index once all rows are in
+    swap_tables(conn)
+    conn.close()
+    print("Migration complete")
+    logging.info("Migration complete")
+
+
+if __name__ == "__main__":
+    migrate_database(db_file = sys.argv[1] if len(sys.argv) > 1 else "pricedata.db")
@@ -0,0 +1,338 @@
+import time
+import random
+import logging
+import numpy as np
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+from rolling_window import PriceFeed
+
+
+#header: 8 uint64 fields (one cache line) in front of the ts, ask, bid and mid columns
+magic = 0x474e495245434952 #"PRICERNG"
+MAGIC, CAPACITY, SEQUENCE, WRITTEN, GENERATION = range(5)
+header_size = 8*8
+columns = ["ts", "ask", "bid", "mid"]
+
+def ring_name(currency_pair, prefix = "crypto_trader"):
+    #e.g. crypto_trader_BTC-USD, shows up as /dev/shm/crypto_trader_BTC-USD on Linux
+    return prefix + "_" + currency_pair.replace("/", "-")
+
+
+def untrack(memory):
+    #the resource tracker would unlink the block when this process exits, but it belongs to the scraper and outlives its readers
+    try:
+        resource_tracker.unregister(memory._name, "shared_memory")
+    except Exception:
+        pass
+
+
+class PriceRing:
+    '''
+    Fixed size ring buffer of one currency pair's latest rows in shared memory, written by the scraper and read by the traders on
+    the same host without touching the database. The header holds the capacity, the number of rows ever written (the write
+    position is written % capacity) and a sequence counter that is odd while a write is in progress, so readers can check without
+    a lock that the rows they read were not overwritten meanwhile. Rows are stored as packed float64 columns.
+
+    Use create_ring() in the scraper and attach_ring() in the traders.
+
+    Parameters:
+        memory (SharedMemory): the block holding the ring
+    '''
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.header = np.ndarray((8,), dtype=np.uint64, buffer=memory.buf)
+        self.capacity = int(self.header[CAPACITY])
+        self.generation = int(self.header[GENERATION])
+        self.data = np.ndarray((len(columns), self.capacity), dtype=np.float64, buffer=memory.buf, offset=header_size)
+
+    def publish(self, rows):
+        '''
+        Appends rows, overwriting the oldest ones once the ring is full. Only one process may write to a ring.
+
+        Parameters:
+            rows (list): (ts, ask_price, bid_price, market_price) rows in time order
+        Returns:
+            None
+        '''
+        total = len(rows)
+        rows = rows[-self.capacity:] #a batch longer than the ring only leaves its newest rows
+        if total == 0:
+            return
+        block = np.array(rows, dtype=np.float64).T
+        written = int(self.header[WRITTEN])
+        position = (written + total - len(rows)) % self.capacity
+        length = min(len(rows), self.capacity - position) #rows that fit before the end of the ring, the rest wrap around to the start
+        self.header[SEQUENCE] = self.header[SEQUENCE] + 1 #odd: write in progress
+        self.data[:, position:position + length] = block[:, :length]
+        self.data[:, :len(rows) - length] = block[:, length:]
+        self.header[WRITTEN] = written + total
+        self.header[SEQUENCE] = self.header[SEQUENCE] + 1
+
+    def snapshot(self):
+        '''
+        Returns:
+            (written, sequence) read consistently, waiting out a write in progress
+        '''
+        while True:
+            sequence = int(self.header[SEQUENCE])
+            if sequence % 2 == 0:
+                written = int(self.header[WRITTEN])
+                if int(self.header[SEQUENCE]) == sequence:
+                    return written, sequence
+            time.sleep(0)
+
+    def view(self, start, end):
+        '''
+        Zero-copy views of the rows at positions [start, end) (counted from the first row ever written).
+
+        Returns:
+            list of one or two (4, n) arrays of ts, ask, bid and mid, two when the rows wrap around the end of the ring
+        '''
+        if end <= start:
+            return []
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return [self.data[:, first:last]]
+        return [self.data[:, first:], self.data[:, :last - self.capacity]]
+
+    def unchanged(self, sequence):
+        #True if nothing was written since snapshot() returned sequence, i.e. views taken since then were consistent
+        return int(self.header[SEQUENCE]) == sequence
+
+    def read(self, start):
+        '''
+        Copies the ts and mid columns of the rows from position start to the newest one, retrying if a write overlaps the read.
+        The copy is taken from the views in one step each and is needed because the scraper may overwrite the rows afterwards.
+
+        Returns:
+            (first, written, ts array, mid array): first is the position of the first row returned, later than start if those
+            rows were already overwritten
+        '''
+        while True:
+            written, sequence = self.snapshot()
+            first = max(start, written - self.capacity)
+            blocks = self.view(first, written)
+            if blocks:
+                ts = np.concatenate([block[0] for block in blocks])
+                mid = np.concatenate([block[3] for block in blocks])
+            else:
+                ts = np.empty(0)
+                mid = np.empty(0)
+            if self.unchanged(sequence):
+                return first, written, ts, mid
+
+    def close(self):
+        self.header = None
+        self.data = None
+        self.memory.close()
+
+
+def create_ring(currency_pair, capacity = 65536, prefix = "crypto_trader"):
+    '''
+    Creates the ring of a currency pair, or reuses the one left behind by a scraper that did not shut down cleanly so attached
+    traders keep reading from it.
+
+    Parameters:
+        currency_pair (str): e.g. "BTC/USD"
+        capacity (int, optional): number of rows kept. Defaults to 65536 (about 227 days of 5 minute rows).
+        prefix (str, optional): shared memory name prefix. Defaults to "crypto_trader".
+    Returns:
+        PriceRing
+    '''
+    name = ring_name(currency_pair, prefix)
+    size = header_size + len(columns)*capacity*8
+    try:
+        memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+    except FileExistsError:
+        memory = shared_memory.SharedMemory(name = name)
+        header = np.ndarray((8,), dtype=np.uint64, buffer=memory.buf)
+        if memory.size >= size and int(header[MAGIC]) == magic and int(header[CAPACITY]) == capacity:
+            if int(header[SEQUENCE]) % 2 == 1:
+                header[SEQUENCE] = header[SEQUENCE] + 1 #the last write was interrupted, its rows are still readable
+            del header
+            untrack(memory)
+            logging.info("Reusing price ring " + name)
+            return PriceRing(memory)
+        #a different capacity, replace it (attached readers notice the new generation)
+        del header
+        memory.close()
+        memory.unlink()
+        memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+    untrack(memory)
+    header = np.ndarray((8,), dtype=np.uint64, buffer=memory.buf)
+    header[:] = 0
+    header[CAPACITY] = capacity
+    header[GENERATION] = random.getrandbits(63)
+    header[MAGIC] = magic #written last, attach_ring() ignores the ring until it is set
+    del header
+    logging.info("Created price ring " + name + " for " + str(capacity) + " rows")
+    return PriceRing(memory)
+
+
+def attach_ring(currency_pair, prefix = "crypto_trader"):
+    '''
+    Attaches to the ring the scraper publishes a currency pair to.
+
+    Returns:
+        PriceRing, or None if the scraper has not created one
+    '''
+    try:
+        memory = shared_memory.SharedMemory(name = ring_name(currency_pair, prefix))
+    except (FileNotFoundError, ValueError):
+        return None
+    untrack(memory)
+    header = np.ndarray((8,), dtype=np.uint64, buffer=memory.buf)
+    ready = memory.size >= header_size and int(header[MAGIC]) == magic
+    del header
+    if not ready:
+        memory.close()
+        return None
+    return PriceRing(memory)
+
+
+class RingPublisher:
+    '''
+    Publishes price_data rows to one PriceRing per currency pair, creating the rings as pairs first appear. Used by PriceWriter
+    so rows reach the traders as soon as they are scraped, before they are batched into the database.
+
+    Parameters:
+        capacity (int, optional): rows kept per pair. Defaults to 65536.
+        prefix (str, optional): shared memory name prefix. Defaults to "crypto_trader".
+    '''
+
+    def __init__(self, capacity = 65536, prefix = "crypto_trader"):
+        self.capacity = capacity
+        self.prefix = prefix
+        self.rings = {}
+
+    def publish(self, entries):
+        #entries are (ts, currency_pair, ask_price, bid_price, market_price) rows
+        rows = {}
+        for ts, currency_pair, best_ask, best_bid, market_price in entries:
+            rows.setdefault(currency_pair, []).append((ts, best_ask, best_bid, market_price))
+        for currency_pair in rows:
+            if currency_pair not in self.rings:
+                self.rings[currency_pair] = create_ring(currency_pair, self.capacity, self.prefix)
+            self.rings[currency_pair].publish(rows[currency_pair])
+
+    def close(self):
+        #remove the rings, attached traders fall back to the database until a scraper creates them again
+        for ring in self.rings.values():
+            memory = ring.memory
+            ring.close()
+            resource_tracker.register(memory._name, "shared_memory") #unlink() unregisters it again
+            memory.unlink()
+        self.rings = {}
+
+
+class RingFeed(PriceFeed):
+    '''
+    PriceFeed that reads new rows from the scraper's PriceRing instead of the database. The windows are built from the ring when
+    it reaches back far enough, otherwise from the database, and after that each update reads only the rows published since the
+    last one. The database is only queried again if the ring cannot continue without a gap: rows were overwritten before they
+    were read, or the scraper was restarted with a new ring.
+
+    Parameters:
+        cursor: sqlite cursor connected to the price database
+        currency_pair (str): the currency pair to read, e.g. "BTC/USD"
+        windows (list): RollingWindow objects to keep up to date
+        prefix (str, optional): shared memory name prefix. Defaults to "crypto_trader".
+    '''
+
+    def __init__(self, cursor, currency_pair, windows, prefix = "crypto_trader"):
+        PriceFeed.__init__(self, cursor, currency_pair, windows)
+        self.prefix = prefix
+        self.ring = attach_ring(currency_pair, prefix)
+        self.position = None #position of the next ring row to read, None until the windows are in step with the ring
+        self.ring_rows = 0 #rows read from the ring
+        self.database_rows = 0 #rows read from the database
+
+    def reattach(self):
+        #pick up a ring created (or re-created) by the scraper since the last check
+        ring = attach_ring(self.currency_pair, self.prefix)
+        if ring is None:
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = None
+            self.position = None
+        elif self.ring is None or ring.generation != self.ring.generation:
+            if self.ring is not None:
+                self.ring.close()
+            logging.info("Attached to price ring " + ring_name(self.currency_pair, self.prefix))
+            self.ring = ring
+            self.position = None
+        else:
+            ring.close()
+
+    def add(self, ts, market_price, count_new_rows):
+        self.last_ts = ts
+        if count_new_rows:
+            self.rows_seen = self.rows_seen + 1
+        for window in self.windows:
+            window.add(ts, market_price)
+
+    def update(self, now = None):
+        '''
+        Ingests new rows from the ring (or the database, see above) and evicts points that have left each window.
+
+        Parameters:
+            now (float, optional): the current epoch time in seconds. Defaults to time.time().
+        Returns:
+            None
+        '''
+        if now is None:
+            now = time.time()
+        if self.rows_seen is None:
+            self.rows_seen = self.cursor.execute("SELECT COUNT(*) FROM price_data WHERE currency_pair = ? AND ts <= ?", (self.currency_pair, now)).fetchone()[0]
+            count_new_rows = False
+        else:
+            count_new_rows = True
+        timethreshold = now - max(window.timediff for window in self.windows)
+        if self.ring is None or (self.position is not None and self.ring.snapshot()[0] == self.position):
+            self.reattach() #no ring yet, or nothing new: check the scraper has not (re)created it before reading
+
+        if self.ring is not None:
+            first, written, ts, mid = self.ring.read(self.position if self.position is not None else 0)
+            if self.position is None:
+                if self.last_ts is None and len(ts) > 0 and ts[0] <= timethreshold:
+                    self.position = first #the ring covers the whole window, the database is not needed
+            elif first > self.position:
+                logging.warning(self.currency_pair + ": " + str(first - self.position) + " rows were overwritten in the price ring before they were read, reading them from the database")
+                self.position = None
+
+        if self.position is None:
+            #catch up from the database, then continue with the ring rows that are newer than its last row
+            if self.last_ts is None:
+                rows = self.cursor.execute(
+                    "SELECT ts, market_price FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts <= ? ORDER BY ts, rowid",
+                    (self.currency_pair, timethreshold, now)).fetchall()
+            else:
+                rows = self.cursor.execute(
+                    "SELECT ts, market_price FROM price_data WHERE currency_pair = ? AND ts > ? AND ts <= ? ORDER BY ts, rowid",
+                    (self.currency_pair, self.last_ts, now)).fetchall()
+            for row_ts, market_price in rows:
+                if row_ts >= timethreshold:
+                    self.add(row_ts, market_price, count_new_rows)
+                elif count_new_rows:
+                    self.rows_seen = self.rows_seen + 1 #older than the window after a gap, counted like PriceFeed does but not added
+            self.database_rows = self.database_rows + len(rows)
+            if self.ring is not None:
+                self.position = first
+
+        if self.ring is not None:
+            #the rows are in time order, so the ones up to now that are new and inside the window are one slice
+            ts = ts[self.position - first:]
+            mid = mid[self.position - first:]
+            read = int(np.searchsorted(ts, now, side="right"))
+            new = int(np.searchsorted(ts[:read], self.last_ts, side="right")) if self.last_ts is not None else 0
+            start = max(new, int(np.searchsorted(ts[:read], timethreshold, side="left")))
+            if count_new_rows:
+                self.rows_seen = self.rows_seen + start - new #new rows older than the window are counted but not added
+            for row_ts, market_price in zip(ts[start:read].tolist(), mid[start:read].tolist()):
+                self.add(row_ts, market_price, count_new_rows)
+            self.position = self.position + read
+            self.ring_rows = self.ring_rows + read
+        for window in self.windows:
+            window.evict(now)
@@ -0,0 +1,152 @@
+import threading
+import logging
+import random
+import time
+import ccxt
+import metrics
+
+
+#requests per second and burst size of Coinbase Exchange's public and private endpoints
+coinbase_limits = {
+    'public': (10, 15),
+    'private': (15, 30),
+}
+
+#endpoint each ccxt method counts against, methods not listed here are passed through untouched
+endpoints = {
+    'fetch_ticker': 'public',
+    'fetch_tickers': 'public',
+    'fetch_ohlcv': 'public',
+    'fetch_trades': 'public',
+    'fetch_balance': 'private',
+    'fetch_order': 'private',
+    'fetch_open_orders': 'private',
+    'create_order': 'private',
+    'create_limit_buy_order': 'private',
+    'create_limit_sell_order': 'private',
+    'cancel_order': 'private',
+}
+
+request_seconds = metrics.Histogram("exchange_request_seconds", "Latency of each request sent to the exchange", ["method"])
+request_errors = metrics.Counter("exchange_errors_total", "Failed exchange requests by error type", ["method", "error"])
+request_retries = metrics.Counter("exchange_retries_total", "Exchange requests retried after a network error", ["method"])
+
+#placing an order again after a network error could place it twice, so these are only ever sent once
+not_retried = {'create_order', 'create_limit_buy_order', 'create_limit_sell_order'}
+
+class TokenBucket:
+    '''
+    Allows rate requests per second on average and up to burst requests at once.
+
+    Parameters:
+        rate (float): tokens added per second
+        burst (int): bucket size
+        clock (optional): object providing monotonic() and sleep(). Defaults to the time module.
+    '''
+
+    def __init__(self, rate, burst, clock = time):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline = None):
+        '''
+        Takes a token, waiting for one if the bucket is empty.
+
+        Parameters:
+            deadline (float, optional): monotonic time to give up at. Defaults to None (wait as long as needed).
+        Returns:
+            True once a token was taken, False if none became available before the deadline
+        '''
+        while True:
+            with self.lock:
+                now = self.clock.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1 - 1e-3: #rounding can leave a token just short of 1 after sleeping exactly the wait (e.g. on a VirtualClock)
+                    self.tokens = max(self.tokens - 1, 0.0)
+                    return True
+                wait = (1 - self.tokens)/self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            self.clock.sleep(wait)
+
+
+class RequestScheduler:
+    '''
+    Sits in front of a ccxt client and sends every request through a token bucket for its endpoint, so the traders and scraper
+    stay inside the exchange's rate limits. Network errors (timeouts, dropped connections, rate limit responses) are retried with
+    jittered exponential backoff, other exchange errors are raised straight away. Each call, retries included, must finish within
+    deadline seconds, and the client's own request timeout is capped to it, so a stuck call cannot overrun a cycle.
+    Every other attribute is passed through to the wrapped client.
+
+    Parameters:
+        exchange: ccxt-compatible exchange
+        limits (dict, optional): endpoint -> (requests per second, burst). Defaults to coinbase_limits.
+        max_retries (int, optional): retries after the first attempt. Defaults to 3.
+        base_delay (float, optional): backoff before the first retry, in seconds, doubled for each further retry. Defaults to 0.5.
+        max_delay (float, optional): longest backoff, in seconds. Defaults to 8.
+        deadline (float, optional): seconds a call may take including retries. Defaults to 20.
+        clock (optional): object providing monotonic() and sleep(). Defaults to the time module.
+    '''
+
+    def __init__(self, exchange, limits = coinbase_limits, max_retries = 3, base_delay = 0.5, max_delay = 8, deadline = 20, clock = time):
+        self.exchange = exchange
+        self.buckets = {endpoint: TokenBucket(rate, burst, clock) for endpoint, (rate, burst) in limits.items()}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.clock = clock
+        self.retries = 0 #total retries, for monitoring
+        self.failures = 0 #calls that failed after all retries
+
+        #the buckets do the throttling, and a single request may not run past the call deadline
+        if getattr(exchange, 'enableRateLimit', False):
+            exchange.enableRateLimit = False
+        if hasattr(exchange, 'timeout'):
+            exchange.timeout = int(min(exchange.timeout, deadline*1000))
+
+    def __getattr__(self, name):
+        attribute = getattr(self.exchange, name)
+        if name not in endpoints:
+            return attribute
+        return lambda *arguments, **keywords: self.call(name, attribute, arguments, keywords)
+
+    def backoff(self, attempt):
+        #full jitter: a random wait up to the exponential backoff, so clients that failed together do not retry together
+        return random.uniform(0, min(self.max_delay, self.base_delay*2**attempt))
+
+    def call(self, name, method, arguments, keywords):
+        deadline = self.clock.monotonic() + self.deadline
+        bucket = self.buckets.get(endpoints[name])
+        attempt = 0
+        while True:
+            if bucket is not None and not bucket.acquire(deadline):
+                self.failures = self.failures + 1
+                raise ccxt.RequestTimeout(name + " could not be sent within " + str(self.deadline) + " seconds (rate limited)")
+            started = time.perf_counter()
+            try:
+                response = method(*arguments, **keywords)
+                request_seconds.observe(time.perf_counter() - started, method = name)
+                return response
+            except ccxt.ExchangeError as e:
+                request_seconds.observe(time.perf_counter() - started, method = name)
+                request_errors.inc(method = name, error = type(e).__name__)
+                raise
+            except ccxt.NetworkError as e:
+                #ccxt raises NetworkError (and its RequestTimeout/RateLimitExceeded subclasses) for failures worth retrying
+                request_seconds.observe(time.perf_counter() - started, method = name)
+                request_errors.inc(method = name, error = type(e).__name__)
+                delay = self.backoff(attempt)
+                if name in not_retried or attempt >= self.max_retries or self.clock.monotonic() + delay >= deadline:
+                    self.failures = self.failures + 1
+                    raise
+                attempt = attempt + 1
+                self.retries = self.retries + 1
+                request_retries.inc(method = name)
+                logging.warning(name + " failed due to a network error, retry " + str(attempt) + " in " + str(round(delay, 2)) + "s: " + str(e))
+                self.clock.sleep(delay)
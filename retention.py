@@ -0,0 +1,233 @@
+import os
+import logging
+import time
+import sys
+from datetime import datetime
+from datetime import timezone
+import numpy as np
+from price_database import connect_database
+from config_cache import ConfigCache
+from log_setup import setup_logging
+
+
+columns = ["ts", "ask", "bid", "market"]
+
+def segment_path(archive_dir, currency_pair, day_start):
+    #archive/BTC-USD/2024-01-31.npz, one file per pair per UTC day
+    day = datetime.fromtimestamp(day_start, tz=timezone.utc).strftime("%Y-%m-%d")
+    return os.path.join(archive_dir, currency_pair.replace("/", "-"), day + ".npz")
+
+
+def read_segment(path):
+    '''
+    Reads an archived segment.
+
+    Parameters:
+        path (str): path to the segment file
+    Returns:
+        (dict of column arrays, resolution in minutes, 0 for raw rows)
+    '''
+    with np.load(path) as segment:
+        return {x: segment[x] for x in columns}, int(segment["resolution"])
+
+
+def write_segment(path, data, resolution = 0):
+    #write to a temporary file first so a crash never leaves a half written segment behind
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as segment_file:
+        np.savez_compressed(segment_file, resolution=np.array(resolution), **{x: data[x] for x in columns})
+    os.replace(temporary_path, path)
+
+
+def archive_rows(conn, archive_dir, cutoff):
+    '''
+    Moves price_data rows older than cutoff into per pair, per day segment files, one day per transaction.
+    Rows are merged into a day's existing segment if there is one, replacing archived rows with the same timestamp, so a run
+    interrupted between writing a segment and deleting its rows does not archive them twice when it is re-run.
+
+    Parameters:
+        conn: sqlite3.Connection to the price database
+        archive_dir (str): directory holding the segments
+        cutoff (int): epoch time, only whole UTC days before it are archived
+    Returns:
+        number of rows archived
+    '''
+    c = conn.cursor()
+    cutoff = cutoff//86400*86400
+    archived = 0
+    currency_pairs = [x[0] for x in c.execute("SELECT DISTINCT currency_pair FROM price_data")]
+    for currency_pair in currency_pairs:
+        while True:
+            first_ts = c.execute("SELECT MIN(ts) FROM price_data WHERE currency_pair = ?", (currency_pair,)).fetchone()[0]
+            if first_ts is None or first_ts >= cutoff:
+                break
+            day_start = int(first_ts)//86400*86400
+            day_end = day_start + 86400
+            rows = c.execute(
+                "SELECT ts, ask_price, bid_price, market_price FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (currency_pair, day_start, day_end)).fetchall()
+            data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+            data = {x: data[:, i] for i, x in enumerate(columns)}
+            resolution = 0
+
+            path = segment_path(archive_dir, currency_pair, day_start)
+            if os.path.exists(path):
+                existing, resolution = read_segment(path)
+                keep = ~np.isin(existing["ts"], data["ts"]) #rows of a run that stopped before its delete committed
+                data = {x: np.concatenate((existing[x][keep], data[x])) for x in columns}
+                order = np.argsort(data["ts"], kind="stable")
+                data = {x: data[x][order] for x in columns}
+            write_segment(path, data, resolution)
+
+            with conn:
+                c.execute("DELETE FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts < ?", (currency_pair, day_start, day_end))
+            archived = archived + len(rows)
+            logging.debug("Archived " + str(len(rows)) + " rows to " + path)
+    return archived
+
+
+def downsample(data, day_start, resolution):
+    '''
+    Averages a day of rows into buckets of resolution minutes, each stamped with its bucket start.
+
+    Parameters:
+        data (dict): column arrays sorted by ts
+        day_start (int): epoch time of the start of the day
+        resolution (int): bucket length in minutes
+    Returns:
+        dict of downsampled column arrays
+    '''
+    if len(data["ts"]) == 0:
+        return data
+    bucket = ((data["ts"] - day_start)//(resolution*60)).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    counts = np.diff(np.concatenate((starts, [len(bucket)])))
+    downsampled = {x: np.add.reduceat(data[x], starts)/counts for x in ["ask", "bid", "market"]}
+    downsampled["ts"] = day_start + bucket[starts].astype(np.float64)*resolution*60
+    return downsampled
+
+
+def downsample_segments(archive_dir, cutoff, resolution):
+    '''
+    Rewrites raw segments for days before cutoff so they only keep one averaged row every resolution minutes.
+
+    Returns:
+        number of segments downsampled
+    '''
+    downsampled = 0
+    if not os.path.isdir(archive_dir):
+        return downsampled
+    for pair_dir in sorted(os.listdir(archive_dir)):
+        for file_name in sorted(os.listdir(os.path.join(archive_dir, pair_dir))):
+            if not file_name.endswith(".npz"):
+                continue
+            day_start = int(datetime.strptime(file_name[:-4], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+            if day_start + 86400 > cutoff:
+                continue
+            path = os.path.join(archive_dir, pair_dir, file_name)
+            data, current_resolution = read_segment(path)
+            if current_resolution >= resolution:
+                continue
+            write_segment(path, downsample(data, day_start, resolution), resolution)
+            downsampled = downsampled + 1
+            logging.debug("Downsampled " + path + " to " + str(resolution) + " minute rows")
+    return downsampled
+
+
+def read_archive(archive_dir, currency_pair, start = None, end = None):
+    '''
+    Reads the archived rows of a currency pair between start (inclusive) and end (exclusive).
+
+    Returns:
+        dict with "ts", "ask", "bid" and "market" arrays, ordered by timestamp
+    '''
+    pair_dir = os.path.join(archive_dir, currency_pair.replace("/", "-"))
+    parts = []
+    if os.path.isdir(pair_dir):
+        for file_name in sorted(os.listdir(pair_dir)):
+            if not file_name.endswith(".npz"):
+                continue
+            day_start = int(datetime.strptime(file_name[:-4], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+            if (start is not None and day_start + 86400 <= start) or (end is not None and day_start >= end):
+                continue
+            data, resolution = read_segment(os.path.join(pair_dir, file_name))
+            keep = np.ones(len(data["ts"]), dtype=bool)
+            if start is not None:
+                keep = keep & (data["ts"] >= start)
+            if end is not None:
+                keep = keep & (data["ts"] < end)
+            parts.append({x: data[x][keep] for x in columns})
+    if len(parts) == 0:
+        return {x: np.zeros(0) for x in columns}
+    return {x: np.concatenate([part[x] for part in parts]) for x in columns}
+
+
+def prune_venue_prices(conn, cutoff):
+    #the per exchange quotes are only kept as long as the rows in price_data, they are not archived
+    with conn:
+        return conn.execute("DELETE FROM venue_prices WHERE ts < ?", (cutoff,)).rowcount
+
+
+def reclaim_space(conn, pages = 0):
+    '''
+    Returns free pages to the file system with incremental vacuum. A database created before auto_vacuum was enabled is
+    converted with one full VACUUM the first time.
+
+    Parameters:
+        conn: sqlite3.Connection
+        pages (int, optional): maximum number of pages to free, 0 frees all of them. Defaults to 0.
+    '''
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logging.info("Enabling incremental auto_vacuum (one time full VACUUM)")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA incremental_vacuum({pages})".format(pages = int(pages))).fetchall()
+    conn.commit()
+
+
+def run_retention(db_file = "pricedata.db", archive_dir = "archive", archive_age = 30, downsample_age = 365, downsample_interval = 60, vacuum_pages = 0, now = None):
+    '''
+    Runs the retention job: archives old rows into segment files, downsamples old segments and reclaims database space.
+
+    Parameters:
+        db_file (str, optional): path to the price database. Defaults to "pricedata.db".
+        archive_dir (str, optional): directory holding the segments. Defaults to "archive".
+        archive_age (float, optional): rows older than this many days are moved out of price_data. Defaults to 30.
+        downsample_age (float, optional): segments older than this many days keep only downsampled rows. Defaults to 365.
+        downsample_interval (int, optional): bucket length of downsampled rows, in minutes. Defaults to 60.
+        vacuum_pages (int, optional): maximum number of pages to free per run, 0 frees all of them. Defaults to 0.
+        now (float, optional): current epoch time. Defaults to time.time().
+    Returns:
+        None
+    '''
+    if now is None:
+        now = time.time()
+    conn = connect_database(db_file)
+    archived = archive_rows(conn, archive_dir, int(now - archive_age*86400))
+    print("Archived", archived, "rows")
+    logging.info("Archived " + str(archived) + " rows")
+    pruned = prune_venue_prices(conn, int(now - archive_age*86400))
+    if pruned > 0:
+        print("Deleted", pruned, "exchange quotes")
+        logging.info("Deleted " + str(pruned) + " exchange quotes")
+
+    downsampled = downsample_segments(archive_dir, int(now - downsample_age*86400), downsample_interval)
+    print("Downsampled", downsampled, "segments")
+    logging.info("Downsampled " + str(downsampled) + " segments")
+
+    reclaim_space(conn, vacuum_pages)
+    conn.close()
+
+
+if __name__ == "__main__":
+    config = ConfigCache("config.txt")
+    setup_logging("retention", config)
+    run_retention(
+        db_file = sys.argv[1] if len(sys.argv) > 1 else "pricedata.db",
+        archive_dir = config.get('Retention Section', 'archive_dir'),
+        archive_age = config.get('Retention Section', 'archive_age'),
+        downsample_age = config.get('Retention Section', 'downsample_age'),
+        downsample_interval = config.get('Retention Section', 'downsample_interval'),
+        vacuum_pages = config.get('Retention Section', 'vacuum_pages')
+    )
@@ -0,0 +1,92 @@
+from collections import deque
+import time
+
+
+class RollingWindow:
+    '''
+    Keeps a running sum and count of the market prices that fall inside a time window, so the average can be read in O(1).
+
+    Parameters:
+        rolling_window (int): the length of the window, in minutes
+    '''
+
+    def __init__(self, rolling_window):
+        self.timediff = rolling_window*60 #window length in seconds
+        self.points = deque() #(ts, market_price) pairs currently inside the window, oldest first
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, ts, market_price):
+        self.points.append((ts, market_price))
+        self.total = self.total + market_price
+        self.count = self.count + 1
+
+    def evict(self, now):
+        #drop every point that has fallen out of the window
+        timethreshold = now - self.timediff
+        while self.points and self.points[0][0] < timethreshold:
+            ts, market_price = self.points.popleft()
+            self.total = self.total - market_price
+            self.count = self.count - 1
+        if self.count == 0:
+            self.total = 0.0 #reset so floating point error cannot accumulate across empty windows
+
+    def average(self):
+        return self.total/self.count
+
+
+class PriceFeed:
+    '''
+    Feeds rows for one currency pair from the price_data table into one or more RollingWindow objects, reading only rows newer than the last seen row.
+
+    Parameters:
+        cursor: sqlite cursor connected to the price database
+        currency_pair (str): the currency pair to read, e.g. "BTC/USD"
+        windows (list): RollingWindow objects to keep up to date
+    '''
+
+    def __init__(self, cursor, currency_pair, windows):
+        self.cursor = cursor
+        self.currency_pair = currency_pair
+        self.windows = windows
+        self.last_ts = None
+        self.last_rowid = 0
+        self.rows_seen = None #total number of rows stored for the pair, used for the "still collecting" check
+
+    def update(self, now=None):
+        '''
+        Ingests new rows from the database and evicts points that have left each window.
+
+        Parameters:
+            now (float, optional): the current epoch time in seconds. Defaults to time.time().
+        Returns:
+            None
+        '''
+        if now is None:
+            now = time.time()
+        if self.rows_seen is None:
+            self.rows_seen = self.cursor.execute("SELECT COUNT(*) FROM price_data WHERE currency_pair = ? AND ts <= ?", (self.currency_pair, now)).fetchone()[0]
+            count_new_rows = False
+        else:
+            count_new_rows = True
+
+        timethreshold = now - max(window.timediff for window in self.windows)
+        if self.last_ts is not None:
+            if count_new_rows and timethreshold > self.last_ts:
+                #after a gap longer than the window the rows before it are not read, but they still count
+                self.rows_seen = self.rows_seen + self.cursor.execute(
+                    "SELECT COUNT(*) FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts < ? AND rowid > ?",
+                    (self.currency_pair, self.last_ts, timethreshold, self.last_rowid)).fetchone()[0]
+            timethreshold = max(timethreshold, self.last_ts)
+        rows = self.cursor.execute(
+            "SELECT rowid, ts, market_price FROM price_data WHERE currency_pair = ? AND ts >= ? AND ts <= ? AND rowid > ? ORDER BY ts, rowid",
+            (self.currency_pair, timethreshold, now, self.last_rowid)).fetchall()
+        for rowid, ts, market_price in rows:
+            self.last_ts = ts
+            self.last_rowid = max(self.last_rowid, rowid)
+            if count_new_rows:
+                self.rows_seen = self.rows_seen + 1
+            for window in self.windows:
+                window.add(ts, market_price)
+        for window in self.windows:
+            window.evict(now)
@@ -0,0 +1,112 @@
+import logging
+import math
+import time
+import metrics
+from collections import deque
+
+
+lateness_seconds = metrics.Histogram("cycle_lateness_seconds", "How late each cycle started after its tick", ["loop"])
+duration_seconds = metrics.Histogram("cycle_duration_seconds", "How long each cycle ran", ["loop"])
+headroom_seconds = metrics.Gauge("cycle_headroom_seconds", "Seconds left before the next tick when the last cycle finished", ["loop"])
+missed_ticks = metrics.Counter("cycle_missed_ticks_total", "Ticks skipped or coalesced because a cycle overran", ["loop"])
+
+class CycleScheduler:
+    '''
+    Fires cycles on a fixed grid aligned to wall-clock boundaries (a 300 second interval fires at :00, :05, :10, ...), so cycles
+    do not drift no matter how long each one runs. Lateness and run time are measured on the monotonic clock.
+    A cycle that overruns one or more ticks either skips them and waits for the next one ("skip"), or runs once straight away in
+    place of all of them ("coalesce"); missed ticks never pile up.
+
+    Parameters:
+        interval (float): seconds between ticks
+        clock (optional): object providing time(), monotonic() and sleep(), e.g. a VirtualClock. Defaults to the time module.
+        overrun (str, optional): "skip" or "coalesce". Defaults to "skip".
+        history_size (int, optional): number of recent cycles kept in history. Defaults to 100.
+        name (str, optional): label of the loop in the cycle metrics. Defaults to "cycle".
+    '''
+
+    def __init__(self, interval, clock = time, overrun = "skip", history_size = 100, name = "cycle"):
+        if overrun not in ("skip", "coalesce"):
+            raise ValueError("overrun must be \"skip\" or \"coalesce\"")
+        self.interval = interval
+        self.clock = clock
+        self.overrun = overrun
+        self.name = name
+        self.next_tick = None #wall-clock time of the tick being waited for
+        self.started = None #monotonic time the current cycle started
+        self.waited_from = None #(monotonic, wall) time delay() was called
+        self.lateness = 0.0 #seconds the current cycle started after its tick
+        self.duration = 0.0 #seconds the last cycle ran
+        self.missed = 0 #total ticks skipped or coalesced
+        self.cycles = 0
+        self.pending_missed = 0 #ticks missed before the cycle about to start
+        self.history = deque(maxlen = history_size) #(tick, lateness, duration of the cycle before it, ticks missed)
+
+    def delay(self):
+        '''
+        Ends the current cycle and works out the next tick.
+
+        Returns:
+            seconds to wait until the next tick, 0 if it is already due
+        '''
+        now = self.clock.monotonic()
+        wall = self.clock.time()
+        if self.started is not None:
+            self.duration = now - self.started
+        self.waited_from = (now, wall)
+
+        if self.next_tick is None:
+            self.next_tick = math.ceil(wall/self.interval)*self.interval
+        else:
+            #the grid may have moved if the interval was changed, so snap to it again
+            self.next_tick = math.floor(self.next_tick/self.interval + 1.5)*self.interval
+
+        headroom = self.next_tick - wall #negative when the cycle overran its tick
+        missed = 0
+        if self.next_tick < wall:
+            missed = int((wall - self.next_tick)//self.interval) + 1
+            if self.overrun == "skip":
+                self.next_tick = self.next_tick + missed*self.interval
+            else:
+                #run once now for the latest tick that passed
+                self.next_tick = self.next_tick + (missed - 1)*self.interval
+                missed = missed - 1
+            if missed > 0:
+                logging.warning("Cycle overran, " + {"skip": "skipped ", "coalesce": "coalesced "}[self.overrun] + str(missed) + " tick(s) of " + str(self.interval) + " seconds")
+        self.missed = self.missed + missed
+        self.pending_missed = missed
+        if self.started is not None:
+            duration_seconds.observe(self.duration, loop = self.name)
+            headroom_seconds.set(headroom, loop = self.name)
+        if missed > 0:
+            missed_ticks.inc(missed, loop = self.name)
+        return max(0.0, self.next_tick - wall)
+
+    def start(self):
+        '''
+        Marks the start of a cycle after waiting for the delay, and records how late it started.
+        '''
+        self.started = self.clock.monotonic()
+        waited_monotonic, waited_wall = self.waited_from if self.waited_from is not None else (self.started, self.clock.time())
+        #measure the wait on the monotonic clock so a wall-clock step does not show up as lateness
+        lateness = waited_wall + (self.started - waited_monotonic) - self.next_tick if self.next_tick is not None else 0.0
+        if lateness < -0.001:
+            #woken before the tick (e.g. by a signal), keep waiting for the same tick next time
+            self.next_tick = self.next_tick - self.interval
+            lateness = 0.0
+        self.lateness = max(0.0, lateness)
+        self.cycles = self.cycles + 1
+        lateness_seconds.observe(self.lateness, loop = self.name)
+        self.history.append((self.next_tick, self.lateness, self.duration, self.pending_missed))
+        logging.debug("Cycle started " + str(round(self.lateness, 3)) + "s late, last cycle ran " + str(round(self.duration, 3)) + "s")
+
+    def sleep(self, sleep = None):
+        '''
+        Ends the current cycle, sleeps until the next tick and starts the next cycle.
+
+        Parameters:
+            sleep (function, optional): called with the seconds to wait, e.g. ConfigCache.sleep. Defaults to clock.sleep.
+        '''
+        seconds = self.delay()
+        (sleep if sleep is not None else self.clock.sleep)(seconds)
+        self.start()
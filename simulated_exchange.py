@@ -0,0 +1,318 @@
+import sqlite3
+import bisect
+import logging
+import sys
+import time
+import random
+import ccxt
+
+
+class SimulationFinished(Exception):
+    '''
+    Raised by VirtualClock.sleep() once the clock passes the end of the recorded price data.
+    '''
+    pass
+
+
+class VirtualClock:
+    '''
+    Stand-in for the time module that lets a trader run against recorded data: sleep() advances the clock instantly instead of waiting.
+
+    Parameters:
+        start (float): epoch time the clock starts at
+        end (float, optional): epoch time at which sleep() raises SimulationFinished. Defaults to None (never).
+    '''
+
+    def __init__(self, start, end = None):
+        self.now = float(start)
+        self.end = end
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now = self.now + max(0, seconds)
+        if self.end is not None and self.now > self.end:
+            raise SimulationFinished("Reached the end of the recorded price data")
+
+
+class SimulatedExchange:
+    '''
+    Paper trading exchange implementing the part of the ccxt interface the traders and backfill.py use. Tickers come from recorded
+    price_data rows at the clock's current time, and limit orders fill once a recorded ask (buys) or bid (sells) crosses the limit price.
+    Candles and trades are served in pages of at most candle_limit and trade_limit entries, like the exchange's own history endpoints.
+
+    Parameters:
+        clock (VirtualClock): clock shared with the trader
+        symbols (list, optional): currency pairs to load up front so their currencies show in fetch_balance(). Defaults to [].
+        balances (dict, optional): starting balances by currency. Defaults to {"USD": 10000}.
+        db_file (str, optional): path to the sqlite price database. Defaults to "pricedata.db".
+        price_scale (float, optional): multiplies every recorded price, so several instances can stand in for exchanges quoting
+            different prices (e.g. behind an ExchangeRouter). Defaults to 1.
+    '''
+
+    def __init__(self, clock, symbols = [], balances = None, db_file = "pricedata.db", price_scale = 1):
+        self.clock = clock
+        self.db_file = db_file
+        self.price_scale = price_scale
+        self.free = dict(balances if balances is not None else {"USD": 10000})
+        self.used = {currency: 0.0 for currency in self.free}
+        self.orders = {}
+        self.next_order_id = 1
+        self.prices = {} #currency pair -> (ts list, ask list, bid list), loaded on first use
+        self.has = {'fetchTickers': False, 'fetchOHLCV': True, 'fetchTrades': True}
+        self.candle_limit = 300
+        self.trade_limit = 1000
+        for symbol in symbols:
+            self.load_prices(symbol)
+
+    def load_prices(self, symbol):
+        if symbol not in self.prices:
+            conn = sqlite3.connect(self.db_file)
+            rows = conn.execute("SELECT ts, ask_price, bid_price FROM price_data WHERE currency_pair = ? ORDER BY ts", (symbol,)).fetchall()
+            conn.close()
+            if self.price_scale != 1:
+                rows = [(x[0], x[1]*self.price_scale, x[2]*self.price_scale) for x in rows]
+            self.prices[symbol] = ([x[0] for x in rows], [x[1] for x in rows], [x[2] for x in rows])
+            for currency in symbol.split("/"):
+                self.free.setdefault(currency, 0.0)
+                self.used.setdefault(currency, 0.0)
+        return self.prices[symbol]
+
+    def price_index(self, symbol, ts):
+        #index of the last recorded row at or before ts
+        return bisect.bisect_right(self.load_prices(symbol)[0], ts) - 1
+
+    def match_orders(self):
+        #fill open orders whose limit price was crossed by any recorded price since they were last checked
+        now = self.clock.time()
+        for order in self.orders.values():
+            if order['status'] != 'open':
+                continue
+            times, asks, bids = self.load_prices(order['symbol'])
+            start = bisect.bisect_right(times, order['checked'])
+            end = bisect.bisect_right(times, now)
+            order['checked'] = now
+            if order['side'] == 'buy':
+                crossed = any(x <= order['price'] for x in asks[start:end])
+            else:
+                crossed = any(x >= order['price'] for x in bids[start:end])
+            if crossed:
+                self.fill(order)
+
+    def fill(self, order):
+        base, quote = order['symbol'].split("/")
+        cost = order['amount']*order['price']
+        if order['side'] == 'buy':
+            self.used[quote] = self.used[quote] - cost
+            self.free[base] = self.free[base] + order['amount']
+        else:
+            self.used[base] = self.used[base] - order['amount']
+            self.free[quote] = self.free[quote] + cost
+        self.clear_dust(base, quote)
+        order['status'] = 'closed'
+        order['filled'] = order['amount']
+        order['remaining'] = 0.0
+        logging.debug("Simulated fill: " + order['side'] + " " + str(order['amount']) + " " + order['symbol'] + " @ " + str(order['price']))
+
+    def clear_dust(self, *currencies):
+        #reserved balances go back to exactly 0 once nothing is open, the traders compare them with == 0
+        for currency in currencies:
+            if abs(self.used[currency]) < 1e-9:
+                self.used[currency] = 0.0
+
+    def fetch_ticker(self, symbol):
+        now = self.clock.time()
+        i = self.price_index(symbol, now)
+        if i < 0:
+            raise ccxt.ExchangeError("No recorded price for " + symbol + " at " + str(now))
+        times, asks, bids = self.prices[symbol]
+        return {'symbol': symbol, 'timestamp': int(times[i]*1000), 'ask': asks[i], 'bid': bids[i], 'last': (asks[i] + bids[i])/2}
+
+    def fetch_ohlcv(self, symbol, timeframe = '1m', since = None, limit = None):
+        #market price candles of the recorded rows from since (ms) up to the clock's current time, the last one may still be open
+        period = ccxt.Exchange.parse_timeframe(timeframe)
+        times, asks, bids = self.load_prices(symbol)
+        i = bisect.bisect_left(times, since/1000 if since is not None else 0)
+        end = bisect.bisect_right(times, self.clock.time())
+        limit = min(limit, self.candle_limit) if limit is not None else self.candle_limit
+        candles = []
+        while i < end and len(candles) < limit:
+            bucket = int(times[i])//period*period
+            j = bisect.bisect_left(times, bucket + period, i, end)
+            prices = [(asks[k] + bids[k])/2 for k in range(i, j)]
+            candles.append([bucket*1000, prices[0], max(prices), min(prices), prices[-1], 0.0])
+            i = j
+        return candles
+
+    def fetch_trades(self, symbol, since = None, limit = None):
+        #every recorded row from since (ms) on is served as a trade at the market price
+        times, asks, bids = self.load_prices(symbol)
+        i = bisect.bisect_left(times, since/1000 if since is not None else 0)
+        end = bisect.bisect_right(times, self.clock.time())
+        limit = min(limit, self.trade_limit) if limit is not None else self.trade_limit
+        return [{'id': str(k), 'symbol': symbol, 'timestamp': int(times[k]*1000), 'price': (asks[k] + bids[k])/2, 'amount': 0.0} for k in range(i, min(end, i + limit))]
+
+    def fetch_balance(self):
+        self.match_orders()
+        currencies = list(self.free.keys())
+        return {
+            'free': {x: self.free[x] for x in currencies},
+            'used': {x: self.used[x] for x in currencies},
+            'total': {x: self.free[x] + self.used[x] for x in currencies},
+        }
+
+    def create_order(self, symbol, side, amount, price):
+        self.load_prices(symbol)
+        base, quote = symbol.split("/")
+        if amount <= 0:
+            raise ccxt.InvalidOrder("Order amount must be positive")
+        if side == 'buy':
+            cost = amount*price
+            if cost > self.free[quote]:
+                raise ccxt.InsufficientFunds("Insufficient " + quote + " balance")
+            self.free[quote] = self.free[quote] - cost
+            self.used[quote] = self.used[quote] + cost
+        else:
+            if amount > self.free[base]:
+                raise ccxt.InsufficientFunds("Insufficient " + base + " balance")
+            self.free[base] = self.free[base] - amount
+            self.used[base] = self.used[base] + amount
+        order = {
+            'id': str(self.next_order_id),
+            'symbol': symbol,
+            'type': 'limit',
+            'side': side,
+            'amount': amount,
+            'price': price,
+            'filled': 0.0,
+            'remaining': amount,
+            'status': 'open',
+            'timestamp': int(self.clock.time()*1000),
+            'checked': self.clock.time(),
+        }
+        self.next_order_id = self.next_order_id + 1
+        self.orders[order['id']] = order
+
+        #a limit order that crosses the current price is marketable and fills straight away
+        ticker = self.fetch_ticker(symbol)
+        if (side == 'buy' and price >= ticker['ask']) or (side == 'sell' and price <= ticker['bid']):
+            self.fill(order)
+        return dict(order)
+
+    def create_limit_buy_order(self, symbol, amount, price):
+        return self.create_order(symbol, 'buy', amount, price)
+
+    def create_limit_sell_order(self, symbol, amount, price):
+        return self.create_order(symbol, 'sell', amount, price)
+
+    def cancel_order(self, id, symbol = None):
+        self.match_orders()
+        if id not in self.orders:
+            raise ccxt.OrderNotFound("Order " + str(id) + " not found")
+        order = self.orders[id]
+        if order['status'] != 'open':
+            raise ccxt.OrderNotFound("Order " + str(id) + " is " + order['status'])
+        base, quote = order['symbol'].split("/")
+        if order['side'] == 'buy':
+            cost = order['amount']*order['price']
+            self.used[quote] = self.used[quote] - cost
+            self.free[quote] = self.free[quote] + cost
+        else:
+            self.used[base] = self.used[base] - order['amount']
+            self.free[base] = self.free[base] + order['amount']
+        self.clear_dust(base, quote)
+        order['status'] = 'canceled'
+        return dict(order)
+
+    def fetch_order(self, id, symbol = None):
+        self.match_orders()
+        if id not in self.orders:
+            raise ccxt.OrderNotFound("Order " + str(id) + " not found")
+        return dict(self.orders[id])
+
+
+class FlakyExchange:
+    '''
+    Wraps an exchange (e.g. a SimulatedExchange) and injects latency and errors into its calls, for testing how the traders and
+    the RequestScheduler cope with a slow or failing exchange.
+
+    Parameters:
+        exchange: the exchange to wrap
+        latency (float, optional): seconds added to every call. Defaults to 0.
+        error_rate (float, optional): fraction of calls that raise instead of reaching the exchange. Defaults to 0.1.
+        errors (list, optional): exception classes to raise, picked at random. Defaults to [ccxt.NetworkError].
+        seed (int, optional): random seed, for repeatable runs. Defaults to None.
+        sleep (function, optional): used to wait out the latency. Defaults to time.sleep.
+    '''
+
+    def __init__(self, exchange, latency = 0, error_rate = 0.1, errors = None, seed = None, sleep = time.sleep):
+        self.exchange = exchange
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors if errors is not None else [ccxt.NetworkError]
+        self.random = random.Random(seed)
+        self.sleep = sleep
+        self.calls = 0
+        self.injected = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.exchange, name)
+        if not callable(attribute):
+            return attribute
+
+        def flaky_call(*arguments, **keywords):
+            self.calls = self.calls + 1
+            if self.latency > 0:
+                self.sleep(self.latency)
+            if self.random.random() < self.error_rate:
+                self.injected = self.injected + 1
+                raise self.random.choice(self.errors)("Injected failure in " + name)
+            return attribute(*arguments, **keywords)
+        return flaky_call
+
+
+def paper_trade(strategy, arguments, coin = "BTC", balances = None, db_file = "pricedata.db", **options):
+    '''
+    Runs a trader's live_trader() against the recorded price data with a SimulatedExchange and a VirtualClock.
+
+    Parameters:
+        strategy (str): "mean_reversion" or "sma_crossover"
+        arguments (list): the strategy's live_trader arguments (without coin)
+        coin (str, optional): the coin to be traded. Defaults to "BTC".
+        balances (dict, optional): starting balances by currency. Defaults to {"USD": 10000}.
+        db_file (str, optional): path to the sqlite price database. Defaults to "pricedata.db".
+        options: further live_trader keywords, e.g. mode = "bollinger"
+    Returns:
+        the final balance (same format as fetch_balance())
+    '''
+    if strategy == "mean_reversion":
+        import mean_reversion_trader as trader
+    else:
+        import sma_crossover_trader as trader
+
+    currency_pair = "{coin}/USD".format(coin = coin)
+    conn = sqlite3.connect(db_file)
+    start, end = conn.execute("SELECT MIN(ts), MAX(ts) FROM price_data WHERE currency_pair = ?", (currency_pair,)).fetchone()
+    conn.close()
+    if start is None:
+        raise ValueError("No recorded price data for " + coin)
+    clock = VirtualClock(start, end)
+    exchange = SimulatedExchange(clock, [currency_pair], balances, db_file)
+
+    try:
+        trader.live_trader(*arguments, coin = coin, exchange = exchange, clock = clock, state_file = None, equity_dir = None, price_ring = False, **options) #every paper trade starts fresh from recorded data
+    except SimulationFinished:
+        pass
+    return exchange.fetch_balance()
+
+
+if __name__ == "__main__":
+    #python3 simulated_exchange.py mean_reversion 6000 0.97 1.03 0.9 1 BTC
+    #python3 simulated_exchange.py sma_crossover 600 480 2490 0.9 BTC
+    arguments = [float(x) for x in sys.argv[2:-1]]
+    balance = paper_trade(sys.argv[1], arguments, coin = sys.argv[-1])
+    print("Final balance:", {x: balance['total'][x] for x in balance['total'] if balance['total'][x] != 0})
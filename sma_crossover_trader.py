@@ -1,31 +1,383 @@
-import sqlite3
-from datetime import datetime
-from datetime import timedelta
 import logging
 import time
 import ccxt
 import math
 import sys
-import configparser
-import ast
+from rolling_window import PriceFeed
+from price_ring import RingFeed
+from indicators import SMA
+from indicators import EMA
+from price_database import connect_database
+from config_cache import ConfigCache
+from config_cache import install_signal_handlers
+from cached_exchange import CachedExchange
+from scheduler import CycleScheduler
+from order_manager import OrderManager
+from exchange_router import connect_exchanges
+import metrics
+from log_setup import setup_logging
+from trader_state import StateStore
+from equity_curve import EquityCurve
+from equity_curve import open_equity_curve
+
+
+class SMACrossoverStrategy:
+    '''
+    State and per-cycle logic of the moving average crossover strategy, so it can be stepped by live_trader() or, alongside other
+    strategies, by strategy_runtime.py.
+
+    Parameters:
+        rolling_window_1: how long the long moving average should be (in minutes)
+        rolling_window_2: how long the short moving average should be (in minutes)
+        buy_size: how much available capital to use per trade (between 0 and 1)
+        coin: the coin to be traded (default = "BTC")
+        mode: "sma" to cross simple moving averages, "ema" to cross exponential moving averages with time constants of
+            rolling_window_1 and rolling_window_2 minutes (default = "sma")
+    '''
+
+    section = 'SMA Crossover Trader Section'
+    name = 'sma_crossover'
+    #attributes saved by the StateStore at the end of every cycle
+    checkpointed = ['position_size', 'purchase_price', 'losses', 'gains', 'buys', 'order_pending', 'order_pending_type', 'last_order_id', 'last_average_higher']
+
+    def __init__(self, rolling_window_1, rolling_window_2, buy_size, coin = "BTC", mode = "sma"):
+        # check if the trading parameters are valid
+        if buy_size > 1 or buy_size <= 0:
+            raise ValueError("buy_size must be between 1 and 0.")
+        if mode not in ("sma", "ema"):
+            raise ValueError("mode must be sma or ema.")
+        self.rolling_window_1 = rolling_window_1
+        self.rolling_window_2 = rolling_window_2
+        self.buy_size = buy_size
+        self.coin = coin
+        self.mode = mode
+        self.currency_pair = "{coin}/USD".format(coin = coin)
+        self.key = " ".join([self.name, self.currency_pair] + [str(float(x)) for x in (rolling_window_1, rolling_window_2, buy_size)]) #checkpoint key
+        if mode != "sma":
+            self.key = self.key + " " + mode
+
+        #define variables - use these for the actual running, store them in the database for logging, not use. 
+        self.position_size = 0
+        self.purchase_price = 0
+        self.losses = 0
+        self.gains = 0
+        self.buys = 0
+        self.order_pending = False 
+        self.last_order_id = "" #holding variable for the order id (for cancelling)
+        self.order_pending_type = ""
+        self.market_price = None #set from the ticker every cycle, None until the first one is fetched
+        self.sufficient_data = False
+        self.last_average_higher = "None"
+        self.current_average_higher = "None"
+        self.equity_curve = EquityCurve() #portfolio value and risk metrics, live_trader() gives it a file to persist to
+
+        #moving average windows, filled by a PriceFeed for the coin. The long window also counts the rows for the data quality check in ema mode.
+        self.price_window_1 = SMA(rolling_window_1)
+        self.price_window_2 = SMA(rolling_window_2)
+        self.windows = [self.price_window_1, self.price_window_2]
+        if mode == "ema":
+            self.average_1 = EMA(rolling_window_1)
+            self.average_2 = EMA(rolling_window_2)
+            self.windows = [self.price_window_1, self.average_1, self.average_2]
+        else:
+            self.average_1 = self.price_window_1
+            self.average_2 = self.price_window_2
+
+    def check_data(self, rows_seen, scraper_frequency):
+        '''
+        Works out both moving averages once the long window holds enough data. Only reads the windows, no exchange calls.
+
+        Parameters:
+            rows_seen (int): number of rows the PriceFeed has ingested
+            scraper_frequency (float): how often the scraper collects data (in minutes)
+        '''
+        #Check if there is sufficient data to generate trade signals, worked out again every cycle (not checkpointed) so a window that
+        #has thinned out, e.g. after the scraper was down, stops trading until it has filled up again
+        self.sufficient_data = False
+        #check if there is enough data to calculate the full moving average (6000 minutes, 600 total given that data is collected every 10 minutes by the scraper)
+        if rows_seen < (self.rolling_window_1/scraper_frequency - 1):
+            logging.debug("Insufficient Data: Still Collecting")
+            print("Insufficient Data: Still Collecting")
+        else:
+            #quality check - make sure that there is at least 65% of the points necessary to calculate the average (n=390)
+            if self.price_window_1.count > self.rolling_window_1/scraper_frequency*0.65:
+                try:
+                    self.interval_average_1 = self.average_1.value()
+                    self.interval_average_2 = self.average_2.value()
+
+                    print("Moving Average 1:", self.interval_average_1)
+                    logging.debug("Moving Average 1:" + str(self.interval_average_1))
+                    print("Moving Average 2:", self.interval_average_2)
+                    logging.debug("Moving Average 2:" + str(self.interval_average_2))
+
+                    self.sufficient_data = True
+                except Exception as e:
+                    logging.error("Encountered unkown error while calculating interval averages" + str(e))
+                    print("Encountered unknown error while calculating interval averages" + str(e))
+            else:
+                print("Insufficient Data: Missing Data")
+                logging.debug("Insufficient Data: Missing Data")
+
+    def trade(self, exchange, orders, starting_capital):
+        '''
+        Runs one cycle of order handling and signal generation against the exchange, then logs the summary.
+
+        Parameters:
+            exchange: ccxt-compatible exchange to trade on
+            orders (OrderManager): places the strategy's orders and reports their fills back to order_update()
+            starting_capital (float): total invested, used for the portfolio return in the summary
+        '''
+        if self.sufficient_data == True:
+            #--- trade logic --- 
+            #check on the order placed in an earlier cycle, orders still open after 30 minutes are cancelled so the algorithm can adjust the price
+            if self.order_pending == True:
+                orders.poll(self)
+
+            #get breakdown of relevant balances for trading
+            try:
+                exchange_balance = exchange.fetch_balance()
+                self.available_position_size = exchange_balance['free'][self.coin]
+                self.used_position_size = exchange_balance['used'][self.coin]
+                self.total_position_size = exchange_balance['total'][self.coin]
+
+                self.available_fiat = exchange_balance['free']["USD"]
+                self.used_fiat = exchange_balance['used']["USD"]
+                self.total_fiat = exchange_balance['total']["USD"]
+
+            except ccxt.NetworkError as e:
+                print( 'fetch_balance failed due to a network error:', str(e))
+                logging.error('fetch_balance failed due to a network error: ' + str(e))
+            except ccxt.ExchangeError as e:
+                print( 'fetch_balance failed due to exchange error:', str(e))
+                logging.error('fetch_balance failed due to exchange error: ' + str(e))
+            except Exception as e:
+                print( 'fetch_balance failed with:', str(e))
+                logging.error('fetch_balance failed with: ' + str(e))
+
+            
+            #--- signal generation and trading mechanisms ---
+            if self.order_pending == False:
+
+                #--- Generate Data for Decision Making ---
+                #network errors are retried with backoff by the RequestScheduler, anything that still fails skips this cycle's signals
+                try: 
+                    ticker_data = exchange.fetch_ticker(self.currency_pair)
+                    logging.info("Downloaded ticker data from Coinbase Pro")
+                    collected_data = True
+                except ccxt.NetworkError as e:
+                    print('fetch_ticker failed due to a network error:', str(e))
+                    logging.error('fetch_ticker failed due to a network error: ' + str(e))
+                    collected_data = False
+                except ccxt.ExchangeError as e:
+                    print('fetch_ticker failed due to exchange error:', str(e))
+                    logging.error('fetch_ticker failed due to exchange error: ' + str(e))
+                    collected_data = False
+                
+                if collected_data == True:
+                    best_ask = ticker_data['ask']
+                    best_bid = ticker_data['bid']
+                    self.market_price = (best_ask + best_bid)/2
+
+                    if self.interval_average_1 > self.interval_average_2:
+                        self.current_average_higher = "MA1"
+                    elif self.interval_average_1 < self.interval_average_2:
+                        self.current_average_higher = "MA2"
+                    else:
+                        self.current_average_higher = "None"
+
+                    #Buy Signals
+                    if self.total_position_size < 0.002: # if there was no purchase size 
+                        if self.current_average_higher == "MA1" and self.last_average_higher == "MA2":
+                            #calculate how much to buy
+                            buy_volume = math.trunc(((self.available_fiat*self.buy_size)/best_ask)*10000)/10000
+                            
+                            #place limit buy at the best_ask price
+                            try:
+                                print("Placing Limit Buy Order:", buy_volume, self.coin, "@ $", best_ask)
+                                r = orders.place(self, 'buy', self.currency_pair, round(buy_volume*(1-0.005), 8), best_ask)
+                                self.last_order_id = r['id']
+                                print("Placed Limit Buy Order:", round(buy_volume*(1-0.005), 8), self.coin, "@ $", best_ask)
+                                logging.info("Placed Limit Buy Order: " + str(round(buy_volume*(1-0.005), 8)) + self.coin + "@ $" +  str(best_ask))
+                                self.purchase_price = best_ask 
+                                self.order_pending = True
+                                self.order_pending_type = "BUY"
+                            except ccxt.NetworkError as e:
+                                print( 'create_limit_buy_order failed due to a network error:', str(e))
+                                logging.error('create_limit_buy_order failed due to a network error: ' + str(e))
+                            except ccxt.ExchangeError as e:
+                                print( 'create_limit_buy_order failed due to exchange error:', str(e))
+                                logging.error('create_limit_buy_order failed due to exchange error: ' + str(e))
+                            except Exception as e:
+                                print( 'create_limit_buy_order failed with:', str(e))
+                                logging.error('create_limit_buy_order failed with: ' + str(e))
+                    
+                    #Sell Signals
+                    elif self.total_position_size > 0.002:
+                        
+                        if self.current_average_higher == "MA2" and self.last_average_higher == "MA1": 
+                            try:
+                                print("Placing Limit Sell Order:", self.available_position_size, self.coin, "@ $", best_bid)
+                                r = orders.place(self, 'sell', self.currency_pair, round(self.available_position_size*(1-0.005), 8), best_bid)
+                                self.last_order_id = r['id']
+                                print("Placed Limit Sell Order:", round(self.available_position_size*(1-0.005), 8), self.coin, "@ $", best_bid)
+                                logging.info("Placed Limit Sell Order: " + str(round(self.available_position_size*(1-0.005), 8)) +  self.coin + " @ $" + str(best_bid))
+                                self.order_pending = True
+                                if self.purchase_price > self.market_price:
+                                    self.order_pending_type = "WIN"
+                                else:
+                                    self.order_pending_type = "LOSS"
+                            except ccxt.NetworkError as e:
+                                print( 'create_limit_sell_order {order_pending_type} failed due to a network error:'.format(order_pending_type=self.order_pending_type), str(e))
+                                logging.error('create_limit_sell_order {order_pending_type} failed due to a network error:'.format(order_pending_type=self.order_pending_type) + ' ' + str(e))
+                            except ccxt.ExchangeError as e:
+                                print( 'create_limit_sell_order {order_pending_type} failed due to exchange error:'.format(order_pending_type=self.order_pending_type), str(e))
+                                logging.error('create_limit_sell_order {order_pending_type} failed due to exchange error:'.format(order_pending_type=self.order_pending_type) + ' ' + str(e))
+                            except Exception as e:
+                                print( 'create_limit_sell_order {order_pending_type} failed with:'.format(order_pending_type=self.order_pending_type), str(e))
+                                logging.error('create_limit_sell_order {order_pending_type} failed with:'.format(order_pending_type=self.order_pending_type) + ' ' + str(e))
+                            
+                    # record which average was higher for the round
+                    self.last_average_higher = self.current_average_higher
+
+                    #Check to see if the order has been filled, then fetch another update of the account balance for summary
+                    if self.order_pending == True:
+                        orders.poll(self)
+                    try:
+                        exchange_balance = exchange.fetch_balance()
+                        self.available_position_size = exchange_balance['free'][self.coin]
+                        self.used_position_size = exchange_balance['used'][self.coin]
+                        self.total_position_size = exchange_balance['total'][self.coin]
 
+                        self.available_fiat = exchange_balance['free']['USD']
+                        self.used_fiat = exchange_balance['used']['USD']
+                        self.total_fiat = exchange_balance['total']['USD']
 
-#set up logging
-log_format = (
-    '[%(asctime)s] %(levelname)-8s %(name)-12s %(message)s')
+                    except ccxt.NetworkError as e:
+                        print( 'fetch_balance failed due to a network error:', str(e))
+                        logging.error('fetch_balance failed due to a network error: ' + str(e))
+                    except ccxt.ExchangeError as e:
+                        print( 'fetch_balance failed due to exchange error:', str(e))
+                        logging.error('fetch_balance failed due to exchange error: ' + str(e))
+                    except Exception as e:
+                        print( 'fetch_balance failed with:', str(e))
+                        logging.error('fetch_balance failed with: ' + str(e))
+                
+                #if there is no collected data, pass
+                else:
+                    pass
+
+            #an order is still open, only refresh the market price for the summary
+            else:
+                try:
+                    ticker_data = exchange.fetch_ticker(self.currency_pair)
+                    self.market_price = (ticker_data['ask'] + ticker_data['bid'])/2
+                except ccxt.NetworkError as e:
+                    print('fetch_ticker failed due to a network error:', str(e))
+                    logging.error('fetch_ticker failed due to a network error: ' + str(e))
+                except ccxt.ExchangeError as e:
+                    print('fetch_ticker failed due to exchange error:', str(e))
+                    logging.error('fetch_ticker failed due to exchange error: ' + str(e))
+                    
+
+            # --- SUMMARRY --- 
+            print("Trades:", self.buys+self.losses+self.gains)
+            logging.info("-- BEGIN SUMMARY --")
+            logging.info(("Trades: " + str(self.buys+self.losses+self.gains)))
+            try:
+                print("Hit Rate:", self.gains/(self.losses+self.gains))
+                logging.info(("Hit Rate: " + str(self.gains/(self.losses+self.gains))))
+            except:
+                print("Hit Rate: N/A")
+                logging.info(("Hit Rate: NA"))
+            print("Fiat: $", self.total_fiat)
+            logging.info(("Fiat: $" + str(self.total_fiat)))
+            print("Position:", self.total_position_size)
+            logging.info(("Position: " + str(self.total_position_size) + self.coin))
+            try:
+                print("Entry Price:", self.purchase_price)
+                logging.info(("Entry Price: $" + str(self.purchase_price)))
+                print("Position Change:", round(((self.market_price/self.purchase_price)-1)*100, 3), "%")
+                logging.info(("Position Change: " + str(round(((self.market_price/self.purchase_price)-1)*100, 3)) + "%" ))
+            except:
+                pass
+
+            #the portfolio value needs a market price, which is missing if the ticker has not been fetched since a restart
+            if self.market_price is not None:
+                print("Portfolio Worth:", (self.total_fiat + self.total_position_size*self.market_price), "(", round((((self.total_fiat + self.total_position_size*self.market_price)/float(starting_capital))-1)*100, 2), "% )")
+                logging.info(("Portfolio Worth:" + str(self.total_fiat + self.total_position_size*self.market_price) + "(" + str(round((((self.total_fiat + self.total_position_size*self.market_price)/float(starting_capital))-1)*100, 2)) + "%)"))
+                #print(round((((fiat + position_size*market_price)/starting_capital)-1)*100, 2), "% )")
+                self.equity_curve.add(self.total_fiat + self.total_position_size*self.market_price, self.total_position_size, self.market_price)
+                for line in self.equity_curve.summary_lines():
+                    print(line)
+                    logging.info(line)
+                metrics.portfolio_value.set(self.total_fiat + self.total_position_size*self.market_price, strategy = self.name, currency_pair = self.currency_pair)
+            print(" ")
+            logging.info("--- END SUMMARY --- ")
+            metrics.trade_count.set(self.buys+self.losses+self.gains, strategy = self.name, currency_pair = self.currency_pair)
+
+        #if there is insufficient data pass until next interval
+        else:
+            pass
+
+    def order_update(self, order):
+        '''
+        Called by the OrderManager when the pending order changes state, records the outcome once it is settled.
+
+        Parameters:
+            order (dict): the tracked order, with its "state" and "filled" amount
+        '''
+        if order['state'] == "partially_filled":
+            print("Order Partially Filled:", self.order_pending_type, order['id'], order['filled'], "of", order['amount'])
+            logging.info("Order Partially Filled: " + self.order_pending_type + " " + str(order['id']) + " " + str(order['filled']) + " of " + str(order['amount']))
+            return
+        if order['state'] == "filled":
+            print("Order Filled:", self.order_pending_type, order['id'])
+            logging.info("Order Filled: " + self.order_pending_type + " " + str(order['id']))
+        else:
+            print("Order " + order['state'].capitalize() + ":", self.order_pending_type, order['id'])
+            logging.info("Order " + order['state'].capitalize() + ": " + self.order_pending_type + " " + str(order['id']))
+
+        #Record outcome data, a buy counts once anything was bought, a sale once the whole position was sold
+        if self.order_pending_type == "BUY" and order['filled'] > 0:
+            self.buys = self.buys + 1
+        elif self.order_pending_type == "WIN" and order['state'] == "filled":
+            self.gains = self.gains + 1
+            self.position_size = 0
+            self.purchase_price = 0
+        elif self.order_pending_type == "LOSS" and order['state'] == "filled":
+            self.losses = self.losses + 1
+            self.position_size = 0
+            self.purchase_price = 0
+
+        self.order_pending = False
+        self.last_order_id = ""
+        self.order_pending_type = ""
+
+    def step(self, exchange, orders, price_feed, now, scraper_frequency, starting_capital):
+        '''
+        Runs one full trading cycle: ingests new price rows, checks the data and trades.
+        '''
+        #ingest only the rows added since the last cycle and drop the ones that have left the window
+        with metrics.phase_seconds.time(strategy = self.name, currency_pair = self.currency_pair, phase = "price_feed"):
+            price_feed.update(now)
+        with metrics.phase_seconds.time(strategy = self.name, currency_pair = self.currency_pair, phase = "check_data"):
+            self.check_data(price_feed.rows_seen, scraper_frequency)
+        with metrics.phase_seconds.time(strategy = self.name, currency_pair = self.currency_pair, phase = "trade"):
+            self.trade(exchange, orders, starting_capital)
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format=log_format,
-    filename=('coinbase_trader.log'),
-)
 
 def live_trader(
         intervals,
         rolling_window_1,
         rolling_window_2,
         buy_size,
-        coin = "BTC"
+        coin = "BTC",
+        exchange = None,
+        clock = time,
+        state_file = "trader_state.db",
+        equity_dir = "equity",
+        mode = "sma",
+        price_ring = True
 ):
     '''
     This function is used for cryptocurrency trading using moving average crossover strategy. It has the following parameters:
@@ -36,368 +388,79 @@ def live_trader(
         rolling_window_2: how long the short moving average should be (in minutes)
         buy_size: how much available capital to use per trade (between 0 and 1)
         coin: the coin to be traded (default = "BTC")
+        exchange: ccxt-compatible exchange to trade on (default = the exchanges in config.txt, coinbasepro unless changed, using their stored API keys)
+        clock: object providing time() and sleep(), e.g. a VirtualClock for paper trading (default = the time module)
+        state_file: sqlite database the strategy's state is checkpointed to and restored from, None to start fresh without checkpoints (default = "trader_state.db")
+        equity_dir: directory the equity curve and its risk metrics are saved to, None to keep them in memory only (default = "equity")
+        mode: "sma" or "ema", the kind of moving averages to cross (default = "sma")
+        price_ring: read new rows from the scraper's shared memory ring when price_ring is on in config.txt (default = True)
     '''
+    #load settings once, they are re-read only when config.txt changes or a signal arrives
+    config = ConfigCache("config.txt")
+    setup_logging("sma_crossover", config) #records are written by a background thread, see the Logging Section of config.txt
     logging.debug("Initializing live trading algorithm")
 
     # check if the trading parameters are valid
     if buy_size > 1 or buy_size <= 0:
         return "ERROR: could not run live_trader(), buy_size must be between 1 and 0."
 
-    #define variables - use these for the actual running, store them in the database for logging, not use. 
-    position_size = 0
-    portfolio_balance = []
-    purchase_price = 0
-    losses = 0
-    gains = 0
-    buys = 0
-    order_pending = False 
-    order_wait_time = 0 #if waiting for an order to fill - the time since placing order
-    last_order_id = "" #holding variable for the order id (for cancelling)
-    sufficient_data = False
-    last_average_higher = "None"
-
-    format = "%d/%m/%Y %H:%M:%S"
-    timediff_1 = timedelta(minutes=rolling_window_1)
-    timediff_2 = timedelta(minutes=rolling_window_2)
+    strategy = SMACrossoverStrategy(rolling_window_1, rolling_window_2, buy_size, coin, mode)
     logging.debug("Set environmental parameters")
 
     #establish connection with local db
-    conn = sqlite3.connect("pricedata.db")
+    conn = connect_database("pricedata.db")
     c = conn.cursor()
+    if price_ring and config.get("Scraper Section", "price_ring") == "on":
+        price_feed = RingFeed(c, strategy.currency_pair, strategy.windows) #new rows come from the scraper's shared memory ring
+    else:
+        price_feed = PriceFeed(c, strategy.currency_pair, strategy.windows)
     logging.debug("Established connection with local database")
 
-    #load authentication information
-    with open("cb_file1.bin", encoding="utf-8") as binary_file:
-        key = binary_file.read()
-    with open("cb_file2.bin", encoding="utf-8") as binary_file:
-        secret = binary_file.read()
-    with open("cb_file3.bin", encoding="utf-8") as binary_file:
-        password = binary_file.read()
-
-    #establish exchange connection
-    coinbasepro = ccxt.coinbasepro({
-        'apiKey': key,
-        'secret': secret,
-        'password': password
-    })
-
-    logging.debug("Established connection with exchange (CoinbasePro)")
+    if exchange is None:
+        #establish the connection to the exchanges in config.txt with their stored API keys, requests go through each exchange's
+        #rate limiter with retries and deadlines. With several exchanges, orders are routed to the one with the best price.
+        coinbasepro = connect_exchanges(config.get('SMA Crossover Trader Section', 'exchanges'))
+        logging.debug("Trading on " + ", ".join(config.get('SMA Crossover Trader Section', 'exchanges')))
+    else:
+        #use the exchange that was passed in (e.g. a SimulatedExchange for paper trading)
+        coinbasepro = exchange
+
+    #serve repeated balance/ticker reads from a short lived cache, an exchange that is already cached may be shared with other strategies
+    if not isinstance(coinbasepro, CachedExchange):
+        coinbasepro = CachedExchange(coinbasepro, clock = clock)
+    orders = OrderManager(coinbasepro, clock = clock) #tracks the strategy's orders by id until they are filled, cancelled or expire
+
+    logging.debug("Established connection with exchange")
+
+    #resume from the last checkpoint of this strategy and its parameters, including the order it was waiting on
+    store = StateStore(state_file) if state_file is not None else None
+    if store is not None:
+        store.restore(strategy, orders)
+        store.reconcile(orders, strategy.currency_pair)
+    strategy.equity_curve = open_equity_curve(equity_dir, strategy.key, int(86400/intervals), clock) #rolling volatility over the last day of cycles
     print("")
     print("Intializing live algorithm...")
     
+    install_signal_handlers(config, 'SMA Crossover Trader Section', 'trader_script', 'trade')
+    metrics.start_http_server(config.get('Metrics Section', 'sma_crossover_port'))
+    scheduler = CycleScheduler(intervals, clock, name = "sma_crossover") #cycles aligned to the clock
+
     script_status = "run"
     while script_status == "run":
 
         #Get Master Parameters
-        config = configparser.ConfigParser()
-        config.read_file(open("config.txt"))
+        config.reload_if_changed() #only re-parses config.txt if it changed since the last cycle
         starting_capital = config.get('SMA Crossover Trader Section', 'total_invested') #corrects relevant variables based on new funding
         trade_status = config.get('SMA Crossover Trader Section', 'trade') #controls whether to trade this cycle
         script_status = config.get('SMA Crossover Trader Section', 'trader_script') #controls whether to shut the script down
-        scraper_frequency = ast.literal_eval(config.get("Scraper Section", "scraper_frequency")) #how often the scraper collects data (in minutes)
+        scraper_frequency = config.get("Scraper Section", "scraper_frequency") #how often the scraper collects data (in minutes)
 
         if trade_status == "run":
+            #one trading cycle: ingest new rows, check the data and trade
+            strategy.step(coinbasepro, orders, price_feed, clock.time(), scraper_frequency, starting_capital)
+            if store is not None:
+                store.save(strategy, orders)
 
-            #Check if there is sufficient data to generate trade signals
-            timethreshold_1 = datetime.now() - timediff_1
-            timethreshold_2 = datetime.now() - timediff_2
-
-            #check if there is enough data to calculate the full moving average (6000 minutes, 600 total given that data is collected every 10 minutes by the scraper)
-            if len([x for x in c.execute("SELECT * FROM price_data")]) < (rolling_window_1/scraper_frequency - 1):
-                logging.debug("Insufficient Data: Still Collecting")
-                print("Insufficient Data: Still Collecting")
-            else:
-                #pull data from the set interval
-                intervaldata_1 = [list(x) for x in c.execute("SELECT * FROM price_data") if datetime.strptime(list(x)[0], format) >= timethreshold_1 ]
-                intervaldata_2 = [list(x) for x in c.execute("SELECT * FROM price_data") if datetime.strptime(list(x)[0], format) >= timethreshold_2 ]
-                
-                #quality check - make sure that there is at least 65% of the points necessary to calculate the average (n=390)
-                if len(intervaldata_1) > rolling_window_1/scraper_frequency*0.65:
-                    try:
-                        interval_average_1 = sum([x[3] for x in intervaldata_1])/len(intervaldata_1)
-                        interval_average_2 = sum([x[3] for x in intervaldata_2])/len(intervaldata_2)
-
-                        print("Moving Average 1:", interval_average_1)
-                        logging.debug("Moving Average 1:" + str(interval_average_1))
-                        print("Moving Average 2:", interval_average_2)
-                        logging.debug("Moving Average 2:" + str(interval_average_2))
-
-                        sufficient_data = True
-                    except Exception as e:
-                        logging.error("Encountered unkown error while calculating interval averages" + str(e))
-                        print("Encountered unknown error while calculating interval averages" + str(e))
-                else:
-                    print("Insufficient Data: Missing Data")
-                    logging.debug("Insufficient Data: Missing Data")
-            if sufficient_data == True:
-                #--- trade logic --- 
-                #get breakdown of relevant balances for trading
-                try:
-                    exchange_balance = coinbasepro.fetch_balance()
-                    available_position_size = exchange_balance['free'][coin]
-                    used_position_size = exchange_balance['used'][coin]
-                    total_position_size = exchange_balance['total'][coin]
-
-                    available_fiat = exchange_balance['free']["USD"]
-                    used_fiat = exchange_balance['used']["USD"]
-                    total_fiat = exchange_balance['total']["USD"]
-
-                except ccxt.NetworkError as e:
-                    print( 'fetch_balance failed due to a network error:', str(e))
-                    logging.error( 'fetch_balance failed due to a network error:', str(e))
-                except ccxt.ExchangeError as e:
-                    print( 'fetch_balance failed due to exchange error:', str(e))
-                    logging.error( 'fetch_balance failed due to exchange error:', str(e))
-                except Exception as e:
-                    print( 'fetch_balance failed with:', str(e))
-                    logging.error( 'fetch_balance failed with:', str(e))
-
-                
-                #Logic for if an order was placed last run
-                if order_pending == True:
-
-                    #keep track of how long it has been since the order was placed
-                    order_wait_time = order_wait_time + 10
-
-                    #if the order has been filled, reset and log the performance
-                    if used_position_size == 0 and used_fiat == 0:
-                        print("Order Filled:", order_pending_type, last_order_id)
-                        logging.info("Order Filled:", order_pending_type, last_order_id)
-                        order_pending = False
-                        last_order_id = ""
-
-                        #Record outcome data
-                        if order_pending_type == "BUY":
-                            buys = buys + 1
-                        elif order_pending_type == "WIN":
-                            gains = gains + 1
-                            position_size = 0
-                            purchase_price = 0
-                        elif order_pending_type == "LOSS":
-                            losses = losses + 1
-                            position_size = 0
-                            purchase_price = 0
-
-                        order_pending_type = ""
-
-                    #if it has been more than 20 minutes, cancel the orders so the algorithm can adjust the price
-                    elif order_wait_time >= 30:
-                        #cancel the orders
-                        try:
-                            coinbasepro.cancel_order(last_order_id, "{coin}/USD".format(coin = coin))
-                            order_pending = False
-                            print("Cancelled last order after 30 minutes")
-                            logging.info("Cancelled last order after 30 minutes")
-                            
-                        except ccxt.NetworkError as e:
-                            print( 'cancel_order failed due to a network error:', str(e))
-                            logging.error( 'cancel_order failed due to a network error:', str(e))
-                        except ccxt.ExchangeError as e:
-                            print( 'cancel_order failed due to exchange error:', str(e))
-                            logging.error( 'cancel_order failed due to exchange error:', str(e))
-                        except Exception as e:
-                            print( 'cancel_order failed with:', str(e))
-                            logging.error( 'cancel_order failed with:', str(e))
-                
-                #--- signal generation and trading mechanisms ---
-                if order_pending == False:
-
-                    #--- Generate Data for Decision Making ---
-                    try: 
-                        ticker_data = coinbasepro.fetch_ticker("{coin}/USD".format(coin = coin))
-                        logging.info("Downloaded ticker data from Coinbase Pro")
-                        collected_data = True
-
-                    except ccxt.NetworkError as e:
-                        print('fetch_ticker failed due to a network error:', str(e))
-                        logging.error('fetch_ticker failed due to a network error:', str(e))
-                        try:
-                            logging.info("Retrying...")
-                            print("Retrying...")
-                            ticker_data = coinbasepro.fetch_ticker("{coin}/USD".format(coin = coin))
-                            logging.info("Downloaded ticker data from Coinbase Pro")
-                            collected_data = True
-                        except: 
-                            logging.error("Attempt failed")
-                            try:
-                                logging.info("Retrying...")
-                                print("Retrying...")
-                                ticker_data = coinbasepro.fetch_ticker("{coin}/USD".format(coin = coin))
-                                logging.info("Downloaded ticker data from Coinbase Pro")
-                                collected_data = True
-                            except:
-                                collected_data = False
-
-                    except ccxt.ExchangeError as e:
-                        print('fetch_ticker failed due to exchange error:', str(e))
-                        logging.error( 'fetch_ticker failed due to exchange error:', str(e))
-                        try:
-                            logging.info("Retrying...")
-                            print("Retrying...")
-                            ticker_data = coinbasepro.fetch_ticker("{coin}/USD".format(coin = coin))
-                            logging.info("Downloaded ticker data from Coinbase Pro")
-                            collected_data = True
-                        except: 
-                            logging.error("Attempt failed")
-                            try:
-                                logging.info("Retrying...")
-                                print("Retrying...")
-                                ticker_data = coinbasepro.fetch_ticker("{coin}/USD".format(coin = coin))
-                                logging.info("Downloaded ticker data from Coinbase Pro")
-                                collected_data = True
-                            except:
-                                collected_data = False
-                    
-                    if collected_data == True:
-                        best_ask = ticker_data['ask']
-                        best_bid = ticker_data['bid']
-                        market_price = (best_ask + best_bid)/2
-
-                        if interval_average_1 > interval_average_2:
-                            current_average_higher = "MA1"
-                        elif interval_average_1 < interval_average_2:
-                            current_average_higher = "MA2"
-                        else:
-                            current_average_higher = "None"
-
-                        #Buy Signals
-                        if total_position_size < 0.002: # if there was no purchase size 
-                            if current_average_higher == "MA1" and last_average_higher == "MA2":
-                                #calculate how much to buy
-                                buy_volume = math.trunc(((available_fiat*buy_size)/best_ask)*10000)/10000
-                                
-                                #place limit buy at the best_ask price
-                                try:
-                                    print("Placing Limit Buy Order:", buy_volume, coin, "@ $", best_ask)
-                                    r = coinbasepro.create_limit_buy_order("{coin}/USD".format(coin = coin), round(buy_volume*(1-0.005), 8), best_ask)
-                                    last_order_id = r['id']
-                                    print("Placed Limit Buy Order:", round(buy_volume*(1-0.005), 8), coin, "@ $", best_ask)
-                                    logging.info("Placed Limit Buy Order: " + str(round(buy_volume*(1-0.005), 8)) + coin + "@ $" +  str(best_ask))
-                                    purchase_price = best_ask 
-                                    order_pending = True
-                                    order_pending_type = "BUY"
-                                except ccxt.NetworkError as e:
-                                    print( 'create_limit_buy_order failed due to a network error:', str(e))
-                                    logging.error( 'create_limit_buy_order failed due to a network error:', str(e))
-                                except ccxt.ExchangeError as e:
-                                    print( 'create_limit_buy_order failed due to exchange error:', str(e))
-                                    logging.error( 'create_limit_buy_order failed due to exchange error:', str(e))
-                                except Exception as e:
-                                    print( 'create_limit_buy_order failed with:', str(e))
-                                    logging.error( 'create_limit_buy_order failed with:', str(e))
-                        
-                        #Sell Signals
-                        elif total_position_size > 0.002:
-                            
-                            if current_average_higher == "MA2" and last_average_higher == "MA1": 
-                                try:
-                                    print("Placing Limit Sell Order:", available_position_size, coin, "@ $", best_bid)
-                                    r = coinbasepro.create_limit_sell_order("{coin}/USD".format(coin = coin), round(available_position_size*(1-0.005), 8), best_bid)
-                                    last_order_id = r['id']
-                                    print("Placed Limit Sell Order:", round(available_position_size*(1-0.005), 8), coin, "@ $", best_bid)
-                                    logging.info("Placed Limit Sell Order: " + str(round(available_position_size*(1-0.005), 8)) +  coin + " @ $" + str(best_bid))
-                                    order_pending = True
-                                    if purchase_price > market_price:
-                                        order_pending_type = "WIN"
-                                    else:
-                                        order_pending_type = "LOSS"
-                                except ccxt.NetworkError as e:
-                                    print( 'create_limit_sell_order {order_pending_type} failed due to a network error:'.format(order_pending_type=order_pending_type), str(e))
-                                    logging.error( 'create_limit_sell_order {order_pending_type} failed due to a network error:'.format(order_pending_type=order_pending_type), str(e))
-                                except ccxt.ExchangeError as e:
-                                    print( 'create_limit_sell_order {order_pending_type} failed due to exchange error:'.format(order_pending_type=order_pending_type), str(e))
-                                    logging.error( 'create_limit_sell_order {order_pending_type} failed due to exchange error:'.format(order_pending_type=order_pending_type), str(e))
-                                except Exception as e:
-                                    print( 'create_limit_sell_order {order_pending_type} failed with:'.format(order_pending_type=order_pending_type), str(e))
-                                    logging.error( 'create_limit_sell_order {order_pending_type} failed with:'.format(order_pending_type=order_pending_type), str(e))
-                                
-                        #Fetch another update of the account balance for summary (this also checks if the orders have been filled)
-                        try:
-                            exchange_balance = coinbasepro.fetch_balance()
-                            available_position_size = exchange_balance['free'][coin]
-                            used_position_size = exchange_balance['used'][coin]
-                            total_position_size = exchange_balance['total'][coin]
-
-                            available_fiat = exchange_balance['free']['USD']
-                            used_fiat = exchange_balance['used']['USD']
-                            total_fiat = exchange_balance['total']['USD']
-
-                            #Check to see if the order has been filled
-                            if order_pending == True:
-
-                                #if the order has been filled, reset and record the outcome
-                                if used_position_size == 0 and used_fiat == 0:
-                                    print("Order Filled:", order_pending_type, last_order_id)
-                                    logging.info("Order Filled:", order_pending_type, last_order_id)
-                                    order_pending = False
-                                    last_order_id = ""
-
-                                    #Record outcome data
-                                    if order_pending_type == "BUY":
-                                        buys = buys + 1
-                                    elif order_pending_type == "WIN":
-                                        gains = gains + 1
-                                        position_size = 0
-                                        purchase_price = 0
-                                    elif order_pending_type == "LOSS":
-                                        losses = losses + 1
-                                        position_size = 0
-                                        purchase_price = 0
-
-                                    order_pending_type = ""
-                            
-                        except ccxt.NetworkError as e:
-                            print( 'fetch_balance failed due to a network error:', str(e))
-                            logging.error( 'fetch_balance failed due to a network error:', str(e))
-                        except ccxt.ExchangeError as e:
-                            print( 'fetch_balance failed due to exchange error:', str(e))
-                            logging.error( 'fetch_balance failed due to exchange error:', str(e))
-                        except Exception as e:
-                            print( 'fetch_balance failed with:', str(e))
-                            logging.error( 'fetch_balance failed with:', str(e))
-                    
-                    #if there is no collected data, pass
-                    else:
-                        pass
-                        
-
-                # --- SUMMARRY --- 
-                print("Trades:", buys+losses+gains)
-                logging.info("-- BEGIN SUMMARY --")
-                logging.info(("Trades: " + str(buys+losses+gains)))
-                try:
-                    print("Hit Rate:", gains/(losses+gains))
-                    logging.info(("Hit Rate: " + str(gains/(losses+gains))))
-                except:
-                    print("Hit Rate: N/A")
-                    logging.info(("Hit Rate: NA"))
-                print("Fiat: $", total_fiat)
-                logging.info(("Fiat: $" + str(total_fiat)))
-                print("Position:", total_position_size)
-                logging.info(("Position: " + str(total_position_size) + coin))
-                try:
-                    print("Entry Price:", purchase_price)
-                    logging.info(("Entry Price: $" + str(purchase_price)))
-                    print("Position Change:", round(((market_price/purchase_price)-1)*100, 3), "%")
-                    logging.info(("Position Change: " + str(round(((market_price/purchase_price)-1)*100, 3)) + "%" ))
-                except:
-                    pass
-
-                print("Portfolio Worth:", (total_fiat + total_position_size*market_price), "(", round((((total_fiat + total_position_size*market_price)/float(starting_capital))-1)*100, 2), "% )")
-                logging.info(("Portfolio Worth:" + str(total_fiat + total_position_size*market_price) + "(" + str(round((((total_fiat + total_position_size*market_price)/float(starting_capital))-1)*100, 2)) + "%)"))
-                #print(round((((fiat + position_size*market_price)/starting_capital)-1)*100, 2), "% )")
-                print(" ")
-                logging.info("--- END SUMMARY --- ")
-                portfolio_balance.append(total_fiat + total_position_size*market_price)
-
-                # record which average was higher for the round
-                last_average_higher = current_average_higher
-
-            #if there is insufficient data pass until next interval
-            else:
-                pass
-
-                        
         #if the trade status is not run
         else:
             #wait for signal to change
@@ -411,7 +474,7 @@ def live_trader(
 
         #otherwise sleep until the next interval
         else:
-            time.sleep(intervals-1) #factor in the ~1 second it takes to run the script
+            scheduler.sleep(lambda seconds: config.sleep(seconds, clock)) #time spent running the cycle is taken off the wait
 
 
 if __name__ == "__main__":
@@ -420,5 +483,6 @@ if __name__ == "__main__":
         rolling_window_1 = sys.argv[2],
         rolling_window_2 = sys.argv[3],
         buy_size = sys.argv[4],
-        coin = sys.argv[5]
+        coin = sys.argv[5],
+        mode = sys.argv[6] if len(sys.argv) > 6 else "sma"
     )
\ No newline at end of file
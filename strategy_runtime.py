@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+import sys
+from rolling_window import PriceFeed
+from price_ring import RingFeed
+from price_database import connect_database
+from config_cache import ConfigCache
+from config_cache import install_signal_handlers
+from cached_exchange import CachedExchange
+from scheduler import CycleScheduler
+from order_manager import OrderManager
+from exchange_router import connect_exchanges
+import metrics
+from log_setup import setup_logging
+from trader_state import StateStore
+from equity_curve import open_equity_curve
+from mean_reversion_trader import MeanReversionStrategy
+from sma_crossover_trader import SMACrossoverStrategy
+
+
+def connect_exchange(config, sections):
+    #the connection shared by every strategy, to each exchange listed in any of their sections (routed when there are several)
+    exchange_ids = []
+    for section in sections:
+        for exchange_id in config.get(section, 'exchanges'):
+            if exchange_id not in exchange_ids:
+                exchange_ids.append(exchange_id)
+    return connect_exchanges(exchange_ids)
+
+
+def parse_strategy(text):
+    '''
+    Builds a strategy from the same arguments its trader script takes, strategy name first.
+
+    Parameters:
+        text (str): e.g. "mean_reversion 6000 0.97 1.03 0.9 1 BTC", "mean_reversion 6000 0.97 1.03 0.9 1 BTC bollinger 2",
+            "sma_crossover 600 480 2490 0.9 ETH" or "sma_crossover 600 480 2490 0.9 ETH ema"
+    Returns:
+        (strategy, interval), interval is the seconds between cycles or None to follow scraper_frequency
+    '''
+    name, *arguments = text.split()
+    if name == "mean_reversion":
+        #5 numbers, the coin, then optionally the entry mode and band width
+        numbers = [float(x) for x in arguments[:5]]
+        options = {'coin': arguments[5]}
+        if len(arguments) > 6:
+            options['mode'] = arguments[6]
+        if len(arguments) > 7:
+            options['band_width'] = float(arguments[7])
+        return MeanReversionStrategy(*numbers, **options), None
+    elif name == "sma_crossover":
+        #like sma_crossover_trader.py, the first argument is how often to check for new data (in seconds)
+        numbers = [float(x) for x in arguments[:4]]
+        options = {'coin': arguments[4]}
+        if len(arguments) > 5:
+            options['mode'] = arguments[5]
+        return SMACrossoverStrategy(*numbers[1:], **options), numbers[0]
+    raise ValueError("Unknown strategy: " + name)
+
+
+class StrategyRuntime:
+    '''
+    Runs any number of strategy instances in one process. They share one exchange client (behind a CachedExchange), one OrderManager,
+    one database connection with one PriceFeed per currency pair, one config and one StateStore that checkpoints every strategy after each cycle.
+    Each strategy keeps its own equity curve. Each strategy is its own asyncio task: the price feed and the
+    data check run on the event loop, and the exchange calls of a cycle run in a worker thread, so a slow request in one strategy
+    does not hold up the others. The windows are shared and keep changing on the event loop, so trade() only uses the averages
+    and bands check_data() read off them.
+
+    Parameters:
+        strategies (list): (strategy, interval) pairs as returned by parse_strategy()
+        exchange: ccxt-compatible exchange shared by the strategies
+        db_file (str, optional): path to the sqlite price database. Defaults to "pricedata.db".
+        config (ConfigCache, optional): shared config. Defaults to a ConfigCache of config.txt.
+        state_file (str, optional): sqlite database the strategies' state is checkpointed to and restored from, None to start fresh without checkpoints. Defaults to "trader_state.db".
+        equity_dir (str, optional): directory the equity curves are saved to, None to keep them in memory only. Defaults to "equity".
+    '''
+
+    def __init__(self, strategies, exchange, db_file = "pricedata.db", config = None, state_file = "trader_state.db", equity_dir = "equity"):
+        self.strategies = strategies
+        self.exchange = exchange if isinstance(exchange, CachedExchange) else CachedExchange(exchange)
+        self.orders = OrderManager(self.exchange) #every strategy's orders, each fill is reported to the strategy that placed it
+        self.config = config if config is not None else ConfigCache("config.txt")
+        self.conn = connect_database(db_file)
+
+        #one feed per currency pair, holding the windows of every strategy that trades it
+        self.feeds = {}
+        for strategy, interval in strategies:
+            if strategy.currency_pair not in self.feeds:
+                if self.config.get("Scraper Section", "price_ring") == "on":
+                    self.feeds[strategy.currency_pair] = RingFeed(self.conn.cursor(), strategy.currency_pair, []) #new rows from the scraper's shared memory ring
+                else:
+                    self.feeds[strategy.currency_pair] = PriceFeed(self.conn.cursor(), strategy.currency_pair, [])
+            self.feeds[strategy.currency_pair].windows.extend(strategy.windows)
+            cycle_seconds = interval if interval is not None else self.config.get("Scraper Section", "scraper_frequency")*60
+            strategy.equity_curve = open_equity_curve(equity_dir, strategy.key, int(86400/cycle_seconds)) #rolling volatility over the last day of cycles
+
+        #restore every strategy before looking for open orders that none of them account for
+        self.store = StateStore(state_file) if state_file is not None else None
+        if self.store is not None:
+            for strategy, interval in strategies:
+                self.store.restore(strategy, self.orders)
+            for currency_pair in self.feeds:
+                self.store.reconcile(self.orders, currency_pair)
+
+    def switches(self, strategy):
+        return (self.config.get(strategy.section, 'trader_script'), self.config.get(strategy.section, 'trade'))
+
+    async def sleep(self, strategy, seconds):
+        #sleep in short steps so a signal or config edit that flips the strategy's switches is picked up straight away
+        deadline = time.monotonic() + seconds
+        switches = self.switches(strategy)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(1, deadline - time.monotonic()))
+            self.config.reload_if_changed()
+            if self.switches(strategy) != switches:
+                return
+
+    async def run_strategy(self, strategy, interval):
+        price_feed = self.feeds[strategy.currency_pair]
+        name = type(strategy).__name__ + " " + strategy.currency_pair
+        scheduler = CycleScheduler(interval if interval is not None else 60, name = strategy.name + " " + strategy.currency_pair)
+
+        script_status = "run"
+        while script_status == "run":
+
+            #Get Master Parameters
+            self.config.reload_if_changed()
+            starting_capital = self.config.get(strategy.section, 'total_invested')
+            script_status, trade_status = self.switches(strategy)
+            scraper_frequency = self.config.get("Scraper Section", "scraper_frequency")
+            if interval is None:
+                scheduler.interval = scraper_frequency*60
+
+            if trade_status == "run":
+                try:
+                    with metrics.phase_seconds.time(strategy = strategy.name, currency_pair = strategy.currency_pair, phase = "price_feed"):
+                        price_feed.update(time.time())
+                    with metrics.phase_seconds.time(strategy = strategy.name, currency_pair = strategy.currency_pair, phase = "check_data"):
+                        strategy.check_data(price_feed.rows_seen, scraper_frequency)
+                    with metrics.phase_seconds.time(strategy = strategy.name, currency_pair = strategy.currency_pair, phase = "trade"):
+                        await asyncio.to_thread(strategy.trade, self.exchange, self.orders, starting_capital)
+                    if self.store is not None:
+                        self.store.save(strategy, self.orders)
+                except Exception as e:
+                    #keep the other strategies running, this one retries on its next cycle
+                    print(name, "cycle failed with:", str(e))
+                    logging.error(name + " cycle failed with: " + str(e))
+            else:
+                print(name, "Paused Trading - Waiting")
+                logging.debug(name + " Paused Trading - Waiting")
+
+            if script_status != "run":
+                print(name, "Termination Signal Recieved: Stopping Strategy...")
+                logging.debug(name + " Termination Signal Recieved: Stopping Strategy")
+            else:
+                await self.sleep(strategy, scheduler.delay())
+                scheduler.start()
+
+    async def run(self):
+        '''
+        Runs every strategy until its trader_script setting (or SIGTERM/SIGINT) stops it.
+        '''
+        try:
+            await asyncio.gather(*[self.run_strategy(strategy, interval) for strategy, interval in self.strategies])
+        finally:
+            self.conn.close()
+            if self.store is not None:
+                self.store.close()
+
+
+def run_strategies(strategy_texts, exchange = None, db_file = "pricedata.db"):
+    '''
+    Builds the strategies and runs them in one StrategyRuntime.
+
+    Parameters:
+        strategy_texts (list): strategy descriptions, see parse_strategy()
+        exchange (optional): ccxt-compatible exchange to trade on. Defaults to the exchanges listed in the strategies' sections of
+            config.txt, using their stored API keys.
+        db_file (str, optional): path to the sqlite price database. Defaults to "pricedata.db".
+    Returns:
+        None
+    '''
+    strategies = [parse_strategy(x) for x in strategy_texts]
+    config = ConfigCache("config.txt")
+    if exchange is None:
+        exchange = connect_exchange(config, sorted(set(x[0].section for x in strategies)))
+    runtime = StrategyRuntime(strategies, exchange, db_file, config)
+    setup_logging("strategy_runtime", runtime.config) #records are written by a background thread, see the Logging Section of config.txt
+    install_signal_handlers(runtime.config, sorted(set(x[0].section for x in strategies)), 'trader_script', 'trade')
+    metrics.start_http_server(runtime.config.get('Metrics Section', 'runtime_port'))
+    logging.debug("Running " + str(len(strategies)) + " strategies")
+    asyncio.run(runtime.run())
+
+
+if __name__ == "__main__":
+    #python3 strategy_runtime.py "mean_reversion 6000 0.97 1.03 0.9 1 BTC" "sma_crossover 600 480 2490 0.9 ETH"
+    run_strategies(sys.argv[1:])
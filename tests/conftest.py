@@ -0,0 +1,26 @@
+import os
+import sys
+import shutil
+import pytest
+
+#the modules live in the repository root
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from benchmark import generate_database
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    #the scripts read config.txt and write their logs in the working directory
+    shutil.copy(os.path.join(root, "config.txt"), tmp_path / "config.txt")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def price_db(workdir):
+    #two days of BTC/USD every 5 minutes (scraper_frequency in config.txt), with the gaps of a real scraper
+    db_file = str(workdir / "pricedata.db")
+    generate_database(db_file, 576, pairs = ["BTC/USD"], interval = 300, seed = 1)
+    return db_file
@@ -0,0 +1,62 @@
+import ccxt
+import pytest
+import price_database
+from backfill import Backfill
+from simulated_exchange import VirtualClock, SimulatedExchange, FlakyExchange
+
+
+def stored(db_file):
+    conn = price_database.connect_database(db_file)
+    rows = conn.execute("SELECT ts, currency_pair, ask_price, bid_price, market_price FROM price_data ORDER BY ts, rowid").fetchall()
+    candles = conn.execute("SELECT * FROM candles ORDER BY currency_pair, resolution, ts").fetchall()
+    conn.close()
+    return rows, candles
+
+
+def same(a, b):
+    #rows must match exactly, the candles' price sums may differ in the last bits when the rows were written in other batches
+    assert a[0] == b[0]
+    assert len(a[1]) == len(b[1])
+    for x, y in zip(a[1], b[1]):
+        assert x == pytest.approx(y)
+
+
+def backfill(exchange, clock, start, db_file, source = "ohlcv"):
+    loader = Backfill(exchange, "BTC/USD", start, timeframe = "5m", source = source, db_file = db_file, page_size = 50, batch_size = 40, clock = clock)
+    try:
+        return loader.run()
+    finally:
+        loader.close()
+
+
+@pytest.fixture
+def recorded(price_db):
+    conn = price_database.connect_database(price_db)
+    first, last = conn.execute("SELECT MIN(ts), MAX(ts) FROM price_data").fetchone()
+    conn.close()
+    clock = VirtualClock(last + 3600)
+    return SimulatedExchange(clock, ["BTC/USD"], db_file = price_db), clock, first
+
+
+def test_resume_after_errors(recorded, workdir):
+    exchange, clock, first = recorded
+    expected_rows = backfill(exchange, clock, first, str(workdir / "clean.db"))
+    flaky = FlakyExchange(exchange, error_rate = 0.3, seed = 3)
+    interruptions = 0
+    while True:
+        try:
+            rows = backfill(flaky, clock, first, str(workdir / "resumed.db"))
+            break
+        except ccxt.NetworkError:
+            interruptions = interruptions + 1
+    assert interruptions > 1
+    assert rows == expected_rows > 0
+    same(stored(str(workdir / "resumed.db")), stored(str(workdir / "clean.db")))
+
+
+def test_trades_match_candles(recorded, workdir):
+    exchange, clock, first = recorded
+    backfill(exchange, clock, first, str(workdir / "ohlcv.db"))
+    backfill(exchange, clock, first, str(workdir / "trades.db"), source = "trades")
+    same(stored(str(workdir / "trades.db")), stored(str(workdir / "ohlcv.db")))
+
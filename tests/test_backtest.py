@@ -0,0 +1,52 @@
+import sqlite3
+import pytest
+import backtest
+import mean_reversion_trader
+import sma_crossover_trader
+from simulated_exchange import SimulatedExchange, VirtualClock, SimulationFinished
+
+
+@pytest.fixture
+def aligned_db(price_db):
+    #move the rows onto the 5 minute grid the live trader cycles on, so each cycle sees exactly one new row like in the backtest
+    conn = sqlite3.connect(price_db)
+    with conn:
+        conn.execute("UPDATE price_data SET ts = ts + 100")
+    conn.close()
+    return price_db
+
+
+def live_fills(trader, arguments, db_file):
+    conn = sqlite3.connect(db_file)
+    start, end = conn.execute("SELECT MIN(ts), MAX(ts) FROM price_data").fetchone()
+    conn.close()
+    clock = VirtualClock(start, end)
+    exchange = SimulatedExchange(clock, ["BTC/USD"], None, db_file)
+    try:
+        trader.live_trader(*arguments, coin = "BTC", exchange = exchange, clock = clock, state_file = None, equity_dir = None, price_ring = False)
+    except SimulationFinished:
+        pass
+    return [(x['timestamp']//1000, x['side']) for x in exchange.orders.values() if x['status'] == 'closed']
+
+
+def same_fills(live, result):
+    fills = []
+    for trade in result["trades"]:
+        fills = fills + [(int(trade["entry_ts"]), "buy"), (int(trade["exit_ts"]), "sell")]
+    assert len(fills) > 0
+    assert live[:len(fills)] == fills
+    #a position still open at the end is not in the backtest's trades
+    assert live[len(fills):] == [] or (len(live) == len(fills) + 1 and live[-1][1] == "buy")
+
+
+@pytest.mark.parametrize("arguments", [[300, 0.995, 1.003, 0.99, 1], [120, 0.997, 1.002, 0.99, 1]])
+def test_mean_reversion_matches_live_trader(aligned_db, arguments):
+    #the test data has a five hour outage that thins the window, neither may trade until it has filled again
+    prices = backtest.load_price_history("BTC/USD", aligned_db, archive_dir = None)
+    same_fills(live_fills(mean_reversion_trader, arguments, aligned_db), backtest.backtest_mean_reversion(prices, *arguments))
+
+
+@pytest.mark.parametrize("arguments", [[300, 120, 300, 0.9], [300, 30, 120, 0.9]])
+def test_sma_crossover_matches_live_trader(aligned_db, arguments):
+    prices = backtest.load_price_history("BTC/USD", aligned_db, archive_dir = None)
+    same_fills(live_fills(sma_crossover_trader, arguments, aligned_db), backtest.backtest_sma_crossover(prices, *arguments[1:]))
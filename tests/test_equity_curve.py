@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from equity_curve import EquityCurve, seconds_per_year, record
+from simulated_exchange import VirtualClock
+
+
+def series(n = 500, seed = 2):
+    #a random walk of prices and an equity that holds the coin in stretches, with irregular cycle lengths
+    generator = np.random.default_rng(seed)
+    ts = 1700000000 + np.cumsum(generator.choice([300, 300, 300, 600, 900], n))
+    price = 30000*np.exp(np.cumsum(generator.normal(0, 0.003, n)))
+    position = np.where((np.arange(n)//40) % 2 == 1, 0.2, 0.0)
+    fiat = 10000 - np.cumsum(np.concatenate([[0], np.diff(position)])*price)
+    return ts, fiat + position*price, position, price
+
+
+def expected_stats(ts, equity, position, price, window):
+    returns = equity[1:]/equity[:-1] - 1
+    periods_per_year = seconds_per_year/((ts[-1] - ts[0])/len(returns))
+    return {
+        'cycles': len(equity),
+        'drawdown': 1 - equity[-1]/equity.max(),
+        'max_drawdown': (1 - equity/np.maximum.accumulate(equity)).max(),
+        'volatility': returns[-window:].std()*np.sqrt(periods_per_year),
+        'sharpe': returns.mean()/returns.std()*np.sqrt(periods_per_year),
+        'sortino': returns.mean()/np.sqrt((np.minimum(returns, 0)**2).mean())*np.sqrt(periods_per_year),
+        'exposure': np.diff(ts)[position[:-1] > 0].sum()/(ts[-1] - ts[0]),
+        'turnover': (np.abs(np.diff(position))*price[1:]).sum()/equity.mean(),
+    }
+
+
+def test_resumed_metrics_match_recomputation(tmp_path):
+    ts, equity, position, price = series()
+    path = str(tmp_path / "curve.bin")
+    clock = VirtualClock(ts[0])
+    curve = EquityCurve(path, window = 50, clock = clock)
+    for i in range(len(ts)):
+        if i in [120, 121, 300]:
+            curve = EquityCurve(path, window = 50, clock = clock) #the trader restarts
+        clock.now = float(ts[i])
+        stats = curve.add(float(equity[i]), float(position[i]), float(price[i]))
+    assert stats == pytest.approx(expected_stats(ts, equity, position, price, 50), rel = 1e-6)
+    with open(path, "rb") as series_file:
+        assert [x[1] for x in record.iter_unpack(series_file.read())] == pytest.approx(list(equity))
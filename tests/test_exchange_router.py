@@ -0,0 +1,91 @@
+import time
+import sqlite3
+import collections
+import ccxt
+import pytest
+import mean_reversion_trader
+from exchange_router import ExchangeRouter
+from simulated_exchange import SimulatedExchange, VirtualClock, FlakyExchange, SimulationFinished
+
+
+def venues(price_db, clock, balances, scales):
+    return {name: SimulatedExchange(clock, ["BTC/USD"], balance, price_db, price_scale = scale) for name, balance, scale in zip("abc", balances, scales)}
+
+
+@pytest.fixture
+def clock(price_db):
+    first, last = sqlite3.connect(price_db).execute("SELECT MIN(ts), MAX(ts) FROM price_data").fetchone()
+    return VirtualClock(first + 86400, last)
+
+
+def test_consolidated_ticker(price_db, clock):
+    router = ExchangeRouter(venues(price_db, clock, [None]*3, [1.0, 0.999, 1.001]))
+    best = router.fetch_ticker("BTC/USD")
+    assert best['askExchange'] == "b" and best['bidExchange'] == "c"
+    assert best['ask'] == min(x['ask'] for x in best['info'].values())
+    assert best['bid'] == max(x['bid'] for x in best['info'].values())
+    router.close()
+
+
+def test_fan_out_is_concurrent(price_db, clock):
+    #three exchanges taking 0.3 seconds each answer in about 0.3 seconds
+    slow = {name: FlakyExchange(exchange, latency = 0.3, error_rate = 0) for name, exchange in venues(price_db, clock, [None]*3, [1.0]*3).items()}
+    router = ExchangeRouter(slow)
+    started = time.perf_counter()
+    router.fetch_ticker("BTC/USD")
+    assert time.perf_counter() - started < 0.6
+    router.close()
+
+
+def test_failed_exchange_is_left_out(price_db, clock):
+    exchanges = venues(price_db, clock, [None]*2, [0.999, 1.0])
+    router = ExchangeRouter({"down": FlakyExchange(exchanges["a"], error_rate = 1.0), "b": exchanges["b"]})
+    assert router.fetch_ticker("BTC/USD")['askExchange'] == "b"
+    router.close()
+    with pytest.raises(ccxt.NetworkError):
+        ExchangeRouter({"down": FlakyExchange(exchanges["a"], error_rate = 1.0)}).fetch_ticker("BTC/USD")
+
+
+def test_routes_to_best_funded_exchange(price_db, clock):
+    exchanges = venues(price_db, clock, [{"USD": 5000}, {"USD": 5000}, {"USD": 100}], [1.0, 0.999, 0.998])
+    router = ExchangeRouter(exchanges)
+    best = router.fetch_ticker("BTC/USD")
+    router.fetch_balance()
+    #c quotes the best ask but cannot pay for the order, b is next best
+    order = router.create_limit_buy_order("BTC/USD", 0.1, best['info']['b']['ask'])
+    assert order['id'] == "b:1" and order['status'] == "closed"
+    assert router.fetch_order(order['id'], "BTC/USD")['id'] == "b:1"
+    assert router.split("7") == ("a", "7") #ids placed before routing belong to the first exchange
+    router.close()
+
+
+def test_order_is_cut_to_one_exchange(price_db, clock):
+    exchanges = venues(price_db, clock, [{"USD": 5000}, {"USD": 6000}], [1.0, 1.0])
+    router = ExchangeRouter(exchanges)
+    best = router.fetch_ticker("BTC/USD")
+    balance = router.fetch_balance()
+    with pytest.raises(ccxt.InsufficientFunds):
+        router.create_limit_sell_order("BTC/USD", 1.0, best['bid']) #no exchange holds any BTC
+
+    #the summed balance buys more than either exchange can pay for, the order goes to b for what b can pay
+    amount = balance['free']['USD']/best['ask']
+    order = router.create_limit_buy_order("BTC/USD", amount, best['ask'])
+    assert order['exchange'] == "b" and order['amount'] < amount and order['amount']*best['ask'] <= 6000
+    bought = router.fetch_balance()['free']['BTC']
+    order = router.create_limit_sell_order("BTC/USD", bought*2, best['bid']*2)
+    assert order['exchange'] == "b" and order['amount'] == bought
+    router.close()
+
+
+def test_paper_trade_with_split_balance(price_db, clock):
+    #the whole balance is used per trade but split over two exchanges, the orders must still fill
+    exchanges = venues(price_db, clock, [{"USD": 5000}, {"USD": 5000}], [1.0, 0.999])
+    router = ExchangeRouter(exchanges)
+    clock.now = clock.now - 86400
+    try:
+        mean_reversion_trader.live_trader(300, 0.995, 1.003, 0.99, 1, coin = "BTC", exchange = router, clock = clock, state_file = None, equity_dir = None, price_ring = False)
+    except SimulationFinished:
+        pass
+    orders = collections.Counter((order['side'], order['status']) for exchange in exchanges.values() for order in exchange.orders.values())
+    assert orders[('buy', 'closed')] > 0 and orders[('sell', 'closed')] > 0
+    router.close()
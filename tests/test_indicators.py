@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import indicators
+from indicators import SMA, Bollinger, WMA, EMA, RSI
+
+
+def random_walk(n = 3000, seed = 7):
+    #ticks near 30000 a minute or so apart, with a few gaps longer than the windows so they empty and refill
+    rng = np.random.default_rng(seed)
+    spacing = rng.choice([30, 60, 60, 60, 120, 600], n).astype(float)
+    spacing[[500, 1800]] = 6*3600
+    ts = 1700000000 + np.cumsum(spacing)
+    prices = 30000 + np.cumsum(rng.normal(0, 10, n))
+    return ts, prices
+
+
+def stream(indicator, ts, prices, read):
+    #the value after each row, with the window evicted at that row's ts as the traders do every cycle
+    result = []
+    for t, price in zip(ts, prices):
+        indicator.add(t, price)
+        indicator.evict(t)
+        result.append(read(indicator))
+    return np.array(result, dtype=float)
+
+
+@pytest.mark.parametrize("rolling_window", [20, 120, 600])
+def test_sma(rolling_window):
+    ts, prices = random_walk()
+    mean, count = indicators.sma(ts, prices, rolling_window)
+    assert np.abs(stream(SMA(rolling_window), ts, prices, SMA.value) - mean).max() < 1e-6
+
+
+@pytest.mark.parametrize("rolling_window", [20, 120, 600])
+def test_bollinger(rolling_window):
+    ts, prices = random_walk()
+    streamed = stream(Bollinger(rolling_window, 2), ts, prices, Bollinger.bands)
+    batch = np.column_stack(indicators.bollinger(ts, prices, rolling_window, 2))
+    std = [np.std(prices[(ts >= t - rolling_window*60) & (ts <= t)]) for t in ts]
+    exact = np.column_stack(indicators.sma(ts, prices, rolling_window)[:1]*3) + np.outer(std, [-2, 0, 2])
+    assert np.abs(streamed - batch).max() < 1e-6
+    assert np.abs(streamed - exact).max() < 1e-6
+    assert np.abs(batch - exact).max() < 1e-6
+
+
+@pytest.mark.parametrize("rolling_window", [20, 120, 600])
+def test_wma(rolling_window):
+    ts, prices = random_walk()
+    assert np.abs(stream(WMA(rolling_window), ts, prices, WMA.value) - indicators.wma(ts, prices, rolling_window)).max() < 1e-6
+
+
+@pytest.mark.parametrize("span", [20, 120, 600])
+def test_ema(span):
+    ts, prices = random_walk()
+    assert np.abs(stream(EMA(span), ts, prices, EMA.value) - indicators.ema(ts, prices, span)).max() < 1e-6
+
+
+@pytest.mark.parametrize("period", [14, 120])
+def test_rsi(period):
+    ts, prices = random_walk()
+    streamed = stream(RSI(period), ts, prices, lambda rsi: np.nan if rsi.value() is None else rsi.value())
+    batch = indicators.rsi(ts, prices, period)
+    assert np.array_equal(np.isnan(streamed), np.isnan(batch))
+    assert np.nanmax(np.abs(streamed - batch)) < 1e-6
+
+
+def test_bollinger_on_a_trend():
+    #the window never empties while the price doubles with a small spread, where running sums of squares drift furthest
+    rng = np.random.default_rng(3)
+    ts = 1700000000 + 60.0*np.arange(3000)
+    prices = 30000 + 10*np.arange(3000) + rng.normal(0, 0.1, 3000)
+    streamed = stream(Bollinger(20, 2), ts, prices, Bollinger.bands)
+    batch = np.column_stack(indicators.bollinger(ts, prices, 20, 2))
+    std = np.array([np.std(prices[max(i - 20, 0):i + 1]) for i in range(len(ts))])
+    assert np.abs(streamed[:, 0] - (streamed[:, 1] - 2*std)).max() < 1e-6
+    assert np.abs(streamed - batch).max() < 1e-6
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+import pytest
+import price_database
+
+
+def old_database(db_file, rows = 1000):
+    #price_data in the old schema, date_time as "%d/%m/%Y %H:%M:%S" strings in local time, as the scraper wrote them
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE price_data (date_time text, currency_pair text, ask_price numeric, bid_price numeric, market_price numeric)")
+    conn.executemany("INSERT INTO price_data VALUES (?, ?, ?, ?, ?)", [
+        (time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(1700000000 + i*300)), "BTC/USD", 100.0 + i, 99.0 + i, 99.5 + i) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def migrated_rows(db_file):
+    conn = price_database.connect_database(db_file)
+    rows = conn.execute("SELECT ts, market_price FROM price_data ORDER BY ts").fetchall()
+    conn.close()
+    return rows
+
+
+def test_migration(workdir):
+    db_file = str(workdir / "pricedata.db")
+    old_database(db_file)
+    price_database.migrate_database(db_file, batch_size = 300)
+    rows = migrated_rows(db_file)
+    assert len(rows) == 1000 and rows[0] == (1700000000, 99.5)
+
+
+def test_swap_is_atomic(workdir, monkeypatch):
+    db_file = str(workdir / "pricedata.db")
+    old_database(db_file)
+    create_tables = price_database.create_tables
+
+    def failing_create_tables(c, table = "price_data"):
+        #crash inside the swap, after the old table was dropped and the new one renamed
+        if table == "price_data" and "price_data_v2" not in price_database.get_tables(c):
+            raise RuntimeError("Injected failure")
+        create_tables(c, table)
+
+    monkeypatch.setattr(price_database, "create_tables", failing_create_tables)
+    with pytest.raises(RuntimeError):
+        price_database.migrate_database(db_file)
+    monkeypatch.setattr(price_database, "create_tables", create_tables)
+    conn = sqlite3.connect(db_file)
+    assert "date_time" in price_database.get_columns(conn.cursor()) #rolled back to the old table
+    conn.close()
+    price_database.migrate_database(db_file)
+    assert len(migrated_rows(db_file)) == 1000
+
+
+def test_resume_after_unfinished_swap(workdir):
+    #a database left by the earlier non-transactional swap: every row in price_data_v2 and no price_data
+    db_file = str(workdir / "pricedata.db")
+    old_database(db_file)
+    conn = sqlite3.connect(db_file)
+    price_database.create_tables(conn.cursor(), "price_data_v2")
+    conn.execute("INSERT INTO price_data_v2 SELECT " + price_database.date_time_to_ts + ", currency_pair, ask_price, bid_price, market_price FROM price_data")
+    conn.commit()
+    conn.execute("DROP TABLE price_data")
+    conn.close()
+    price_database.migrate_database(db_file)
+    assert len(migrated_rows(db_file)) == 1000
@@ -0,0 +1,43 @@
+import os
+import pytest
+import price_database
+from indicators import SMA, Bollinger, EMA
+from rolling_window import PriceFeed
+from price_ring import RingPublisher, RingFeed
+
+
+def windows():
+    return [SMA(120), Bollinger(300, 2), EMA(60)]
+
+
+def values(feed_windows):
+    sma, bollinger, ema = feed_windows
+    return [sma.count, sma.value(), bollinger.count] + list(bollinger.bands()) + [ema.count, ema.value()]
+
+
+def test_ring_feed_matches_database_feed(price_db):
+    prefix = "crypto_trader_test_" + str(os.getpid())
+    conn = price_database.connect_database(price_db)
+    c = conn.cursor()
+    rows = c.execute("SELECT ts, ask_price, bid_price, market_price FROM price_data ORDER BY ts").fetchall()
+    publisher = RingPublisher(64, prefix) #smaller than one window, so the first update reads the database
+    try:
+        database_windows = windows()
+        ring_windows = windows()
+        database_feed = PriceFeed(c, "BTC/USD", database_windows)
+        ring_feed = RingFeed(c, "BTC/USD", ring_windows, prefix)
+        for i in range(0, len(rows), 5):
+            publisher.publish([(ts, "BTC/USD", ask, bid, mid) for ts, ask, bid, mid in rows[i:i + 5]])
+            if 300 <= i < 400:
+                continue #the trader pauses while more rows than the ring holds are published
+            if i == 450:
+                publisher.close() #the scraper restarts with a new ring
+            now = rows[min(i + 4, len(rows) - 1)][0]
+            database_feed.update(now)
+            ring_feed.update(now)
+            assert ring_feed.rows_seen == database_feed.rows_seen
+            assert values(ring_windows) == pytest.approx(values(database_windows))
+        assert ring_feed.ring_rows > ring_feed.database_rows
+    finally:
+        publisher.close()
+        conn.close()
@@ -0,0 +1,85 @@
+import sqlite3
+import ccxt
+import pytest
+from request_scheduler import RequestScheduler, TokenBucket
+from simulated_exchange import SimulatedExchange, FlakyExchange, VirtualClock
+
+
+@pytest.fixture
+def exchange(price_db):
+    last = sqlite3.connect(price_db).execute("SELECT MAX(ts) FROM price_data").fetchone()[0]
+    clock = VirtualClock(last)
+    return SimulatedExchange(clock, ["BTC/USD"], {"USD": 10000.0}, price_db)
+
+
+def flaky(exchange, error_rate, errors = None, latency = 0):
+    #latency and backoff advance the virtual clock instead of sleeping
+    return FlakyExchange(exchange, latency = latency, error_rate = error_rate, errors = errors, seed = 1, sleep = exchange.clock.sleep)
+
+
+def test_network_errors_are_retried(exchange):
+    failing = flaky(exchange, 0.5, [ccxt.NetworkError, ccxt.RequestTimeout, ccxt.RateLimitExceeded])
+    scheduler = RequestScheduler(failing, max_retries = 20, deadline = 600, clock = exchange.clock)
+    for i in range(50):
+        assert scheduler.fetch_ticker("BTC/USD")['symbol'] == "BTC/USD"
+    assert failing.injected > 10
+    assert scheduler.retries == failing.injected
+    assert scheduler.failures == 0
+
+
+def test_gives_up_after_max_retries(exchange):
+    failing = flaky(exchange, 1.0)
+    scheduler = RequestScheduler(failing, max_retries = 3, base_delay = 0.5, max_delay = 8, clock = exchange.clock)
+    started = exchange.clock.monotonic()
+    with pytest.raises(ccxt.NetworkError):
+        scheduler.fetch_balance()
+    assert failing.calls == 4 #the first attempt and 3 retries
+    assert scheduler.retries == 3 and scheduler.failures == 1
+    assert exchange.clock.monotonic() - started <= 0.5 + 1 + 2 #each backoff is at most base_delay*2**attempt
+
+
+def test_deadline_stops_retries(exchange):
+    failing = flaky(exchange, 1.0, latency = 1)
+    scheduler = RequestScheduler(failing, max_retries = 100, base_delay = 2, max_delay = 2, deadline = 10, clock = exchange.clock)
+    started = exchange.clock.monotonic()
+    with pytest.raises(ccxt.NetworkError):
+        scheduler.fetch_ticker("BTC/USD")
+    assert failing.calls < 100
+    assert exchange.clock.monotonic() - started < 10 + 1 #a retry is only started if its backoff ends before the deadline
+
+
+def test_orders_and_exchange_errors_are_not_retried(exchange):
+    failing = flaky(exchange, 1.0)
+    scheduler = RequestScheduler(failing, clock = exchange.clock)
+    with pytest.raises(ccxt.NetworkError):
+        scheduler.create_limit_buy_order("BTC/USD", 0.01, 1.0) #it may have been placed, sending it again could buy twice
+    assert failing.calls == 1
+
+    rejecting = flaky(exchange, 1.0, [ccxt.InsufficientFunds])
+    scheduler = RequestScheduler(rejecting, clock = exchange.clock)
+    with pytest.raises(ccxt.InsufficientFunds):
+        scheduler.fetch_balance()
+    assert rejecting.calls == 1 and scheduler.retries == 0
+
+
+def test_token_bucket_paces_requests(exchange):
+    clock = exchange.clock
+    scheduler = RequestScheduler(flaky(exchange, 0.0), limits = {'public': (10, 15), 'private': (5, 5)}, deadline = 600, clock = clock)
+    started = clock.monotonic()
+    for i in range(115):
+        scheduler.fetch_ticker("BTC/USD")
+    assert clock.monotonic() - started == pytest.approx(10, abs = 0.01) #the burst of 15 goes straight out, then 10 per second
+    started = clock.monotonic()
+    for i in range(10):
+        scheduler.fetch_balance()
+    assert clock.monotonic() - started == pytest.approx(1, abs = 0.01) #the private bucket is separate and still full
+
+
+def test_token_bucket_deadline():
+    clock = VirtualClock(0)
+    bucket = TokenBucket(1, 2, clock)
+    assert bucket.acquire() and bucket.acquire()
+    assert bucket.acquire(deadline = 0.5) == False
+    assert clock.monotonic() == 0
+    assert bucket.acquire(deadline = 1.5)
+    assert clock.monotonic() == pytest.approx(1)
@@ -0,0 +1,34 @@
+import sqlite3
+import numpy as np
+import pytest
+import retention
+
+
+def archived_ts(archive_dir):
+    data = retention.read_archive(archive_dir, "BTC/USD")
+    return data["ts"]
+
+
+def test_interrupted_archive_is_not_duplicated(price_db, workdir, monkeypatch):
+    total = sqlite3.connect(price_db).execute("SELECT COUNT(*) FROM price_data").fetchone()[0]
+    archive_dir = str(workdir / "archive")
+    write_segment = retention.write_segment
+    written = []
+
+    def failing_write_segment(path, data, resolution = 0):
+        #crash after the third segment is written, before its rows are deleted
+        write_segment(path, data, resolution)
+        written.append(path)
+        if len(written) == 3:
+            raise RuntimeError("Injected failure")
+
+    monkeypatch.setattr(retention, "write_segment", failing_write_segment)
+    with pytest.raises(RuntimeError):
+        retention.run_retention(price_db, archive_dir, archive_age = 0, now = 1700000000 + 86400)
+    monkeypatch.setattr(retention, "write_segment", write_segment)
+    retention.run_retention(price_db, archive_dir, archive_age = 0, now = 1700000000 + 86400)
+
+    ts = archived_ts(archive_dir)
+    assert len(ts) == total
+    assert len(np.unique(ts)) == total
+    assert sqlite3.connect(price_db).execute("SELECT COUNT(*) FROM price_data").fetchone()[0] == 0
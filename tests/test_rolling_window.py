@@ -0,0 +1,18 @@
+import price_database
+from rolling_window import RollingWindow, PriceFeed
+
+
+def test_rows_seen_across_a_gap(price_db):
+    conn = price_database.connect_database(price_db)
+    c = conn.cursor()
+    ts = [row[0] for row in c.execute("SELECT ts FROM price_data ORDER BY ts")]
+    window = RollingWindow(60)
+    price_feed = PriceFeed(c, "BTC/USD", [window])
+    for now in [ts[50], ts[51], ts[400], ts[-1]]:
+        #the trader is stopped between the second and third update, far longer than the window
+        price_feed.update(now)
+        assert price_feed.rows_seen == len([x for x in ts if x <= now])
+        prices = [row[0] for row in c.execute("SELECT market_price FROM price_data WHERE ts >= ? AND ts <= ?", (now - 3600, now))]
+        assert window.count == len(prices)
+        assert abs(window.average() - sum(prices)/len(prices)) < 1e-9
+    conn.close()
@@ -0,0 +1,28 @@
+import logging
+import sqlite3
+import ccxt
+import pytest
+from sma_crossover_trader import SMACrossoverStrategy
+from order_manager import OrderManager
+from simulated_exchange import SimulatedExchange, VirtualClock
+
+
+@pytest.mark.parametrize("error", [ccxt.NetworkError, ccxt.ExchangeError, RuntimeError])
+def test_failed_sell_is_logged(price_db, caplog, error):
+    last = sqlite3.connect(price_db).execute("SELECT MAX(ts) FROM price_data").fetchone()[0]
+    clock = VirtualClock(last)
+    exchange = SimulatedExchange(clock, ["BTC/USD"], {"USD": 0.0, "BTC": 1.0}, price_db)
+    def rejected(symbol, amount, price):
+        raise error("Order rejected")
+    exchange.create_limit_sell_order = rejected
+
+    #MA2 has just crossed above MA1 while holding a position: a sell signal
+    strategy = SMACrossoverStrategy(120, 300, 0.9)
+    strategy.sufficient_data = True
+    strategy.interval_average_1 = 100.0
+    strategy.interval_average_2 = 101.0
+    strategy.last_average_higher = "MA1"
+    with caplog.at_level(logging.ERROR):
+        strategy.trade(exchange, OrderManager(exchange, clock = clock), 10000)
+    assert strategy.order_pending == False
+    assert any(x.getMessage().startswith("create_limit_sell_order") and x.getMessage().endswith("Order rejected") for x in caplog.records)
@@ -0,0 +1,25 @@
+import sqlite3
+import price_database
+from mean_reversion_trader import MeanReversionStrategy
+from order_manager import OrderManager
+from rolling_window import PriceFeed
+from simulated_exchange import SimulatedExchange, VirtualClock
+
+
+def test_bollinger_trade_uses_the_checked_values(price_db):
+    #strategy_runtime.py runs trade() in a worker thread while the event loop keeps updating the shared windows
+    conn = price_database.connect_database(price_db)
+    now = conn.execute("SELECT MAX(ts) FROM price_data WHERE ts < 1699960000").fetchone()[0] #a full window before the outage in the test data
+    strategy = MeanReversionStrategy(300, 0.98, 1.02, 0.95, 1, mode = "bollinger", band_width = 2)
+    price_feed = PriceFeed(conn.cursor(), strategy.currency_pair, strategy.windows)
+    price_feed.update(now)
+    strategy.check_data(price_feed.rows_seen, 5)
+    assert strategy.sufficient_data
+
+    #the window empties after the data check, e.g. evicted by another strategy's cycle
+    strategy.price_window.evict(now + 10**6)
+    clock = VirtualClock(now)
+    exchange = SimulatedExchange(clock, [strategy.currency_pair], {"USD": 10000.0}, price_db, price_scale = 0.9) #10% below the average
+    strategy.trade(exchange, OrderManager(exchange, clock = clock), 10000)
+    assert strategy.buys == 1 or strategy.order_pending
+    conn.close()
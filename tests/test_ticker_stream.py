@@ -0,0 +1,41 @@
+import asyncio
+import socket
+import price_database
+from ticker_stream import TickerStream, serve_recorded_ticks
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def stream_recorded_ticks(db_file, expected, timeout = 20):
+    #replays the database as fast as possible and streams it until every row arrived and the feed was reconnected once
+    port = free_port()
+    server = asyncio.ensure_future(serve_recorded_ticks(db_file, port = port, speed = 0))
+    received = []
+    stream = TickerStream(["BTC/USD"], received.extend, url = "ws://127.0.0.1:" + str(port), sample_interval = 10, batch_interval = 0.05)
+    client = asyncio.ensure_future(stream.run())
+    try:
+        waited = 0
+        #the replay closes the connection once it has sent every row, the stream reconnects and must not store the replayed rows again
+        while (len(received) < expected or stream.connections < 2) and waited < timeout:
+            await asyncio.sleep(0.05)
+            waited = waited + 0.05
+        await asyncio.sleep(0.2)
+        stream.stop()
+        await asyncio.wait_for(client, 5)
+    finally:
+        client.cancel()
+        server.cancel()
+    return received, stream
+
+
+def test_streams_recorded_ticks(price_db):
+    conn = price_database.connect_database(price_db)
+    rows = conn.execute("SELECT ts, currency_pair, ask_price, bid_price, market_price FROM price_data ORDER BY ts").fetchall()
+    conn.close()
+    received, stream = asyncio.run(stream_recorded_ticks(price_db, len(rows)))
+    assert stream.connections >= 2
+    assert received == rows
@@ -0,0 +1,74 @@
+import sqlite3
+import mean_reversion_trader
+import sma_crossover_trader
+from order_manager import OrderManager
+from simulated_exchange import SimulatedExchange, VirtualClock, SimulationFinished
+from trader_state import StateStore
+
+
+#live_trader arguments, the strategy takes the same ones without the SMA trader's intervals
+traders = [
+    (mean_reversion_trader, mean_reversion_trader.MeanReversionStrategy, [300, 0.98, 1.02, 0.95, 1], [300, 0.98, 1.02, 0.95, 1]),
+    (sma_crossover_trader, sma_crossover_trader.SMACrossoverStrategy, [300, 120, 300, 0.9], [120, 300, 0.9]),
+]
+
+def run_trader(trader, strategy_class, arguments, exchange, state_file, monkeypatch):
+    #runs live_trader until the exchange's clock reaches its end, returns the strategy it ran
+    strategies = []
+    with monkeypatch.context() as patch:
+        patch.setattr(trader, strategy_class.__name__, lambda *arguments: strategies.append(strategy_class(*arguments)) or strategies[-1])
+        try:
+            trader.live_trader(*arguments, coin = "BTC", exchange = exchange, clock = exchange.clock, state_file = state_file, equity_dir = None, price_ring = False)
+        except SimulationFinished:
+            pass
+    return strategies[0]
+
+
+def test_restart_after_window_went_thin(price_db, workdir, monkeypatch):
+    #a checkpoint written with a full window must not let the strategy trade on averages it never worked out after a long outage
+    first, last = sqlite3.connect(price_db).execute("SELECT MIN(ts), MAX(ts) FROM price_data").fetchone()
+    state_file = str(workdir / "trader_state.db")
+    for trader, strategy_class, arguments, strategy_arguments in traders:
+        strategy = run_trader(trader, strategy_class, arguments, SimulatedExchange(VirtualClock(first, last), ["BTC/USD"], None, price_db), state_file, monkeypatch)
+        assert strategy.equity_curve.totals['cycles'] > 0 #the window filled and it traded
+        restart = last + 86400
+        exchange = SimulatedExchange(VirtualClock(restart, restart + 3600), ["BTC/USD"], None, price_db)
+        strategy = run_trader(trader, strategy_class, arguments, exchange, state_file, monkeypatch)
+        assert strategy.sufficient_data == False
+        assert strategy.equity_curve.totals['cycles'] == 0
+        assert len(exchange.orders) == 0
+
+
+def test_restart_with_open_order(price_db, workdir, monkeypatch):
+    #the checkpoint holds an order that is still open, the restarted trader must keep cycling while it waits on it
+    last = sqlite3.connect(price_db).execute("SELECT MAX(ts) FROM price_data").fetchone()[0]
+    start = last - 12*3600 #before the outage in the test data, so the window is full
+    state_file = str(workdir / "trader_state.db")
+    for trader, strategy_class, arguments, strategy_arguments in traders:
+        exchange = SimulatedExchange(VirtualClock(start, start + 3600), ["BTC/USD"], None, price_db)
+        strategy = strategy_class(*strategy_arguments)
+        orders = OrderManager(exchange, clock = exchange.clock)
+        strategy.last_order_id = orders.place(strategy, 'buy', strategy.currency_pair, 0.01, 1.0)['id'] #far below the market, stays open
+        strategy.order_pending = True
+        strategy.order_pending_type = "BUY"
+        store = StateStore(state_file)
+        store.save(strategy, orders)
+        store.close()
+
+        strategy = run_trader(trader, strategy_class, arguments, exchange, state_file, monkeypatch)
+        assert strategy.equity_curve.totals['cycles'] >= 12 #every 5 minute cycle of the hour
+        assert strategy.order_pending == False #cancelled once it was open for 30 minutes
+        assert strategy.market_price is not None
+
+
+def test_checkpoint_restores_counters(price_db, workdir):
+    strategy = mean_reversion_trader.MeanReversionStrategy(300, 0.98, 1.02, 0.95, 1)
+    strategy.buys = 3
+    strategy.sufficient_data = True
+    store = StateStore(str(workdir / "trader_state.db"))
+    store.save(strategy, None)
+    restored = mean_reversion_trader.MeanReversionStrategy(300, 0.98, 1.02, 0.95, 1)
+    assert store.restore(restored, None)
+    assert restored.buys == 3
+    assert restored.sufficient_data == False #worked out by check_data() every cycle
+    store.close()
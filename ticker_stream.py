@@ -0,0 +1,180 @@
+import asyncio
+import sqlite3
+import logging
+import json
+import time
+import sys
+from datetime import datetime
+import websockets
+
+
+coinbase_feed_url = "wss://ws-feed.exchange.coinbase.com"
+
+def to_product_id(currency_pair):
+    #"BTC/USD" -> "BTC-USD"
+    return currency_pair.replace("/", "-")
+
+
+def to_currency_pair(product_id):
+    return product_id.replace("-", "/")
+
+
+def parse_ticker(message):
+    '''
+    Turns a ticker message from the feed into a price_data row.
+
+    Parameters:
+        message (dict): decoded feed message
+    Returns:
+        (ts, currency_pair, ask_price, bid_price, market_price), or None if the message is not a usable ticker
+    '''
+    if message.get("type") != "ticker":
+        return None
+    try:
+        best_ask = float(message["best_ask"])
+        best_bid = float(message["best_bid"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    try:
+        ts = int(datetime.fromisoformat(message["time"].replace("Z", "+00:00")).timestamp())
+    except (KeyError, AttributeError, ValueError):
+        ts = int(time.time())
+    return (ts, to_currency_pair(message["product_id"]), best_ask, best_bid, (best_ask + best_bid)/2)
+
+
+class TickerStream:
+    '''
+    Holds one websocket connection to the ticker feed for all subscribed pairs, reconnecting and resubscribing with exponential backoff
+    when the connection drops. Rows are sampled to at most one per pair every sample_interval seconds and handed to on_batch in batches.
+
+    Parameters:
+        currency_pairs (list): currency pairs to subscribe to
+        on_batch (function): called with a list of price_data rows, e.g. PriceWriter.add
+        url (str, optional): websocket feed url. Defaults to the Coinbase Exchange feed.
+        sample_interval (float, optional): minimum seconds between stored rows for one pair. Defaults to 10.
+        batch_interval (float, optional): seconds between hand-offs to on_batch. Defaults to 1.
+        max_backoff (float, optional): longest wait between reconnect attempts, in seconds. Defaults to 60.
+    '''
+
+    def __init__(self, currency_pairs, on_batch, url = coinbase_feed_url, sample_interval = 10, batch_interval = 1, max_backoff = 60):
+        self.currency_pairs = currency_pairs
+        self.on_batch = on_batch
+        self.url = url
+        self.sample_interval = sample_interval
+        self.batch_interval = batch_interval
+        self.max_backoff = max_backoff
+        self.next_sample = {}
+        self.buffer = []
+        self.paused = False
+        self.stopped = False
+        self.connections = 0 #number of successful (re)connections
+
+    def handle_message(self, message):
+        entry = parse_ticker(message)
+        if entry is None or self.paused:
+            return
+        ts, currency_pair = entry[0], entry[1]
+        if ts >= self.next_sample.get(currency_pair, 0):
+            self.next_sample[currency_pair] = ts + self.sample_interval
+            self.buffer.append(entry)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            entries = self.buffer
+            self.buffer = []
+            self.on_batch(entries)
+
+    async def flush_periodically(self):
+        while not self.stopped:
+            await asyncio.sleep(self.batch_interval)
+            self.flush()
+
+    async def listen(self):
+        backoff = 1
+        while not self.stopped:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    await websocket.send(json.dumps({
+                        "type": "subscribe",
+                        "product_ids": [to_product_id(x) for x in self.currency_pairs],
+                        "channels": ["ticker"]
+                    }))
+                    self.connections = self.connections + 1
+                    logging.debug("Subscribed to ticker feed for " + ", ".join(self.currency_pairs))
+                    backoff = 1
+                    async for raw_message in websocket:
+                        self.handle_message(json.loads(raw_message))
+                        if self.stopped:
+                            break
+            except (OSError, asyncio.TimeoutError, websockets.ConnectionClosed, websockets.InvalidHandshake, json.JSONDecodeError) as e:
+                logging.error("Ticker feed connection lost: " + str(e))
+            if not self.stopped:
+                logging.debug("Reconnecting to ticker feed in " + str(backoff) + " seconds")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff*2, self.max_backoff)
+
+    async def run(self):
+        '''
+        Streams tickers until stop() is called, then hands over any rows still buffered.
+        '''
+        flusher = asyncio.ensure_future(self.flush_periodically())
+        try:
+            await self.listen()
+        finally:
+            flusher.cancel()
+            self.flush()
+
+    def stop(self):
+        self.stopped = True
+
+
+async def replay_feed(websocket, db_file = "pricedata.db", speed = 60.0):
+    #serves one client: waits for its subscribe message, then replays the recorded rows for the requested pairs as ticker messages
+    subscription = json.loads(await websocket.recv())
+    currency_pairs = [to_currency_pair(x) for x in subscription.get("product_ids", [])]
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute(
+        "SELECT ts, currency_pair, ask_price, bid_price FROM price_data WHERE currency_pair IN ({placeholders}) ORDER BY ts".format(
+            placeholders = ", ".join("?"*len(currency_pairs))), currency_pairs).fetchall()
+    conn.close()
+    last_ts = None
+    try:
+        for ts, currency_pair, best_ask, best_bid in rows:
+            if last_ts is not None and speed > 0:
+                await asyncio.sleep((ts - last_ts)/speed)
+            last_ts = ts
+            await websocket.send(json.dumps({
+                "type": "ticker",
+                "product_id": to_product_id(currency_pair),
+                "best_ask": str(best_ask),
+                "best_bid": str(best_bid),
+                "price": str((best_ask + best_bid)/2),
+                "time": datetime.utcfromtimestamp(ts).isoformat() + "Z"
+            }))
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def serve_recorded_ticks(db_file = "pricedata.db", host = "127.0.0.1", port = 8765, speed = 60.0):
+    '''
+    Local stand-in for the ticker feed that replays recorded price_data rows, for testing streaming ingestion without network access.
+
+    Parameters:
+        db_file (str, optional): database to replay. Defaults to "pricedata.db".
+        host (str, optional): address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): port to listen on. Defaults to 8765.
+        speed (float, optional): replay speed relative to the recorded timestamps, 0 replays as fast as possible. Defaults to 60.
+    Returns:
+        None, serves until cancelled
+    '''
+    async with websockets.serve(lambda websocket: replay_feed(websocket, db_file, speed), host, port):
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    #python3 ticker_stream.py recorded.db 8765 60
+    asyncio.run(serve_recorded_ticks(
+        db_file = sys.argv[1],
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765,
+        speed = float(sys.argv[3]) if len(sys.argv) > 3 else 60.0
+    ))
@@ -0,0 +1,88 @@
+import sqlite3
+import logging
+import json
+import time
+
+
+class StateStore:
+    '''
+    Checkpoints the state of each strategy instance to an sqlite database at the end of every cycle, so a restarted trader picks up
+    where it stopped: its position, pending order and win/loss counters. The moving average windows are not stored, the PriceFeed
+    rebuilds them from price_data with one query on its first update, so a restarted strategy can trade on its first cycle.
+
+    Parameters:
+        db_file (str, optional): path to the sqlite state database. Defaults to "trader_state.db".
+    '''
+
+    def __init__(self, db_file = "trader_state.db"):
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS trader_state (key TEXT PRIMARY KEY, state TEXT NOT NULL, updated INTEGER NOT NULL)")
+        self.conn.commit()
+
+    def save(self, strategy, orders):
+        '''
+        Writes the strategy's checkpointed attributes, and its pending order if it has one, in one transaction.
+
+        Parameters:
+            strategy: strategy instance with key and checkpointed attributes
+            orders (OrderManager): the order manager tracking the strategy's orders
+        Returns:
+            None
+        '''
+        state = {name: getattr(strategy, name) for name in strategy.checkpointed if hasattr(strategy, name)}
+        if strategy.order_pending:
+            state['order'] = orders.tracked(strategy.last_order_id)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO trader_state (key, state, updated) VALUES (?, ?, ?)", (strategy.key, json.dumps(state), int(time.time())))
+
+    def restore(self, strategy, orders):
+        '''
+        Loads the strategy's last checkpoint and resumes tracking its pending order.
+
+        Parameters:
+            strategy: strategy instance with key and checkpointed attributes
+            orders (OrderManager): the order manager that will track the strategy's orders
+        Returns:
+            True if a checkpoint was restored
+        '''
+        row = self.conn.execute("SELECT state, updated FROM trader_state WHERE key = ?", (strategy.key,)).fetchone()
+        restored = row is not None
+        if restored:
+            state = json.loads(row[0])
+            for name in strategy.checkpointed:
+                if name in state:
+                    setattr(strategy, name, state[name])
+
+            #the next poll picks up fills or cancels that happened while the trader was down, the timeout still counts from when it was placed
+            if strategy.order_pending and state.get('order') is not None:
+                orders.track(strategy, state['order'])
+            elif strategy.order_pending:
+                logging.warning(strategy.key + ": checkpoint has a pending order without its details, order " + str(strategy.last_order_id) + " is no longer followed")
+                strategy.order_pending = False
+                strategy.last_order_id = ""
+                strategy.order_pending_type = ""
+            print("Restored state from", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[1])))
+            logging.info(strategy.key + ": restored state from " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[1])) + ": " + row[0])
+        return restored
+
+    def reconcile(self, orders, currency_pair):
+        '''
+        Warns about open orders on the exchange that no restored checkpoint accounts for, e.g. an order placed just before a crash.
+        They are left alone since the account may be shared with other traders. Call it once every strategy has been restored.
+
+        Parameters:
+            orders (OrderManager): the order manager tracking the restored orders
+            currency_pair (str): the currency pair to check, e.g. "BTC/USD"
+        Returns:
+            list of the untracked open orders
+        '''
+        untracked = orders.untracked(currency_pair)
+        for order in untracked:
+            print("Untracked open order on the exchange:", order['id'], order.get('side'), order.get('amount'), "@", order.get('price'))
+            logging.warning("Open " + currency_pair + " order " + str(order['id']) + " " + str(order.get('side')) + " " + str(order.get('amount')) + " @ " + str(order.get('price')) + " is not tracked by any checkpoint")
+        return untracked
+
+    def close(self):
+        self.conn.close()